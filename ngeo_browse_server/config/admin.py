@@ -29,7 +29,7 @@
 
 from django.contrib import admin
 from ngeo_browse_server.config.models import (
-    BrowseLayer, RelatedDataset, BrowseReport, BrowseIdentifier, 
+    BrowseLayer, RelatedDataset, BrowseReport, BrowseIdentifier, BrowseDigest,
     Browse, RectifiedBrowse, FootprintBrowse, RegularGridBrowse, 
     RegularGridCoordList, VerticalCurtainBrowse, ModelInGeotiffBrowse
 )
@@ -38,6 +38,7 @@ admin.site.register(BrowseLayer)
 admin.site.register(RelatedDataset)
 admin.site.register(BrowseReport)
 admin.site.register(BrowseIdentifier)
+admin.site.register(BrowseDigest)
 admin.site.register(Browse)
 admin.site.register(RectifiedBrowse)
 admin.site.register(FootprintBrowse)
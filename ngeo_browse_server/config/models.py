@@ -225,6 +225,22 @@ class BrowseIdentifier(models.Model):
         unique_together = (("value", "browse_layer"),)
 
 
+class BrowseDigest(models.Model):
+    """Fingerprint of the browse image and its georeference parameters as
+    ingested. Used to detect browses that are sent again unchanged.
+
+    """
+    value = models.CharField("Digest", max_length=64)
+    browse = models.OneToOneField(Browse, related_name="digest")
+
+    def __unicode__(self):
+        return "Browse digest '%s'" % self.value
+
+    class Meta:
+        verbose_name = "Browse digest"
+        verbose_name_plural = "Browse digests"
+
+
 class RectifiedBrowse(Browse):
     """Rectified Browses with given corner coordinates.
 
@@ -170,7 +170,10 @@ class BrowseReportReport(Report):
                     continue
                 elif self.begin and self.begin > date:
                     continue
-                yield BrowseReportRecord(*items)
+                # additional fields, e.g. the stage timings, are ignored
+                yield BrowseReportRecord(
+                    *items[:len(BrowseReportRecord._fields)]
+                )
 
     def get_additional_keys(self, record):
         return ()
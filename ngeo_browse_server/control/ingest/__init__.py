@@ -28,34 +28,40 @@
 #-------------------------------------------------------------------------------
 
 import sys
-from os import remove, makedirs, rmdir
+from os import remove, makedirs, rmdir, rename
 from os.path import (
     exists, dirname, join, isdir, samefile, commonprefix, abspath, relpath,
-    basename
+    basename, getsize
 )
 import shutil
+from itertools import izip
+from functools import partial
 from numpy import arange
 import logging
 import traceback
 from datetime import datetime
 import string
 import uuid
-from urllib2 import urlopen, URLError, HTTPError
+import hashlib
 
 from django.conf import settings
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.validators import URLValidator
+from django.contrib.gis.geos import GEOSGeometry
 from django.db import transaction
 from django.template.loader import render_to_string
 from eoxserver.core.system import System
-from eoxserver.processing.preprocessing import WMSPreProcessor, RGB, RGBA, ORIG_BANDS
+from eoxserver.processing.preprocessing import (
+    WMSPreProcessor, PreProcessResult, RGB, RGBA, ORIG_BANDS
+)
 from eoxserver.processing.preprocessing.format import get_format_selection
 from eoxserver.processing.preprocessing.georeference import Extent, GCPList
 from eoxserver.resources.coverages.crss import fromShortCode, hasSwappedAxes
 from eoxserver.resources.coverages.models import NCNameValidator
 from eoxserver.processing.preprocessing.exceptions import GCPTransformException
-from osgeo import gdal
+from osgeo import gdal, osr
 
+from ngeo_browse_server.initialization import initialize
 from ngeo_browse_server.config import get_ngeo_config, safe_get
 from ngeo_browse_server.config import models
 from ngeo_browse_server.config.browsereport.decoding import (
@@ -64,28 +70,49 @@ from ngeo_browse_server.config.browsereport.decoding import (
 from ngeo_browse_server.config.browsereport import data
 from ngeo_browse_server.control.ingest.result import (
     IngestBrowseReportResult, IngestBrowseResult, IngestBrowseReplaceResult,
-    IngestBrowseSkipResult, IngestBrowseFailureResult
+    IngestBrowseSkipResult, IngestBrowseDuplicateResult,
+    IngestBrowseFailureResult
 )
 from ngeo_browse_server.control.ingest.config import (
     get_project_relative_path, get_storage_path, get_optimized_path,
-    get_format_config, get_optimization_config, get_ingest_config
+    get_format_config, get_optimization_config, get_ingest_config,
+    get_download_config
 )
 from ngeo_browse_server.filetransaction import FileTransaction
 from ngeo_browse_server.control.ingest.config import (
     get_success_dir, get_failure_dir
 )
 from ngeo_browse_server.control.ingest.exceptions import IngestionException
+from ngeo_browse_server.control.ingest.pool import PreprocessingPool
+from ngeo_browse_server.control.ingest.batch import CommitBatch
+from ngeo_browse_server.control.ingest.download import download
+from ngeo_browse_server.control.ingest.prefetch import Prefetcher
+from ngeo_browse_server.control.ingest.timing import (
+    StageTimer, NullTimer, PREPROCESSING_STAGES
+)
+from ngeo_browse_server.control.ingest.gcporders import (
+    get_gcp_orders, record_gcp_attempts
+)
+from ngeo_browse_server.control.ingest.checkpoint import (
+    open_checkpoint, get_finished_browses, close_checkpoint,
+    release_checkpoint, save_browse as save_checkpoint_browse
+)
+from ngeo_browse_server.metrics import record, increment
 from ngeo_browse_server.mapcache import models as mapcache_models
-from ngeo_browse_server.mapcache.tasks import CRS_BOUNDS, seed_mapcache
-from ngeo_browse_server.mapcache.config import get_mapcache_seed_config
+from ngeo_browse_server.mapcache.tasks import CRS_BOUNDS, schedule_seed_areas
+from ngeo_browse_server.mapcache.config import get_seed_queue_config
+from ngeo_browse_server.mapcache.grids import get_grid, level_resolution
 from ngeo_browse_server.config.browsereport.serialization import (
     serialize_browse_report
 )
 from ngeo_browse_server.control.queries import (
     get_existing_browse, create_browse_report, create_browse, remove_browse
 )
+from ngeo_browse_server.control.ingest.preprocessing.thinning import (
+    thin_grid, thin_by_error, max_residual
+)
 from ngeo_browse_server.control.ingest.preprocessing.preprocessor import (
-    NGEOPreProcessor
+    NGEOPreProcessor, LazyGCPList, reduced_size
 )
 
 
@@ -96,13 +123,15 @@ report_logger = logging.getLogger("ngEO-ingest")
 # main functions
 #===============================================================================
 
-def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=None):
+def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=None,
+                         progress=None):
     """ Ingests a browse report. reraise_exceptions if errors shall be handled
-    externally
+    externally. The optional `progress` callable is called with the number of
+    handled and total browses after each browse.
     """
 
     # initialize the EOxServer system/registry/configuration
-    System.init()
+    initialize()
 
     try:
         # get the according browse layer
@@ -126,6 +155,8 @@ def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=Non
 
     logger.debug("Using CRS '%s' ('%s')." % (crs, browse_layer.grid))
 
+    ingest_config = get_ingest_config(config)
+
     # create the required preprocessor/format selection
     format_selection = get_format_selection("GTiff",
                                             **get_format_config(config))
@@ -160,14 +191,22 @@ def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=Non
 
             params["bands"] = bands
 
+        # warp to the resolutions of the zoom levels of the layer
+        if ingest_config["snap_to_grid"]:
+            params["tile_grid"] = get_grid(browse_layer.grid)
+            params["map_levels"] = (browse_layer.lowest_map_level,
+                                    browse_layer.highest_map_level)
+
+        # skip the GCP transform orders which failed repeatedly before
+        if ingest_config["gcp_order_cache"]:
+            params["gcp_orders"] = get_gcp_orders(browse_layer)
+
         preprocessor = NGEOPreProcessor(format_selection, crs=crs, **params)
     else:
         preprocessor = None # TODO: CopyPreprocessor
 
     report_result = IngestBrowseReportResult()
-
-    succeded = []
-    failed = []
+    report_result.report_timings = ingest_config["report_timings"]
 
     timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
     browse_dirname = _valid_path("%s_%s_%s_%s" % (
@@ -178,83 +217,260 @@ def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=Non
     success_dir = join(get_success_dir(config), browse_dirname)
     failure_dir = join(get_failure_dir(config), browse_dirname)
 
-    if exists(success_dir):
-        logger.warn("Success directory '%s' already exists.")
-    else:
-        makedirs(success_dir)
-    if exists(failure_dir):
-        logger.warn("Failure directory '%s' already exists.")
-    else:
-        makedirs(failure_dir)
+    # resume the ingestion of a browse report that was interrupted. The
+    # results of the browses handled before are reported again and their
+    # result browse reports are written to the directories of the first run.
+    checkpoint = None
+    finished = {}
+    if ingest_config["checkpoint"]:
+        checkpoint = open_checkpoint(parsed_browse_report, success_dir,
+                                     failure_dir,
+                                     ingest_config["checkpoint_timeout"])
+        success_dir = checkpoint.success_dir
+        failure_dir = checkpoint.failure_dir
+        finished = get_finished_browses(checkpoint, parsed_browse_report)
+        if finished:
+            logger.info("Skipping %d of %d browses handled before."
+                        % (len(finished), len(parsed_browse_report)))
+
+    pool = None
+    try:
+        if exists(success_dir):
+            if not finished:
+                logger.warn("Success directory '%s' already exists.")
+        else:
+            makedirs(success_dir)
+        if exists(failure_dir):
+            if not finished:
+                logger.warn("Failure directory '%s' already exists.")
+        else:
+            makedirs(failure_dir)
+
+        # validate all browses up front, so that no time is spent on downloading
+        # or preprocessing browses of the report that fail anyway
+        pending_browses = [
+            parsed_browse for index, parsed_browse
+            in enumerate(parsed_browse_report) if index not in finished
+        ]
+        errors = iter(validate_browse_report(pending_browses, config))
+        validation_errors = [
+            None if index in finished else next(errors)
+            for index in range(len(parsed_browse_report))
+        ]
+        valid_browses = [
+            parsed_browse for index, parsed_browse
+            in enumerate(parsed_browse_report)
+            if index not in finished and validation_errors[index] is None
+        ]
+
+        # optionally preprocess the browses ahead in a pool of worker processes,
+        # except the ones which are skipped or duplicates. Registration and seeding
+        # are still done in order.
+        pooled = set()
+        workers = ingest_config["workers"]
+        if preprocessor and workers > 1:
+            pooled_browses = [
+                (index, parsed_browse) for index, parsed_browse
+                in enumerate(parsed_browse_report)
+                if index not in finished and validation_errors[index] is None
+                and not _is_skipped(parsed_browse, browse_report, browse_layer,
+                                    ingest_config, config)
+            ]
+            if len(pooled_browses) > 1:
+                pool = PreprocessingPool(
+                    partial(_preprocess_browse, browse_layer=browse_layer,
+                            preprocessor=preprocessor, config=config),
+                    [parsed_browse for _, parsed_browse in pooled_browses],
+                    workers
+                )
+                # fork the workers before the transactions are opened
+                pool.start()
+                pooled = set(index for index, _ in pooled_browses)
+                preprocessed_results = iter(pool)
+
+        # optionally download remote browse images ahead in the background. The
+        # prefetcher is started with the first request, i.e. after the worker
+        # processes were forked.
+        prefetcher = None
+        urls = [
+            parsed_browse.file_name for parsed_browse in valid_browses
+            if _is_url(parsed_browse.file_name)
+        ]
+        if ingest_config["prefetch"] > 0 and len(urls) > 1:
+            prefetcher = Prefetcher(
+                urls, get_storage_path(config=config), ingest_config["prefetch"],
+                ingest_config["prefetch_budget"], get_download_config(config)
+            )
 
-    # iterate over all browses in the browse report
-    for parsed_browse in parsed_browse_report:
-        # transaction management per browse
+        # areas of the successfully ingested browses to be (un-)seeded with
+        # the next commit
+        pending_seed_areas = []
+        report_timer = StageTimer()
+
+        def schedule_pending_seed_areas():
+            # seed MapCache or queue the seed jobs for the coalesced areas
+            with report_timer.stage("seed"):
+                schedule_seed_areas(browse_layer, pending_seed_areas,
+                                    config=config)
+            del pending_seed_areas[:]
+
+        succeded = []
+        failed = []
+
+        # commit per browse or in batches of browses (group-commit mode). Seed
+        # jobs are queued within the transaction of the browses, MapCache is
+        # seeded directly once they are committed.
+        seed_queue = get_seed_queue_config(config)["enabled"]
+        batch = CommitBatch(
+            size=ingest_config["commit_batch_size"],
+            interval=ingest_config["commit_interval"],
+            before_commit=schedule_pending_seed_areas if seed_queue else None,
+            after_commit=None if seed_queue else schedule_pending_seed_areas
+        )
+
+        # iterate over all browses in the browse report
         with transaction.commit_manually():
             with transaction.commit_manually(using="mapcache"):
                 try:
-                    seed_areas = []
-                    # try ingest a single browse and log success
-                    result = ingest_browse(parsed_browse, browse_report,
-                                           browse_layer, preprocessor, crs,
-                                           success_dir, failure_dir,
-                                           seed_areas, config=config)
-
-                    report_result.add(result)
-                    succeded.append(parsed_browse)
-
-                    # commit here to allow seeding
-                    transaction.commit()
-                    transaction.commit(using="mapcache")
-
-                    logger.info("Committed changes to database.")
-
-                    for minx, miny, maxx, maxy, start_time, end_time in seed_areas:
+                    for index, (parsed_browse, error) in enumerate(
+                            izip(parsed_browse_report, validation_errors)):
+                        if index in finished:
+                            # handled before the ingestion was interrupted
+                            result, seed_areas = finished[index]
+                            report_result.add(result)
+                            if result.success:
+                                succeded.append(parsed_browse)
+                                # the run may have ended after committing
+                                # the browse but before seeding it
+                                if not seed_queue:
+                                    pending_seed_areas.extend(seed_areas)
+                            else:
+                                failed.append(parsed_browse)
+                            continue
+
+                        preprocessed = None
+                        prefetched = None
+                        if index in pooled:
+                            preprocessed = next(preprocessed_results)
+                        if error is None:
+                            if prefetcher and _is_url(parsed_browse.file_name):
+                                prefetched = prefetcher.get(parsed_browse.file_name)
+
+                        gcp_attempts = []
+                        batch.begin()
                         try:
-
-                            # seed MapCache synchronously
-                            # TODO: maybe replace this with an async solution
-                            seed_mapcache(tileset=browse_layer.id,
-                                          grid=browse_layer.grid,
-                                          minx=minx, miny=miny,
-                                          maxx=maxx, maxy=maxy,
-                                          minzoom=browse_layer.lowest_map_level,
-                                          maxzoom=browse_layer.highest_map_level,
-                                          start_time=start_time,
-                                          end_time=end_time,
-                                          delete=False,
-                                          **get_mapcache_seed_config(config))
-                            logger.info("Successfully finished seeding.")
+                            if error is not None:
+                                # handle the input file as if the browse failed
+                                # during the ingestion
+                                _move_to_failure_dir(
+                                    _get_input_filename(parsed_browse, config),
+                                    failure_dir, config
+                                )
+                                raise error
+
+                            seed_areas = []
+                            # try ingest a single browse and log success
+                            result = ingest_browse(parsed_browse, browse_report,
+                                                   browse_layer, preprocessor,
+                                                   crs, success_dir, failure_dir,
+                                                   seed_areas, config=config,
+                                                   preprocessed=preprocessed,
+                                                   prefetched=prefetched,
+                                                   gcp_attempts=gcp_attempts,
+                                                   batch=batch)
+
+                            report_result.add(result)
+                            succeded.append(parsed_browse)
+                            _record_metrics(browse_layer, result, config)
+
+                            if checkpoint:
+                                save_checkpoint_browse(checkpoint, index, result,
+                                                       seed_areas)
+
+                            # seeding is done once the browse is committed
+                            pending_seed_areas.extend(seed_areas)
+                            batch.success()
+
+                            # log ingestions for report generation
+                            # date/browseType/browseLayerId/start/end[/timings]
+                            items = [
+                                datetime.utcnow().isoformat("T") + "Z",
+                                parsed_browse_report.browse_type,
+                                browse_layer.id,
+                                (parsed_browse.start_time.replace(tzinfo=None)-parsed_browse.start_time.utcoffset()).isoformat("T") + "Z",
+                                (parsed_browse.end_time.replace(tzinfo=None)-parsed_browse.end_time.utcoffset()).isoformat("T") + "Z"
+                            ]
+                            if ingest_config["report_timings"]:
+                                items.append(str(StageTimer(result.timings)))
+                            report_logger.info("/\\/\\".join(items))
 
                         except Exception, e:
-                            logger.warn("Seeding failed: %s" % str(e))
-
-                    # log ingestions for report generation
-                    # date/browseType/browseLayerId/start/end
-                    report_logger.info("/\\/\\".join((
-                        datetime.utcnow().isoformat("T") + "Z",
-                        parsed_browse_report.browse_type,
-                        browse_layer.id,
-                        (parsed_browse.start_time.replace(tzinfo=None)-parsed_browse.start_time.utcoffset()).isoformat("T") + "Z",
-                        (parsed_browse.end_time.replace(tzinfo=None)-parsed_browse.end_time.utcoffset()).isoformat("T") + "Z"
-                    )))
-
-                except Exception, e:
-                    # report error
-                    logger.error("Failure during ingestion of browse '%s'." %
-                                 parsed_browse.browse_identifier)
-                    logger.error("Exception was '%s': %s" % (type(e).__name__, str(e)))
-                    logger.debug(traceback.format_exc() + "\n")
-
-                    # undo latest changes, append the failure and continue
-                    report_result.add(IngestBrowseFailureResult(
-                        parsed_browse.browse_identifier,
-                        getattr(e, "code", None) or type(e).__name__, str(e))
-                    )
-                    failed.append(parsed_browse)
-
-                    transaction.rollback()
-                    transaction.rollback(using="mapcache")
+                            # report error
+                            logger.error("Failure during ingestion of browse '%s'." %
+                                         parsed_browse.browse_identifier)
+                            logger.error("Exception was '%s': %s" % (type(e).__name__, str(e)))
+                            logger.debug(traceback.format_exc() + "\n")
+
+                            # undo latest changes, append the failure and continue
+                            result = IngestBrowseFailureResult(
+                                parsed_browse.browse_identifier,
+                                getattr(e, "code", None) or type(e).__name__, str(e)
+                            )
+                            report_result.add(result)
+                            failed.append(parsed_browse)
+                            _record_metrics(browse_layer, result, config)
+
+                            batch.failure()
+
+                            # keep the failure in the checkpoint
+                            if checkpoint:
+                                batch.begin()
+                                save_checkpoint_browse(checkpoint, index, result)
+                                batch.success()
+
+                        # the attempts are kept even if the browse failed
+                        _record_gcp_attempts(browse_layer, gcp_attempts,
+                                             preprocessor, batch, config)
+
+                        # remove a preprocessed file that was not used, e.g. when
+                        # skipped
+                        if preprocessed and exists(preprocessed[0]):
+                            remove(preprocessed[0])
+                        if prefetched and exists(prefetched):
+                            remove(prefetched)
+
+                        if progress:
+                            progress(len(succeded) + len(failed),
+                                     len(parsed_browse_report))
+
+                    # commit the last batch
+                    batch.commit()
+
+                except:
+                    batch.rollback()
+                    raise
+
+                finally:
+                    # stop the preprocessing workers
+                    if pool:
+                        pool.close()
+
+                    # remove prefetched files that were never consumed
+                    if prefetcher:
+                        prefetcher.close()
+
+        report_result.timings = list(report_timer)
+
+        # all browses are handled, so the report is ingested anew when sent again
+        if checkpoint:
+            close_checkpoint(checkpoint)
+    except:
+        if pool:
+            pool.close()
+        # the ingestion of the report can be resumed right away
+        if checkpoint:
+            release_checkpoint(checkpoint)
+        raise
 
     # generate browse report and save to to success/failure dir
     if len(succeded):
@@ -303,16 +519,32 @@ def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=Non
 
 
 def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
-                  success_dir, failure_dir, seed_areas, config=None):
+                  success_dir, failure_dir, seed_areas, config=None,
+                  preprocessed=None, prefetched=None, gcp_attempts=None,
+                  batch=None):
     """ Ingests a single browse report, performs the preprocessing of the data
     file and adds the generated browse model to the browse report model. Returns
     a boolean value, indicating whether or not the browse has been inserted or
     replaced a previous browse entry.
+
+    `preprocessed` is an optional result of `_preprocess_browse` which is used
+    instead of preprocessing the data file again, unless the browse needs to
+    be merged.
+
+    The GCP transform attempts are appended to the optional `gcp_attempts`
+    list, to be recorded once the changes of the browse are committed or
+    rolled back.
+
+    If the `CommitBatch` of the database changes is given, the input file is
+    only removed, and the replaced files are only deleted, once the changes
+    are committed. The new files are removed if they are rolled back.
     """
 
     logger.info("Ingesting browse '%s'."
                 % (parsed_browse.browse_identifier or "<<no ID>>"))
 
+    timer = StageTimer()
+
     replaced = False
     replaced_extent = None
     replaced_filename = None
@@ -321,58 +553,30 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
 
     config = config or get_ngeo_config()
 
-    coverage_id = parsed_browse.browse_identifier
-    if not coverage_id:
-        # no identifier given, generate a new one
-        coverage_id = _generate_coverage_id(parsed_browse, browse_layer)
-        logger.info("No browse identifier given, generating coverage ID '%s'."
-                    % coverage_id)
-    else:
-        coverage_id = browse_layer.id + "_" + coverage_id
-        try:
-            NCNameValidator(coverage_id)
-        except ValidationError:
-            # given ID is not valid, generate a new identifier
-            old_id = coverage_id
-            coverage_id = _generate_coverage_id(parsed_browse, browse_layer)
-            logger.info("Browse ID '%s' is not a valid coverage ID. Using "
-                        "generated ID '%s'." % (old_id, coverage_id))
-
-    # get the `leave_original` setting
-    leave_original = False
-    try:
-        leave_original = config.getboolean("control.ingest", "leave_original")
-    except:
-        pass
+    coverage_id = _get_coverage_id(parsed_browse, browse_layer)
 
     # get the input and output filenames
     storage_path = get_storage_path()
     # if file_name is a URL download browse first and store it locally
     validate = URLValidator()
+    input_filename = _get_input_filename(parsed_browse, config)
     try:
         validate(parsed_browse.file_name)
-        input_filename = abspath(get_storage_path(
-            basename(parsed_browse.file_name), config=config))
         logger.info("URL given, downloading browse image from '%s' to '%s'."
                     % (parsed_browse.file_name, input_filename))
         if not exists(input_filename):
-            try:
-                remote_browse = urlopen(parsed_browse.file_name)
-                with open(input_filename, "wb") as local_browse:
-                    local_browse.write(remote_browse.read())
-            except HTTPError, e:
-                raise IngestionException("HTTP error downloading '%s': %s"
-                                         % (parsed_browse.file_name, e.code))
-            except URLError, e:
-                raise IngestionException("URL error downloading '%s': %s"
-                                         % (parsed_browse.file_name, e.reason))
+            with timer.stage("download"):
+                if prefetched and exists(prefetched):
+                    logger.info("Using prefetched browse image.")
+                    rename(prefetched, input_filename)
+                else:
+                    download(parsed_browse.file_name, input_filename,
+                             **get_download_config(config))
         else:
             raise IngestionException("File do download already exists locally "
                                      "as '%s'" % input_filename)
 
     except ValidationError:
-        input_filename = abspath(get_storage_path(parsed_browse.file_name,
-                                                  config=config))
         logger.info("Filename given, using local browse image '%s'."
                     % input_filename)
 
@@ -386,16 +590,9 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
         raise IngestionException("%s" % str(e), "ValidationError")
 
     # Get filename to store preprocessed image
-    output_filename = "%s_%s" % (
-        uuid.uuid4().hex, basename(parsed_browse.file_name)
+    output_filename = _get_output_filename(
+        parsed_browse, browse_layer, preprocessor, config
     )
-    output_filename = _valid_path(
-        get_optimized_path(
-            output_filename, browse_layer.id + "/" +
-            str(parsed_browse.start_time.year), config=config
-        )
-    )
-    output_filename = preprocessor.generate_filename(output_filename)
 
     try:
         ingest_config = get_ingest_config(config)
@@ -404,6 +601,27 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
         existing_browse_model = get_existing_browse(
             parsed_browse.browse_identifier, coverage_id, browse_layer.id)
 
+        # fingerprint the browse to detect unchanged browses sent again
+        digest = None
+        if (ingest_config["deduplicate"] and parsed_browse.browse_identifier
+                and exists(input_filename)):
+            digest = _browse_digest(parsed_browse, input_filename,
+                                    browse_layer, config)
+
+        if (existing_browse_model and digest is not None and
+                _get_digest(existing_browse_model) == digest):
+            logger.info("Existing browse '%s' is identical, skipping."
+                        % existing_browse_model.coverage_id)
+            _on_commit(batch, partial(
+                _finish_input_file, input_filename, success_dir, config
+            ))
+            result = IngestBrowseDuplicateResult(
+                parsed_browse.browse_identifier,
+                existing_browse_model.coverage_id
+            )
+            result.timings = list(timer)
+            return result
+
         if existing_browse_model:
             previous_time = existing_browse_model.browse_report.date_time
             current_time = browse_report.date_time
@@ -411,10 +629,7 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
 
             # get strategy and merge threshold
             threshold = ingest_config["merge_threshold"]
-            if browse_layer.strategy != "inherit":
-                strategy = browse_layer.strategy
-            else:
-                strategy = ingest_config["strategy"]
+            strategy = _get_strategy(browse_layer, ingest_config)
 
             if strategy == "merge" and timedelta < threshold:
 
@@ -434,7 +649,7 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
 
                 _, _ = remove_browse(
                     existing_browse_model, browse_layer, coverage_id,
-                    seed_areas, config=config
+                    seed_areas, config=config, defer_unseed=True
                 )
                 replaced = False
                 logger.debug("Existing browse found, merging it.")
@@ -451,7 +666,7 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
 
                 replaced_extent, replaced_filename = remove_browse(
                     existing_browse_model, browse_layer, coverage_id,
-                    seed_areas, config=config
+                    seed_areas, config=config, defer_unseed=True
                 )
                 replaced = True
                 logger.info("Existing browse found, replacing it.")
@@ -470,51 +685,78 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
                                      "not to be replaced." % output_filename)
 
         # wrap all file operations with IngestionTransaction
-        with FileTransaction((output_filename, replaced_filename)):
-            with FileTransaction((merge_with,), True):
+        defer = batch is not None
+        with FileTransaction((output_filename, replaced_filename),
+                             defer=defer) as output_transaction:
+            with FileTransaction((merge_with,), True,
+                                 defer=defer) as merge_transaction:
                 # assert that the input file exists
                 if not exists(input_filename):
                     raise IngestionException("Input file '%s' does not exist."
                                              % input_filename)
 
-                clipping = None
-                if (parsed_browse.geo_type == "regularGridBrowse" and
-                    ingest_config["regular_grid_clipping"]) or \
-                    (parsed_browse.geo_type == "footprintBrowse" and
-                     ("ncol" in parsed_browse.col_row_list or
-                      "nrow" in parsed_browse.col_row_list)):
-                    clipping = _get_clipping(input_filename)
-
-                # initialize a GeoReference for the preprocessor
-                geo_reference = _georef_from_parsed(parsed_browse, clipping)
-
                 # check that the output directory exists
                 safe_makedirs(dirname(output_filename))
 
-                # start the preprocessor
-                logger.info("Starting preprocessing on file '%s' to create '%s'."
-                            % (input_filename, output_filename))
+                if preprocessed is not None and merge_with is None:
+                    # the browse was already preprocessed, use its result
+                    preprocessed_filename, footprint_wkt, num_bands, \
+                        timings, attempts = preprocessed
+                    timer.extend(timings)
+                    if gcp_attempts is not None:
+                        gcp_attempts.extend(attempts)
+                    logger.info("Using preprocessed file '%s' to create '%s'."
+                                % (preprocessed_filename, output_filename))
+                    shutil.move(preprocessed_filename, output_filename)
+                    result = PreProcessResult(
+                        output_filename, GEOSGeometry(footprint_wkt),
+                        num_bands
+                    )
 
-                try:
-                    result = preprocessor.process(
-                        input_filename, output_filename, geo_reference,
-                        True, merge_with, merge_footprint
+                else:
+                    # initialize a GeoReference for the preprocessor
+                    geo_reference, reduction = _georef_from_browse(
+                        parsed_browse, input_filename, ingest_config, timer,
+                        browse_layer, preprocessor.warp_error_threshold
                     )
-                except (RuntimeError, GCPTransformException), e:
-                    raise IngestionException, str(e), sys.exc_info()[2]
+
+                    # start the preprocessor
+                    logger.info("Starting preprocessing on file '%s' to "
+                                "create '%s'."
+                                % (input_filename, output_filename))
+
+                    try:
+                        result = preprocessor.process(
+                            input_filename, output_filename, geo_reference,
+                            True, merge_with, merge_footprint, timer=timer,
+                            gcp_attempts=gcp_attempts, reduction=reduction
+                        )
+                    except (RuntimeError, GCPTransformException), e:
+                        raise IngestionException, str(e), sys.exc_info()[2]
 
                 # validate preprocess result
                 if result.num_bands not in (1, 3, 4):  # color index, RGB, RGBA
                     raise IngestionException("Processed browse image has %d bands."
                                              % result.num_bands)
 
+                # a merged image does not correspond to the input file
+                if merge_with is not None:
+                    digest = None
+
                 logger.info("Creating database models.")
-                extent, time_interval = create_browse(
-                    parsed_browse, browse_report, browse_layer, coverage_id,
-                    crs, replaced, result.footprint_geom, result.num_bands,
-                    output_filename, seed_areas, config=config
-                )
+                with timer.stage("create_browse"):
+                    extent, time_interval = create_browse(
+                        parsed_browse, browse_report, browse_layer,
+                        coverage_id, crs, replaced, result.footprint_geom,
+                        result.num_bands, output_filename, seed_areas,
+                        config=config, defer_unseed=True, digest=digest
+                    )
 
+        # keep the backups of replaced files until the changes are final
+        if defer:
+            for file_transaction in (output_transaction, merge_transaction):
+                batch.on_commit(file_transaction.commit)
+                batch.on_rollback(file_transaction.rollback)
 
     except:
         # save exception info to re-raise it
@@ -525,53 +767,164 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
                      % (parsed_browse.browse_identifier, failure_dir))
 
         # move the file to failure folder
-        try:
-            if not leave_original:
-                storage_dir = get_storage_path()
-                relative = relpath(input_filename, storage_dir)
-                dst_dirname = join(failure_dir, dirname(relative))
-                safe_makedirs(dst_dirname)
-                shutil.move(input_filename, dst_dirname)
-        except Exception, e:
-            logger.warn("Could not move '%s' to configured "
-                        "`failure_dir` '%s'. Error was: '%s'."
-                        % (input_filename, failure_dir, str(e)))
+        _move_to_failure_dir(input_filename, failure_dir, config)
 
         # re-raise the exception
         raise exc_info[0], exc_info[1], exc_info[2]
 
     else:
-        # move the file to success folder, or delete it right away
-        delete_on_success = True
-        try: delete_on_success = config.getboolean("control.ingest", "delete_on_success")
-        except: pass
-
-        if not leave_original:
-            if delete_on_success:
-                remove(input_filename)
-            else:
-                try:
-                    storage_dir = get_storage_path()
-                    relative = relpath(input_filename, storage_dir)
-                    dst_dirname = join(success_dir, dirname(relative))
-                    safe_makedirs(dst_dirname)
-                    shutil.move(input_filename, dst_dirname)
-                except Exception, e:
-                    logger.warn("Could not move '%s' to configured "
-                                "`success_dir` '%s'. Error was: '%s'."
-                                % (input_filename, success_dir, str(e)))
+        _on_commit(batch, partial(
+            _finish_input_file, input_filename, success_dir, config
+        ))
 
     logger.info("Successfully ingested browse with coverage ID '%s'."
                 % coverage_id)
 
     if not replaced:
-        return IngestBrowseResult(parsed_browse.browse_identifier, extent,
-                                  time_interval)
+        result = IngestBrowseResult(parsed_browse.browse_identifier, extent,
+                                    time_interval)
+
+    else:
+        result = IngestBrowseReplaceResult(parsed_browse.browse_identifier,
+                                           extent, time_interval,
+                                           replaced_extent,
+                                           replaced_time_interval)
+
+    result.timings = list(timer)
+    result.bytes_written = getsize(output_filename)
+    logger.debug("Stage timings of browse '%s' (wall/CPU seconds): %s"
+                 % (coverage_id, timer))
+    return result
+
+
+def _get_coverage_id(parsed_browse, browse_layer):
+    """ Returns the coverage ID of the browse, generated if the browse has no
+    or an invalid identifier.
+    """
+
+    coverage_id = parsed_browse.browse_identifier
+    if not coverage_id:
+        # no identifier given, generate a new one
+        coverage_id = _generate_coverage_id(parsed_browse, browse_layer)
+        logger.info("No browse identifier given, generating coverage ID '%s'."
+                    % coverage_id)
+    else:
+        coverage_id = browse_layer.id + "_" + coverage_id
+        try:
+            NCNameValidator(coverage_id)
+        except ValidationError:
+            # given ID is not valid, generate a new identifier
+            old_id = coverage_id
+            coverage_id = _generate_coverage_id(parsed_browse, browse_layer)
+            logger.info("Browse ID '%s' is not a valid coverage ID. Using "
+                        "generated ID '%s'." % (old_id, coverage_id))
+    return coverage_id
+
+
+def _get_strategy(browse_layer, ingest_config):
+    """ Returns the strategy for existing browses of the browse layer. """
+
+    if browse_layer.strategy != "inherit":
+        return browse_layer.strategy
+    return ingest_config["strategy"]
+
+
+def _is_skipped(parsed_browse, browse_report, browse_layer, ingest_config,
+                config=None):
+    """ Checks whether the browse would be skipped by `ingest_browse`, either
+    as an existing browse is not older or as it is identical to the existing
+    browse, to not preprocess it ahead in vain.
+    """
+
+    existing_browse_model = get_existing_browse(
+        parsed_browse.browse_identifier,
+        _get_coverage_id(parsed_browse, browse_layer), browse_layer.id
+    )
+    if not existing_browse_model:
+        return False
+
+    if (_get_strategy(browse_layer, ingest_config) == "skip" and
+            browse_report.date_time <=
+            existing_browse_model.browse_report.date_time):
+        return True
+
+    # remote browse images are only downloaded during the ingestion
+    input_filename = _get_input_filename(parsed_browse, config)
+    return bool(
+        ingest_config["deduplicate"] and parsed_browse.browse_identifier and
+        not _is_url(parsed_browse.file_name) and exists(input_filename) and
+        _get_digest(existing_browse_model) == _browse_digest(
+            parsed_browse, input_filename, browse_layer, config
+        )
+    )
+
+
+def _record_metrics(browse_layer, result, config=None):
+    """ Records the metrics of the ingestion of a single browse. """
+
+    labels = {"layer": browse_layer.id}
+
+    if not result.success:
+        increment("ngeo_browses_failed_total", config=config, **labels)
+    elif result.skipped:
+        increment("ngeo_browses_skipped_total", config=config, **labels)
+    else:
+        observations = []
+        timings = [
+            wall for stage, wall, cpu in result.timings
+            if stage in PREPROCESSING_STAGES
+        ]
+        if timings:
+            observations.append(
+                ("ngeo_preprocessing_seconds", labels, sum(timings))
+            )
+        record(increments=[
+            ("ngeo_browses_ingested_total", labels, 1),
+            ("ngeo_bytes_written_total", labels, result.bytes_written)
+        ], observations=observations, config=config)
+
+
+def _record_gcp_attempts(browse_layer, gcp_attempts, preprocessor, batch,
+                         config=None):
+    """ Records the GCP transform attempts of a single browse and updates the
+    statistics of the orders for subsequent browses of the layer. The changes are
+    made separately from the ones of the browse, after those were kept or
+    undone, so that the attempts of failed browses are recorded as well.
+    """
+
+    if not gcp_attempts:
+        return
 
+    batch.begin()
+    try:
+        record_gcp_attempts(browse_layer, gcp_attempts,
+                            preprocessor.gcp_orders, config)
+    except Exception, e:
+        logger.warn("Failed to record the GCP transform attempts: %s" % e)
+        batch.failure()
     else:
-        return IngestBrowseReplaceResult(parsed_browse.browse_identifier,
-                                         extent, time_interval, replaced_extent,
-                                         replaced_time_interval)
+        batch.success()
+
+
+def validate_browse_report(parsed_browse_report, config=None):
+    """ Checks all browses of a parsed browse report for errors that can be
+    detected without processing them, i.e. invalid or missing input files,
+    invalid reference system identifiers, and malformed geo-references.
+    Returns a list with an `IngestionException` for each invalid browse and
+    `None` for each valid browse, in the order of the browses.
+    """
+
+    errors = []
+    for parsed_browse in parsed_browse_report:
+        try:
+            _validate_browse(parsed_browse, config)
+            errors.append(None)
+        except IngestionException, e:
+            logger.warn("Browse '%s' is invalid: %s"
+                        % (parsed_browse.browse_identifier or "<<no ID>>", e))
+            errors.append(e)
+
+    return errors
 
 
 #===============================================================================
@@ -587,13 +940,385 @@ def safe_makedirs(path):
         makedirs(path)
 
 
+def _get_leave_original(config):
+    """ Returns the `leave_original` setting. """
+
+    config = config or get_ngeo_config()
+    try:
+        return config.getboolean("control.ingest", "leave_original")
+    except:
+        return False
+
+
+def _get_input_filename(parsed_browse, config=None):
+    """ Returns the path of the browse image within the storage directory.
+    Remote browse images are downloaded to this path.
+    """
+
+    if _is_url(parsed_browse.file_name):
+        return abspath(get_storage_path(basename(parsed_browse.file_name),
+                                        config=config))
+    return abspath(get_storage_path(parsed_browse.file_name, config=config))
+
+
+def _on_commit(batch, callback):
+    """ Invokes the callable once the changes of the current browse of the
+    `CommitBatch` are committed, or right away without a batch.
+    """
+
+    if batch is None:
+        callback()
+    else:
+        batch.on_commit(callback)
+
+
+def _move_to_failure_dir(input_filename, failure_dir, config):
+    """ Moves the input file of a failed browse to the failure folder. """
+
+    leave_original = _get_leave_original(config)
+
+    try:
+        if not leave_original and exists(input_filename):
+            storage_dir = get_storage_path()
+            relative = relpath(input_filename, storage_dir)
+            dst_dirname = join(failure_dir, dirname(relative))
+            safe_makedirs(dst_dirname)
+            shutil.move(input_filename, dst_dirname)
+    except Exception, e:
+        logger.warn("Could not move '%s' to configured "
+                    "`failure_dir` '%s'. Error was: '%s'."
+                    % (input_filename, failure_dir, str(e)))
+
+
+def _finish_input_file(input_filename, success_dir, config):
+    """ Moves the input file of a successfully ingested browse to the success
+    folder, or deletes it right away.
+    """
+
+    leave_original = _get_leave_original(config)
+
+    delete_on_success = True
+    try: delete_on_success = config.getboolean("control.ingest", "delete_on_success")
+    except: pass
+
+    if not leave_original:
+        if delete_on_success:
+            remove(input_filename)
+        else:
+            try:
+                storage_dir = get_storage_path()
+                relative = relpath(input_filename, storage_dir)
+                dst_dirname = join(success_dir, dirname(relative))
+                safe_makedirs(dst_dirname)
+                shutil.move(input_filename, dst_dirname)
+            except Exception, e:
+                logger.warn("Could not move '%s' to configured "
+                            "`success_dir` '%s'. Error was: '%s'."
+                            % (input_filename, success_dir, str(e)))
+
+
+def _browse_digest(parsed_browse, input_filename, browse_layer, config=None,
+                   chunk_size=1048576):
+    """ Returns the SHA-256 hex digest of the browse image and the parameters
+    its ingestion depends on, i.e. the georeference, the time interval and
+    the processing configuration of the browse layer. The file name is not
+    included, so renamed images are detected as well.
+    """
+
+    digest = hashlib.sha256()
+    with open(input_filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            digest.update(chunk)
+
+    params = parsed_browse.get_kwargs()
+    del params["file_name"]
+    del params["image_type"]
+    params["geo_type"] = parsed_browse.geo_type
+    if parsed_browse.geo_type == "regularGridBrowse":
+        params["coord_lists"] = list(parsed_browse.coord_lists)
+
+    # the browse is processed differently when the configuration changed
+    ingest_config = get_ingest_config(config)
+    processing = dict(get_format_config(config))
+    processing.update(get_optimization_config(config))
+    processing.update({
+        "bands": (browse_layer.r_band, browse_layer.g_band,
+                  browse_layer.b_band),
+        "radiometric_interval": (browse_layer.radiometric_interval_min,
+                                 browse_layer.radiometric_interval_max),
+        "snap_to_grid": ingest_config["snap_to_grid"],
+    })
+    if ingest_config["snap_to_grid"]:
+        processing["grid"] = browse_layer.grid
+        processing["map_levels"] = (browse_layer.lowest_map_level,
+                                    browse_layer.highest_map_level)
+    params["processing"] = sorted(processing.items())
+
+    for key, value in sorted(params.items()):
+        if hasattr(value, "isoformat"):
+            value = value.isoformat()
+        digest.update("%s=%r;" % (key, value))
+
+    return digest.hexdigest()
+
+
+def _get_digest(browse_model):
+    """ Returns the stored digest of a browse or `None` if there is none. """
+
+    try:
+        return browse_model.digest.value
+    except models.BrowseDigest.DoesNotExist:
+        return None
+
+
+def _is_url(file_name):
+    """ Returns `True` if the browse file name is a URL. """
+
+    try:
+        URLValidator()(file_name)
+        return True
+    except ValidationError:
+        return False
+
+
+def _preprocess_browse(parsed_browse, browse_layer, preprocessor, config=None):
+    """ Preprocesses the local data file of a browse ahead of its ingestion,
+    e.g. in a worker process. No database access is performed. Returns a tuple
+    of the preprocessed filename, the footprint WKT, the number of bands, the
+    stage timings and the GCP transform attempts, or `None` if the browse has
+    to be preprocessed during its ingestion.
+    """
+
+    config = config or get_ngeo_config()
+
+    # remote browse images are downloaded during the ingestion
+    if _is_url(parsed_browse.file_name):
+        return None
+
+    storage_path = get_storage_path(config=config)
+    input_filename = abspath(get_storage_path(parsed_browse.file_name,
+                                              config=config))
+
+    # invalid input files are reported during the ingestion
+    if (commonprefix((input_filename, storage_path)) != storage_path or
+            not exists(input_filename)):
+        return None
+    try:
+        models.FileNameValidator(input_filename)
+    except ValidationError:
+        return None
+
+    timer = StageTimer()
+    geo_reference, reduction = _georef_from_browse(
+        parsed_browse, input_filename, get_ingest_config(config), timer,
+        browse_layer, preprocessor.warp_error_threshold
+    )
+
+    output_filename = _get_output_filename(
+        parsed_browse, browse_layer, preprocessor, config
+    )
+    safe_makedirs(dirname(output_filename))
+
+    logger.info("Starting preprocessing on file '%s' to create '%s'."
+                % (input_filename, output_filename))
+    gcp_attempts = []
+    try:
+        result = preprocessor.process(
+            input_filename, output_filename, geo_reference, True, timer=timer,
+            gcp_attempts=gcp_attempts, reduction=reduction
+        )
+    except:
+        if exists(output_filename):
+            remove(output_filename)
+        raise
+
+    return (output_filename, result.footprint_geom.wkt, result.num_bands,
+            list(timer), gcp_attempts)
+
+
+def _get_output_filename(parsed_browse, browse_layer, preprocessor,
+                         config=None):
+    """ Returns a new unique filename to store the preprocessed image. """
+
+    output_filename = "%s_%s" % (
+        uuid.uuid4().hex, basename(parsed_browse.file_name)
+    )
+    output_filename = _valid_path(
+        get_optimized_path(
+            output_filename, browse_layer.id + "/" +
+            str(parsed_browse.start_time.year), config=config
+        )
+    )
+    return preprocessor.generate_filename(output_filename)
+
+
 def _get_clipping(path):
     ds = gdal.Open(path)
     return ds.RasterXSize, ds.RasterYSize
 
 
-def _georef_from_parsed(parsed_browse, clipping=None):
+def _georef_from_browse(parsed_browse, input_filename, ingest_config,
+                        timer=None, browse_layer=None, error_threshold=0):
+    """ Initializes a GeoReference for the preprocessor, clipping the pixel
+    coordinates to the image size where required. Returns a tuple of the
+    GeoReference and the factor by which the input is to be reduced, so that
+    it is not finer than the highest map level of the browse layer. A positive
+    `error_threshold` selects the approximate transformer for GCPs.
+    """
+
+    if timer is None:
+        timer = NullTimer()
+
+    clipping = None
+    if (parsed_browse.geo_type == "regularGridBrowse" and
+        ingest_config["regular_grid_clipping"]) or \
+        (parsed_browse.geo_type == "footprintBrowse" and
+         ("ncol" in parsed_browse.col_row_list or
+          "nrow" in parsed_browse.col_row_list)):
+        with timer.stage("open"):
+            clipping = _get_clipping(input_filename)
+
+    reduction = 1
+    scale = None
+    if ingest_config["resolution_cap"] and browse_layer is not None:
+        with timer.stage("open"):
+            size = _get_clipping(input_filename)
+            reduction = _get_reduction(
+                parsed_browse, input_filename, size, browse_layer
+            )
+        if reduction > 1:
+            reduced_x, reduced_y = reduced_size(size[0], size[1], reduction)
+            scale = (reduced_x / float(size[0]), reduced_y / float(size[1]))
+
+    with timer.stage("georef"):
+        geo_reference = _georef_from_parsed(
+            parsed_browse, clipping, ingest_config, scale, error_threshold
+        )
+    return geo_reference, reduction
+
+
+def _get_reduction(parsed_browse, input_filename, size, browse_layer):
+    """ Returns the largest power of two by which the browse image can be
+    reduced without getting coarser than the resolution of the highest map
+    level of the browse layer.
+    """
+
+    if browse_layer.highest_map_level is None:
+        return 1
+
+    grid = get_grid(browse_layer.grid)
+    max_resolution = level_resolution(grid, browse_layer.highest_map_level)
+    resolution = _estimate_resolution(
+        parsed_browse, input_filename, size, grid.srid
+    )
+    if not resolution:
+        return 1
+
+    reduction = 1
+    while resolution * reduction * 2 <= max_resolution:
+        reduction *= 2
+
+    if reduction > 1:
+        logger.info("Browse resolution of %f is finer than the %f of the "
+                    "highest map level %d. Reducing it by a factor of %d."
+                    % (resolution, max_resolution,
+                       browse_layer.highest_map_level, reduction))
+    return reduction
+
+
+def _estimate_resolution(parsed_browse, input_filename, size, srid):
+    """ Estimates the pixel size of the browse image in the given CRS from
+    the extents of its coordinates and pixel coordinates. The coarser axis is
+    used, so the estimate never leads to a too strong reduction. Returns
+    `None` if the resolution cannot be estimated.
+    """
+
+    size_x, size_y = size
+    geo_type = parsed_browse.geo_type
+    try:
+        if geo_type == "modelInGeotiffBrowse":
+            ds = gdal.Open(input_filename)
+            gt = ds.GetGeoTransform()
+            if gt == (0.0, 1.0, 0.0, 0.0, 0.0, 1.0):
+                # GCPs in the image are not evaluated
+                return None
+            coords = [
+                (gt[0] + x * gt[1] + y * gt[2], gt[3] + x * gt[4] + y * gt[5])
+                for x, y in ((0, 0), (size_x, 0), (0, size_y), (size_x, size_y))
+            ]
+            src_sr = osr.SpatialReference()
+            src_sr.ImportFromWkt(ds.GetProjection())
+            pixel_width, pixel_height = size_x, size_y
+
+        else:
+            source_srid = fromShortCode(
+                parsed_browse.reference_system_identifier
+            )
+            if source_srid is None:
+                return None
+            swap_axes = hasSwappedAxes(source_srid)
+            src_sr = osr.SpatialReference()
+            src_sr.ImportFromEPSG(source_srid)
+
+            if geo_type == "rectifiedBrowse":
+                coords = decode_coord_list(parsed_browse.coord_list, swap_axes)
+                pixel_width, pixel_height = size_x, size_y
+
+            elif geo_type == "footprintBrowse":
+                coords = decode_coord_list(parsed_browse.coord_list, swap_axes)
+                pixels = [
+                    (size_x if x == "ncol" else x, size_y if y == "nrow" else y)
+                    for x, y in decode_coord_list(parsed_browse.col_row_list)
+                ]
+                xs, ys = zip(*pixels)
+                pixel_width = max(xs) - min(xs)
+                pixel_height = max(ys) - min(ys)
+
+            elif geo_type == "regularGridBrowse":
+                coords = []
+                for coord_list in parsed_browse.coord_lists:
+                    coords.extend(decode_coord_list(coord_list, swap_axes))
+                pixel_width = min(
+                    size_x, (parsed_browse.row_node_number - 1) *
+                    parsed_browse.row_step
+                )
+                pixel_height = min(
+                    size_y, (parsed_browse.col_node_number - 1) *
+                    parsed_browse.col_step
+                )
+
+            else:
+                return None
+
+        if not pixel_width or not pixel_height:
+            return None
+
+        dst_sr = osr.SpatialReference()
+        dst_sr.ImportFromEPSG(srid)
+        transformation = osr.CoordinateTransformation(src_sr, dst_sr)
+        points = [
+            transformation.TransformPoint(float(x), float(y))[:2]
+            for x, y in coords
+        ]
+
+    except Exception, e:
+        logger.debug("Could not estimate the browse resolution: %s" % e)
+        return None
+
+    xs, ys = zip(*points)
+    return max((max(xs) - min(xs)) / pixel_width,
+               (max(ys) - min(ys)) / pixel_height)
+
+
+def _georef_from_parsed(parsed_browse, clipping=None, ingest_config=None,
+                        scale=None, error_threshold=0):
     srid = fromShortCode(parsed_browse.reference_system_identifier)
+    lazy = bool(ingest_config and ingest_config["lazy_pipeline"])
+    # only the internal GCP georeference supports the approximate transformer
+    # and warping directly to the tile grid
+    internal = lazy or error_threshold > 0 or bool(
+        ingest_config and ingest_config["snap_to_grid"]
+    )
 
     if (parsed_browse.reference_system_identifier == "RAW" and
         parsed_browse.geo_type != "modelInGeotiffBrowse"):
@@ -623,6 +1348,9 @@ def _georef_from_parsed(parsed_browse, clipping=None):
             clip_x, clip_y = clipping
             pixels[:] = [(clip_x if x == "ncol" else x, clip_y if y == "nrow"
                          else y) for x, y in pixels]
+        # refer to the pixels of the reduced image
+        if scale:
+            pixels[:] = [(x * scale[0], y * scale[1]) for x, y in pixels]
         coord_list = decode_coord_list(parsed_browse.coord_list, swap_axes)
 
         if _coord_list_crosses_dateline(coord_list, CRS_BOUNDS[srid]):
@@ -640,6 +1368,8 @@ def _georef_from_parsed(parsed_browse, clipping=None):
                                      "equal to the first.")
         gcps.pop()
 
+        if internal:
+            return LazyGCPList(gcps, srid, lazy)
         return GCPList(gcps, srid)
 
     elif parsed_browse.geo_type == "regularGridBrowse":
@@ -662,6 +1392,10 @@ def _georef_from_parsed(parsed_browse, clipping=None):
                 (min(clip_x, x), min(clip_y, y)) for x, y in pixels
             ]
 
+        # refer to the pixels of the reduced image
+        if scale:
+            pixels[:] = [(x * scale[0], y * scale[1]) for x, y in pixels]
+
         # decode coordinate lists and check if any crosses the dateline
         coord_lists = []
         crosses_dateline = False
@@ -697,6 +1431,11 @@ def _georef_from_parsed(parsed_browse, clipping=None):
 
         gcps = [(x, y, pixel, line)
                 for (x, y), (pixel, line) in zip(coords, pixels)]
+        if ingest_config:
+            gcps = _thin_gcps(gcps, parsed_browse.row_node_number,
+                              parsed_browse.col_node_number, ingest_config)
+        if internal:
+            return LazyGCPList(gcps, srid, lazy)
         return GCPList(gcps, srid)
 
     elif parsed_browse.geo_type == "modelInGeotiffBrowse":
@@ -707,6 +1446,135 @@ def _georef_from_parsed(parsed_browse, clipping=None):
                                   % parsed_browse.geo_type)
 
 
+def _thin_gcps(gcps, num_x, num_y, ingest_config):
+    """ Thins the GCPs of a regular grid as configured and reports the
+    largest residual of the thinned GCPs at all GCPs.
+    """
+
+    method = ingest_config["gcp_thinning"]
+    max_count = ingest_config["gcp_max_count"]
+    tolerance = ingest_config["gcp_thinning_tolerance"]
+
+    if method == "none" or len(gcps) <= max_count:
+        return gcps
+    elif method == "grid":
+        thinned = thin_grid(gcps, num_x, num_y, max_count)
+    elif method == "error":
+        thinned = thin_by_error(gcps, max_count, tolerance)
+    else:
+        raise IngestionException("Invalid GCP thinning method '%s'." % method)
+
+    residual = max_residual(thinned, gcps)
+    logger.info("Thinned %d GCPs to %d with a maximum residual of %.3f "
+                "pixels." % (len(gcps), len(thinned), residual))
+    if residual > tolerance:
+        logger.warn("Maximum residual of the thinned GCPs of %.3f pixels "
+                    "exceeds the tolerance of %.3f pixels."
+                    % (residual, tolerance))
+    return thinned
+
+
+def _validate_browse(parsed_browse, config=None):
+    """ Raises an `IngestionException` if the browse is not valid. Performs
+    the same checks as the ingestion, but without opening any file.
+    """
+
+    # check that the input filename is valid -> somewhere under the storage dir
+    storage_path = get_storage_path(config=config)
+    input_filename = _get_input_filename(parsed_browse, config)
+    if commonprefix((input_filename, storage_path)) != storage_path:
+        raise IngestionException("Input path '%s' points to an invalid "
+                                 "location." % parsed_browse.file_name)
+    try:
+        models.FileNameValidator(input_filename)
+    except ValidationError, e:
+        raise IngestionException("%s" % str(e), "ValidationError")
+
+    if not _is_url(parsed_browse.file_name) and not exists(input_filename):
+        raise IngestionException("Input file '%s' does not exist."
+                                 % input_filename)
+
+    # check the reference system
+    reference_system_identifier = parsed_browse.reference_system_identifier
+    geo_type = parsed_browse.geo_type
+    srid = fromShortCode(reference_system_identifier)
+
+    if (reference_system_identifier == "RAW" and
+        geo_type != "modelInGeotiffBrowse"):
+        raise IngestionException("Given referenceSystemIdentifier '%s' not "
+                                 "valid for a '%s'."
+                                 % (reference_system_identifier, geo_type))
+
+    if srid is None and reference_system_identifier != "RAW":
+        raise IngestionException("Given referenceSystemIdentifier '%s' not valid."
+                                 % reference_system_identifier)
+
+    if (geo_type in ("footprintBrowse", "regularGridBrowse") and
+        srid not in CRS_BOUNDS):
+        raise IngestionException("Given referenceSystemIdentifier '%s' not "
+                                 "supported for a '%s'."
+                                 % (reference_system_identifier, geo_type))
+
+    # check the geo-reference
+    if geo_type == "rectifiedBrowse":
+        if len(_decode_coords(parsed_browse.coord_list)) != 2:
+            raise IngestionException("Invalid rectifiedBrowse: the coordinate "
+                                     "list does not consist of two "
+                                     "coordinates.")
+
+    elif geo_type == "footprintBrowse":
+        pixels = _decode_coords(parsed_browse.col_row_list)
+        coord_list = _decode_coords(parsed_browse.coord_list)
+
+        if len(pixels) != len(coord_list):
+            raise IngestionException("Invalid footprint: number of pixel "
+                                     "coordinates is not equal to the number "
+                                     "of coordinates.")
+
+        if _coord_list_crosses_dateline(coord_list, CRS_BOUNDS[srid]):
+            coord_list = _unwrap_coord_list(coord_list, CRS_BOUNDS[srid])
+
+        # check that the last point of the footprint is the first
+        if (coord_list[0], pixels[0]) != (coord_list[-1], pixels[-1]):
+            raise IngestionException("The last value of the footprint is not "
+                                     "equal to the first.")
+
+        if len(coord_list) != parsed_browse.node_number:
+            raise IngestionException("Invalid footprint: number of "
+                                     "coordinates does not fit the given "
+                                     "node number.")
+
+    elif geo_type == "regularGridBrowse":
+        if len(parsed_browse.coord_lists) != parsed_browse.row_node_number:
+            raise IngestionException("Invalid regularGrid: number of coordinate "
+                                     "lists is not equal to the given row node "
+                                     "number.")
+
+        for coord_list in parsed_browse.coord_lists:
+            if len(_decode_coords(coord_list)) != parsed_browse.col_node_number:
+                raise IngestionException("Invalid regularGrid: number of "
+                                         "coordinates does not fit given "
+                                         "columns number.")
+
+
+def _decode_coords(coord_list):
+    """ Decodes a coordinate list, raising an `IngestionException` if it is
+    malformed.
+    """
+
+    if len(coord_list.split()) % 2:
+        raise IngestionException("Invalid coordinate list '%s': odd number of "
+                                 "values." % coord_list)
+    try:
+        coords = decode_coord_list(coord_list)
+    except ValueError, e:
+        raise IngestionException("Invalid coordinate list '%s': %s"
+                                 % (coord_list, e))
+    if not coords:
+        raise IngestionException("Empty coordinate list.")
+    return coords
+
+
 def _generate_coverage_id(parsed_browse, browse_layer):
     frmt = "%Y%m%d%H%M%S%f"
     return "%s_%s_%s_%s" % (browse_layer.id,
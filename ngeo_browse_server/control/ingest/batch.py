@@ -0,0 +1,256 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+import logging
+from time import time
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+
+logger = logging.getLogger(__name__)
+
+
+class CommitBatch(object):
+    """ Helper to commit the changes of ingested browses, either for each
+    browse or, in group-commit mode, for a batch of browses. A batch is
+    committed when `size` browses were ingested or `interval` seconds have
+    passed since the first browse of the batch.
+
+    In group-commit mode the changes of each browse are enclosed in a
+    savepoint, so that a failing browse only rolls back its own changes.
+    Django does not support savepoints with SQLite, as its driver commits the
+    open transaction before such statements. For SQLite databases the driver
+    is therefore switched to autocommit mode for the time of a batch, and
+    the transaction and the savepoints are issued directly. Databases of
+    other backends without savepoints are still committed for each browse.
+
+    The optional `before_commit` and `after_commit` callables are invoked
+    around each commit of the changes of the browses, e.g. to schedule the
+    seeding of the committed browses. Operations on files are registered per
+    browse with `on_commit` and `on_rollback`, so that they are only applied
+    once the changes of the browse are committed and undone otherwise.
+
+    All databases are expected to be under manual transaction management.
+    """
+
+    def __init__(self, using=(DEFAULT_DB_ALIAS, "mapcache"), size=1,
+                 interval=0, before_commit=None, after_commit=None):
+        self.size = size
+        self.interval = interval
+        self.before_commit = before_commit
+        self.after_commit = after_commit
+
+        enabled = size > 1 or interval > 0
+        self.batched = [
+            alias for alias in using
+            if enabled and connections[alias].features.uses_savepoints
+        ]
+        self.sqlite = [
+            alias for alias in using
+            if enabled and alias not in self.batched
+            and connections[alias].vendor == "sqlite"
+        ]
+        self.direct = [
+            alias for alias in using
+            if alias not in self.batched and alias not in self.sqlite
+        ]
+
+        if enabled and self.direct:
+            logger.debug("Database%s '%s' not supporting savepoints, "
+                         "committing for each browse."
+                         % ("s" if len(self.direct) > 1 else "",
+                            "', '".join(self.direct)))
+
+        self.savepoints = {}
+        # isolation levels of the SQLite connections with an open batch
+        self.isolation_levels = {}
+        self.pending = 0
+        self.started = None
+
+        # callbacks of the current browse and of the pending browses
+        self.browse_callbacks = ([], [])
+        self.callbacks = ([], [])
+
+    def on_commit(self, callback):
+        """ Registers a callable to be invoked once the changes of the current
+        browse are committed.
+        """
+        self.browse_callbacks[0].append(callback)
+
+    def on_rollback(self, callback):
+        """ Registers a callable to be invoked when the changes of the current
+        browse are undone.
+        """
+        self.browse_callbacks[1].append(callback)
+
+    def begin(self):
+        """ Marks the beginning of the changes of a single browse. """
+
+        for alias in self.batched:
+            self.savepoints[alias] = transaction.savepoint(using=alias)
+
+        for alias in self.sqlite:
+            if alias not in self.isolation_levels:
+                self._begin_sqlite(alias)
+            self._execute(alias, "SAVEPOINT ngeo_browse")
+
+    def success(self):
+        """ Keeps the changes of the current browse and commits them if
+        necessary.
+        """
+
+        for callbacks, browse_callbacks in zip(self.callbacks,
+                                               self.browse_callbacks):
+            callbacks.extend(browse_callbacks)
+            del browse_callbacks[:]
+
+        if not self.batched and not self.sqlite:
+            self.pending += 1
+            self.commit()
+            return
+
+        for alias in self.direct:
+            transaction.commit(using=alias)
+
+        for alias in self.batched:
+            transaction.savepoint_commit(self.savepoints.pop(alias),
+                                         using=alias)
+
+        for alias in self.sqlite:
+            self._execute(alias, "RELEASE SAVEPOINT ngeo_browse")
+
+        self.pending += 1
+        if self.started is None:
+            self.started = time()
+
+        if ((self.size > 1 and self.pending >= self.size) or
+                (self.interval > 0 and time() - self.started >= self.interval)):
+            self.commit()
+
+    def failure(self):
+        """ Undoes the changes of the current browse. """
+
+        for alias in self.direct:
+            transaction.rollback(using=alias)
+
+        for alias, sid in self.savepoints.items():
+            transaction.savepoint_rollback(sid, using=alias)
+        self.savepoints.clear()
+
+        for alias in self.sqlite:
+            self._execute(alias, "ROLLBACK TO SAVEPOINT ngeo_browse")
+            self._execute(alias, "RELEASE SAVEPOINT ngeo_browse")
+
+        self._run_callbacks(self.browse_callbacks, rollback=True)
+
+    def commit(self):
+        """ Commits all pending changes. """
+
+        if self.before_commit:
+            self.before_commit()
+
+        for alias in self.sqlite:
+            self._end_sqlite(alias, "COMMIT")
+
+        for alias in self.batched + self.sqlite + self.direct:
+            transaction.commit(using=alias)
+
+        if self.pending:
+            logger.info("Committed changes of %d browse%s to database."
+                        % (self.pending, "s" if self.pending > 1 else ""))
+
+        self.pending = 0
+        self.started = None
+
+        self._run_callbacks(self.callbacks)
+
+        if self.after_commit:
+            self.after_commit()
+
+    def rollback(self):
+        """ Rolls back all pending changes. """
+
+        for alias in self.sqlite:
+            self._end_sqlite(alias, "ROLLBACK")
+
+        for alias in self.batched + self.sqlite + self.direct:
+            transaction.rollback(using=alias)
+
+        self.pending = 0
+        self.started = None
+
+        self._run_callbacks(self.browse_callbacks, rollback=True)
+        self._run_callbacks(self.callbacks, rollback=True)
+
+    def _run_callbacks(self, callbacks, rollback=False):
+        """ Invokes and clears the commit callbacks in the order of their
+        registration, or the rollback callbacks in reverse order. Failing
+        callbacks are logged, as the database changes are already final.
+        """
+
+        on_commit, on_rollback = callbacks
+        if rollback:
+            pending = list(reversed(on_rollback))
+        else:
+            pending = list(on_commit)
+        del on_commit[:]
+        del on_rollback[:]
+
+        for callback in pending:
+            try:
+                callback()
+            except Exception, e:
+                logger.warn("Failed to %s file operation: %s"
+                            % ("undo" if rollback else "finish", e))
+
+    def _begin_sqlite(self, alias):
+        # changing the isolation level commits the changes made so far
+        connection = self._get_connection(alias)
+        self.isolation_levels[alias] = connection.isolation_level
+        connection.isolation_level = None
+        self._execute(alias, "BEGIN")
+
+    def _end_sqlite(self, alias, statement):
+        if alias not in self.isolation_levels:
+            return
+        try:
+            self._execute(alias, statement)
+        finally:
+            self._get_connection(alias).isolation_level = \
+                self.isolation_levels.pop(alias)
+
+    def _get_connection(self, alias):
+        """ Returns the driver connection of the database. """
+
+        # make sure the connection is established
+        connections[alias].cursor()
+        return connections[alias].connection
+
+    def _execute(self, alias, statement):
+        connections[alias].cursor().execute(statement)
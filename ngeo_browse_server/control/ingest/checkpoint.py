@@ -0,0 +1,217 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Checkpoints of the ingestion of browse reports. The result of each handled
+browse is stored along with the digest of its browse report, so that the
+ingestion of the same report can be resumed after an interruption instead of
+ingesting all browses again.
+"""
+
+import hashlib
+import logging
+import uuid
+from datetime import timedelta
+
+from django.utils import simplejson as json
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+
+from ngeo_browse_server.config.browsereport.serialization import (
+    serialize_browse_report
+)
+from ngeo_browse_server.control.models import (
+    IngestCheckpoint, IngestCheckpointBrowse
+)
+from ngeo_browse_server.control.ingest.result import (
+    IngestBrowseResult, IngestBrowseReplaceResult, IngestBrowseSkipResult,
+    IngestBrowseFailureResult
+)
+from ngeo_browse_server.control.ingest.exceptions import IngestionException
+from ngeo_browse_server.mapcache.planning import SeedArea, UnseedArea
+from ngeo_browse_server.lock import get_owner, is_owner_alive
+
+
+logger = logging.getLogger(__name__)
+
+
+# seconds without progress after which a checkpoint held by a run on another
+# host is taken over
+DEFAULT_CHECKPOINT_TIMEOUT = 3600
+
+
+def get_report_digest(parsed_browse_report):
+    """ Returns the SHA-256 hex digest of the serialized browse report. """
+
+    return hashlib.sha256(
+        serialize_browse_report(parsed_browse_report).getvalue()
+    ).hexdigest()
+
+
+def open_checkpoint(parsed_browse_report, success_dir, failure_dir,
+                    timeout=DEFAULT_CHECKPOINT_TIMEOUT):
+    """ Returns the checkpoint of the browse report, creating it with the given
+    result directories if the report was not ingested before. The checkpoint
+    is claimed by the current run. Raises an `IngestionException` if another
+    run still holds it, i.e. its process is alive or, on another host, it
+    made progress within the last `timeout` seconds.
+    """
+
+    owner = get_owner(uuid.uuid4().hex)
+    checkpoint, created = IngestCheckpoint.objects.get_or_create(
+        digest=get_report_digest(parsed_browse_report),
+        defaults={"success_dir": success_dir, "failure_dir": failure_dir,
+                  "owner": owner, "heartbeat": now()}
+    )
+    if created:
+        return checkpoint
+
+    # claim the checkpoint, unless another run claimed it in the meantime
+    if not _is_abandoned(checkpoint, timeout) or not \
+            IngestCheckpoint.objects.filter(
+                pk=checkpoint.pk, owner=checkpoint.owner
+            ).update(owner=owner, heartbeat=now()):
+        raise IngestionException(
+            "The browse report is already being ingested by '%s'."
+            % checkpoint.owner, "IngestionInProgress"
+        )
+    checkpoint.owner = owner
+
+    logger.info("Resuming the ingestion of the browse report started at "
+                "%s." % checkpoint.created)
+    return checkpoint
+
+
+def get_finished_browses(checkpoint, parsed_browse_report):
+    """ Returns a dictionary of the indices of all browses already handled to
+    a tuple of their result and their areas to be (un-)seeded.
+    """
+
+    browses = list(parsed_browse_report)
+    finished = {}
+    for record in checkpoint.browses.all():
+        identifier = browses[record.index].browse_identifier
+        finished[record.index] = (
+            _result_from_record(record, identifier),
+            _decode_seed_areas(record.seed_areas)
+        )
+    return finished
+
+
+def save_browse(checkpoint, index, result, seed_areas=()):
+    """ Stores the result of a handled browse. The record is saved within the
+    current transaction, so it is only persisted together with the changes of
+    the browse.
+    """
+
+    if not result.success:
+        status = "failed"
+    elif result.skipped:
+        status = "skipped"
+    elif result.replaced:
+        status = "replaced"
+    else:
+        status = "inserted"
+
+    if not IngestCheckpoint.objects.filter(
+            pk=checkpoint.pk, owner=checkpoint.owner
+    ).update(heartbeat=now()):
+        raise IngestionException(
+            "The checkpoint of the browse report was taken over by another "
+            "ingestion.", "IngestionInProgress"
+        )
+
+    IngestCheckpointBrowse.objects.create(
+        checkpoint=checkpoint, index=index, status=status,
+        code=result.code or "", message=result.message or "",
+        seed_areas=_encode_seed_areas(seed_areas)
+    )
+
+
+def close_checkpoint(checkpoint):
+    """ Removes the checkpoint once all browses of the report were handled,
+    unless another run took it over.
+    """
+
+    IngestCheckpoint.objects.filter(
+        pk=checkpoint.pk, owner=checkpoint.owner
+    ).delete()
+
+
+def release_checkpoint(checkpoint):
+    """ Releases the checkpoint of an interrupted ingestion, so that the
+    ingestion of the report can be resumed right away.
+    """
+
+    IngestCheckpoint.objects.filter(
+        pk=checkpoint.pk, owner=checkpoint.owner
+    ).update(owner="", heartbeat=None)
+
+
+def _is_abandoned(checkpoint, timeout):
+    """ Returns whether the run holding the checkpoint is gone. """
+
+    if not checkpoint.owner:
+        return True
+    alive = is_owner_alive(checkpoint.owner)
+    if alive is not None:
+        return not alive
+    return (checkpoint.heartbeat is None or
+            now() - checkpoint.heartbeat > timedelta(seconds=timeout))
+
+
+def _result_from_record(record, identifier):
+    if record.status == "failed":
+        return IngestBrowseFailureResult(identifier, record.code,
+                                         record.message)
+    elif record.status == "skipped":
+        result = IngestBrowseSkipResult(identifier)
+        result.code = record.code or None
+        result.message = record.message or None
+        return result
+    elif record.status == "replaced":
+        return IngestBrowseReplaceResult(identifier, None, None, None, None)
+    return IngestBrowseResult(identifier, None, None)
+
+
+def _encode_seed_areas(seed_areas):
+    return json.dumps([
+        [isinstance(area, UnseedArea)] + list(area[:4]) +
+        [area[4].isoformat(), area[5].isoformat()]
+        for area in seed_areas
+    ])
+
+
+def _decode_seed_areas(value):
+    seed_areas = []
+    for item in json.loads(value or "[]"):
+        area_class = UnseedArea if item[0] else SeedArea
+        seed_areas.append(area_class(
+            *(item[1:5] + [parse_datetime(item[5]), parse_datetime(item[6])])
+        ))
+    return seed_areas
@@ -182,6 +182,73 @@ def get_optimization_config(config=None):
     except:
         pass
 
+    try:
+        values["footprint_memory_budget"] = config.getint(
+            INGEST_SECTION, "footprint_memory_budget") * 1024 * 1024
+    except:
+        pass
+
+    try:
+        values["footprint_decimation"] = config.getboolean(
+            INGEST_SECTION, "footprint_decimation")
+    except:
+        pass
+
+    try:
+        values["gcp_footprint"] = config.getboolean(
+            INGEST_SECTION, "gcp_footprint")
+    except:
+        pass
+
+    try:
+        values["lazy_pipeline"] = config.getboolean(
+            INGEST_SECTION, "lazy_pipeline")
+    except:
+        pass
+
+    try:
+        values["cog"] = config.getboolean(INGEST_SECTION, "cog")
+    except:
+        pass
+
+    try:
+        values["approximate_statistics"] = config.getboolean(
+            INGEST_SECTION, "approximate_statistics")
+    except:
+        pass
+
+    try:
+        values["statistics_sample_size"] = max(1, config.getint(
+            INGEST_SECTION, "statistics_sample_size"))
+    except:
+        pass
+
+    try:
+        values["statistics_percentile"] = config.getfloat(
+            INGEST_SECTION, "statistics_percentile")
+    except:
+        pass
+
+    try:
+        values["cog_block_size"] = config.getint(
+            INGEST_SECTION, "cog_block_size")
+    except:
+        pass
+
+    values["num_threads"] = safe_get(config, INGEST_SECTION, "num_threads")
+
+    try:
+        values["warp_error_threshold"] = config.getfloat(
+            INGEST_SECTION, "warp_error_threshold")
+    except:
+        pass
+
+    try:
+        values["cache_max"] = config.getint(
+            INGEST_SECTION, "gdal_cachemax") * 1024 * 1024
+    except:
+        pass
+
     in_memory = False
     try:
         in_memory = config.getboolean(INGEST_SECTION, "in_memory")
@@ -215,6 +282,27 @@ def parse_time_delta(string):
     return timedelta(**kwargs)
 
 
+def get_download_config(config=None):
+    """ Returns the settings for downloading remote browse images. """
+
+    config = config or get_ngeo_config()
+
+    return {
+        "timeout": float(
+            safe_get(config, INGEST_SECTION, "download_timeout", 60)
+        ),
+        "retries": max(0, int(
+            safe_get(config, INGEST_SECTION, "download_retries", 3)
+        )),
+        "retry_delay": float(
+            safe_get(config, INGEST_SECTION, "download_retry_delay", 1)
+        ),
+        "chunk_size": max(1, int(
+            safe_get(config, INGEST_SECTION, "download_chunk_size", 1048576)
+        ))
+    }
+
+
 def get_ingest_config(config=None):
     config = config or get_ngeo_config()
 
@@ -225,5 +313,72 @@ def get_ingest_config(config=None):
         ),
         "regular_grid_clipping": safe_get(
             config, INGEST_SECTION, "regular_grid_clipping", "false"
-        ).lower() in ("true", "1", "on", "yes")
+        ).lower() in ("true", "1", "on", "yes"),
+        "deduplicate": safe_get(
+            config, INGEST_SECTION, "deduplicate", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "checkpoint": safe_get(
+            config, INGEST_SECTION, "checkpoint", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "checkpoint_timeout": max(0, int(
+            safe_get(config, INGEST_SECTION, "checkpoint_timeout", 3600)
+        )),
+        "report_timings": safe_get(
+            config, INGEST_SECTION, "report_timings", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "gcp_order_cache": safe_get(
+            config, INGEST_SECTION, "gcp_order_cache", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "lazy_pipeline": safe_get(
+            config, INGEST_SECTION, "lazy_pipeline", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "snap_to_grid": safe_get(
+            config, INGEST_SECTION, "snap_to_grid", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "resolution_cap": safe_get(
+            config, INGEST_SECTION, "resolution_cap", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "gcp_thinning": safe_get(
+            config, INGEST_SECTION, "gcp_thinning", "none"
+        ).lower(),
+        "gcp_max_count": max(4, int(
+            safe_get(config, INGEST_SECTION, "gcp_max_count", 256)
+        )),
+        "gcp_thinning_tolerance": max(0.0, float(
+            safe_get(config, INGEST_SECTION, "gcp_thinning_tolerance", 0.5)
+        )),
+        "workers": max(1, int(safe_get(config, INGEST_SECTION, "workers", 1))),
+        "commit_batch_size": max(1, int(
+            safe_get(config, INGEST_SECTION, "commit_batch_size", 1)
+        )),
+        "commit_interval": max(0.0, float(
+            safe_get(config, INGEST_SECTION, "commit_interval", 0)
+        )),
+        "prefetch": max(0, int(
+            safe_get(config, INGEST_SECTION, "prefetch", 0)
+        )),
+        "prefetch_budget": max(0, int(
+            safe_get(config, INGEST_SECTION, "prefetch_budget", 1024)
+        )) * 1024 * 1024
+    }
+
+
+def get_worker_config(config=None):
+    """ Returns the settings of the `ngeo_ingest_worker` command. """
+
+    config = config or get_ngeo_config()
+
+    spool_dir = safe_get(config, INGEST_SECTION, "spool_dir")
+
+    return {
+        "backend": safe_get(config, INGEST_SECTION, "worker_backend", "jobs"),
+        "processes": max(1, int(
+            safe_get(config, INGEST_SECTION, "worker_processes", 1)
+        )),
+        "spool_dir": get_project_relative_path(spool_dir) if spool_dir else None,
+        "redis_host": safe_get(config, INGEST_SECTION, "redis_host",
+                               "localhost"),
+        "redis_port": int(safe_get(config, INGEST_SECTION, "redis_port", 6379)),
+        "redis_queue": safe_get(config, INGEST_SECTION, "redis_queue",
+                                "ingest_queue")
     }
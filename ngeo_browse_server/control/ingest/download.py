@@ -0,0 +1,365 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Streaming download of remote browse images.
+
+Images are downloaded in chunks to a temporary file next to the target file,
+which is renamed once the download is complete. Interrupted downloads are
+resumed using HTTP range requests and connections are kept alive and reused
+per host.
+"""
+
+import os
+import re
+import socket
+import logging
+import httplib
+import urllib2
+from os.path import exists, getsize
+from urlparse import urlsplit, urljoin
+from threading import Lock
+from time import sleep
+
+from ngeo_browse_server.control.ingest.exceptions import IngestionException
+
+
+logger = logging.getLogger(__name__)
+
+
+PARTIAL_SUFFIX = ".part"
+
+MAX_REDIRECTS = 5
+
+CONTENT_RANGE_RE = re.compile(r"^\s*bytes\s+(\d+)-\d+/(\d+|\*)\s*$")
+
+
+class ConnectionPool(object):
+    """ Keeps idle HTTP(S) connections per host for later reuse. """
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = Lock()
+
+    def get(self, scheme, netloc, timeout):
+        with self._lock:
+            connections = self._idle.get((scheme, netloc))
+            if connections:
+                connection = connections.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection
+
+        if scheme == "https":
+            return httplib.HTTPSConnection(netloc, timeout=timeout)
+        return httplib.HTTPConnection(netloc, timeout=timeout)
+
+    def put(self, scheme, netloc, connection):
+        with self._lock:
+            connections = self._idle.setdefault((scheme, netloc), [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+pool = ConnectionPool()
+
+
+class RetryableError(Exception):
+    """ Error of a download attempt that may succeed when retried. The
+    `validator` of the data received so far is kept for resuming it.
+    """
+
+    validator = None
+
+
+def download(url, filename, timeout=60.0, retries=3, retry_delay=1.0,
+             chunk_size=1024 * 1024, stop=None):
+    """ Downloads the file at `url` to `filename`. The data is streamed in
+    chunks of `chunk_size` bytes to a temporary file which is renamed to
+    `filename` when completed. Failed attempts are retried `retries` times
+    with an exponentially increasing delay, resuming the download where
+    supported by the server. Raises an `IngestionException` when the download
+    finally fails or is cancelled by setting the optional `stop` event.
+    """
+
+    partial_filename = filename + PARTIAL_SUFFIX
+    if exists(partial_filename):
+        # the remote file may have changed since, so start over
+        logger.warn("Removing stale partial download '%s'." % partial_filename)
+        os.remove(partial_filename)
+
+    scheme = urlsplit(url).scheme.lower()
+    validator = None
+    attempt = 0
+
+    try:
+        while True:
+            try:
+                if scheme in ("http", "https"):
+                    validator = _download_http(
+                        url, partial_filename, timeout, chunk_size, validator,
+                        stop
+                    )
+                else:
+                    _download_url(url, partial_filename, timeout, chunk_size,
+                                  stop)
+                break
+
+            except RetryableError, e:
+                # only resume data of the same version of the remote file
+                if e.validator is not None:
+                    validator = e.validator
+
+                if attempt >= retries:
+                    raise IngestionException(
+                        "Error downloading '%s': %s" % (url, e),
+                        "DownloadError"
+                    )
+
+                delay = retry_delay * 2 ** attempt
+                attempt += 1
+                logger.warn("Error downloading '%s': %s. Retrying in %.1f "
+                            "seconds (%d/%d)." % (url, e, delay, attempt,
+                                                  retries))
+                if stop is not None:
+                    stop.wait(delay)
+                else:
+                    sleep(delay)
+                _check_stop(url, stop)
+
+        os.rename(partial_filename, filename)
+
+    except:
+        if exists(partial_filename):
+            os.remove(partial_filename)
+        raise
+
+    logger.info("Downloaded '%s' to '%s'." % (url, filename))
+
+
+def _download_http(url, filename, timeout, chunk_size, validator=None,
+                   stop=None):
+    """ Performs a single HTTP download attempt, resuming the data already
+    written to `filename`. Returns the validator (ETag or Last-Modified) of
+    the remote file, if available.
+    """
+
+    offset = getsize(filename) if exists(filename) else 0
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        scheme, netloc = parts.scheme.lower(), parts.netloc
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        headers = {}
+        if offset:
+            headers["Range"] = "bytes=%d-" % offset
+            if validator:
+                headers["If-Range"] = validator
+
+        connection, response = _request(scheme, netloc, path, headers, timeout)
+
+        if response.status in (301, 302, 303, 307, 308):
+            location = response.getheader("location")
+            _release(response, scheme, netloc, connection)
+            if not location:
+                raise IngestionException(
+                    "Redirect without location downloading '%s'." % url,
+                    "DownloadError"
+                )
+            url = urljoin(url, location)
+            continue
+
+        break
+
+    else:
+        connection.close()
+        raise IngestionException("Too many redirects downloading '%s'." % url,
+                                 "DownloadError")
+
+    try:
+        if response.status == 206:
+            start = _get_range_start(response)
+            if start == offset:
+                mode = "ab" if offset else "wb"
+            elif start == 0:
+                # the server sent the file from its beginning
+                mode = "wb"
+                offset = 0
+            else:
+                open(filename, "wb").close()
+                raise RetryableError("Unexpected content range '%s'"
+                                     % response.getheader("content-range"))
+        elif response.status == 200:
+            # range not supported or remote file changed
+            mode = "wb"
+            offset = 0
+        elif response.status == 416 and offset:
+            # nothing left to download
+            content_range = response.getheader("content-range", "")
+            if content_range == "bytes */%d" % offset:
+                _release(response, scheme, netloc, connection)
+                return validator
+            open(filename, "wb").close()
+            raise RetryableError("Requested range not satisfiable")
+        elif response.status >= 500:
+            raise RetryableError("HTTP error %d" % response.status)
+        else:
+            raise IngestionException(
+                "HTTP error downloading '%s': %d" % (url, response.status),
+                "DownloadError"
+            )
+
+        validator = (response.getheader("etag")
+                     or response.getheader("last-modified"))
+        length = response.getheader("content-length")
+        length = int(length) if length is not None else None
+
+        written = 0
+        with open(filename, mode) as f:
+            while True:
+                _check_stop(url, stop)
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                written += len(chunk)
+
+        if length is not None and written < length:
+            raise RetryableError("Incomplete read (%d of %d bytes)"
+                                 % (written, length))
+
+    except (socket.error, httplib.HTTPException), e:
+        connection.close()
+        error = RetryableError(str(e) or type(e).__name__)
+        error.validator = validator
+        raise error
+
+    except RetryableError, e:
+        connection.close()
+        e.validator = validator
+        raise
+
+    except:
+        connection.close()
+        raise
+
+    _release(response, scheme, netloc, connection)
+    logger.debug("Downloaded %d bytes from '%s'." % (offset + written, url))
+    return validator
+
+
+def _check_stop(url, stop):
+    """ Raises an `IngestionException` if the download was cancelled via the
+    `stop` event.
+    """
+
+    if stop is not None and stop.is_set():
+        raise IngestionException("Download of '%s' cancelled." % url,
+                                 "DownloadCancelled")
+
+
+def _get_range_start(response):
+    """ Returns the first byte position of the `Content-Range` of a partial
+    response or `None` if it is missing or malformed.
+    """
+
+    match = CONTENT_RANGE_RE.match(response.getheader("content-range") or "")
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def _request(scheme, netloc, path, headers, timeout):
+    """ Sends a GET request, using an idle connection of the pool if
+    available. Returns the connection and the response.
+    """
+
+    connection = pool.get(scheme, netloc, timeout)
+    # an idle connection may have been closed by the server in the meantime
+    reused = connection.sock is not None
+
+    try:
+        connection.request("GET", path, headers=headers)
+        return connection, connection.getresponse()
+    except (socket.error, httplib.HTTPException), e:
+        connection.close()
+        if reused:
+            return _request(scheme, netloc, path, headers, timeout)
+        raise RetryableError(str(e) or type(e).__name__)
+
+
+def _release(response, scheme, netloc, connection):
+    """ Returns the connection to the pool if it can be reused. """
+
+    try:
+        response.read()
+    except (socket.error, httplib.HTTPException):
+        connection.close()
+        return
+
+    if response.will_close:
+        connection.close()
+    else:
+        pool.put(scheme, netloc, connection)
+
+
+def _download_url(url, filename, timeout, chunk_size, stop=None):
+    """ Streams URLs of other schemes (e.g. FTP) without resuming. """
+
+    try:
+        remote = urllib2.urlopen(url, timeout=timeout)
+        try:
+            with open(filename, "wb") as f:
+                while True:
+                    _check_stop(url, stop)
+                    chunk = remote.read(chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        finally:
+            remote.close()
+
+    except urllib2.HTTPError, e:
+        raise IngestionException("HTTP error downloading '%s': %s"
+                                 % (url, e.code), "DownloadError")
+    except (urllib2.URLError, socket.error), e:
+        raise RetryableError(str(getattr(e, "reason", e)))
@@ -0,0 +1,134 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Statistics of the GCP transform orders tried for the browses of a browse
+layer. Browses of the same sensor usually fail with the same transforms, so
+an order which failed repeatedly for a similar number of GCPs is skipped
+instead of trying all orders starting with the most accurate one. Skipped
+orders are tried again from time to time, so that a run of outliers does not
+lower the accuracy for the layer permanently.
+"""
+
+import logging
+
+from ngeo_browse_server.control.models import GCPTransformOrder
+from ngeo_browse_server.metrics import record
+
+
+logger = logging.getLogger(__name__)
+
+
+# number of consecutive failures after which an order is skipped
+MAX_FAILURE_STREAK = 3
+
+# number of browses for which an order is skipped before it is tried again
+PROBE_INTERVAL = 10
+
+
+def gcp_bucket(num_gcps):
+    """ Returns the bucket of similar numbers of GCPs, i.e. the next lower
+    power of two.
+    """
+
+    return 1 << (max(1, num_gcps).bit_length() - 1)
+
+
+def get_gcp_orders(browse_layer):
+    """ Returns a dictionary of the GCP count buckets to dictionaries of the
+    orders to the tuple of their consecutive failures and the number of
+    browses they were skipped for since, for the browse layer.
+    """
+
+    gcp_orders = {}
+    for bucket, order, failure_streak, skipped in \
+            GCPTransformOrder.objects.filter(
+                browse_layer=browse_layer
+            ).values_list("bucket", "order", "failure_streak", "skipped"):
+        gcp_orders.setdefault(bucket, {})[order] = (failure_streak, skipped)
+    return gcp_orders
+
+
+def skip_order(statistics, order):
+    """ Returns whether the order is to be skipped, given the statistics of
+    the orders of a bucket as returned by `get_gcp_orders`. An order is
+    skipped once it failed `MAX_FAILURE_STREAK` times in a row, and tried
+    again after it was skipped for `PROBE_INTERVAL` browses.
+    """
+
+    failure_streak, skipped = statistics.get(order, (0, 0))
+    return failure_streak >= MAX_FAILURE_STREAK and skipped < PROBE_INTERVAL
+
+
+def record_gcp_attempts(browse_layer, attempts, gcp_orders=None, config=None):
+    """ Records the GCP transform attempts of a single browse, given as tuples
+    of the number of GCPs, the order, and whether it succeeded, or `None` if
+    it was skipped. The attempts are counted in the metrics. If the cache is
+    used, i.e. `gcp_orders` is given, the statistics of the orders are updated
+    in the database and in `gcp_orders`.
+    """
+
+    if not attempts:
+        return
+
+    labels = {"layer": browse_layer.id}
+    record(increments=[
+        ("ngeo_gcp_transform_attempts_total", dict(
+            labels, order=str(order),
+            outcome=("skipped" if succeeded is None else
+                     "success" if succeeded else "failure")
+        ), 1) for _, order, succeeded in attempts
+    ], config=config)
+
+    if gcp_orders is None:
+        return
+
+    bucket = gcp_bucket(attempts[0][0])
+    statistics = gcp_orders.setdefault(bucket, {})
+
+    for _, order, succeeded in attempts:
+        transform_order, _ = GCPTransformOrder.objects.get_or_create(
+            browse_layer=browse_layer, bucket=bucket, order=order
+        )
+        if succeeded is None:
+            transform_order.skipped += 1
+        elif succeeded:
+            transform_order.successes += 1
+            transform_order.failure_streak = 0
+            transform_order.skipped = 0
+        else:
+            transform_order.failures += 1
+            transform_order.failure_streak += 1
+            transform_order.skipped = 0
+            if transform_order.failure_streak == MAX_FAILURE_STREAK:
+                logger.debug("Skipping GCP transform order '%d' for browses "
+                             "with %d or more GCPs." % (order, bucket))
+        transform_order.save()
+
+        statistics[order] = (transform_order.failure_streak,
+                             transform_order.skipped)
@@ -0,0 +1,170 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Asynchronous ingestion of browse reports. Reports are stored as
+`IngestJob` and ingested by the `ngeo_ingest_worker` command.
+"""
+
+import logging
+import traceback
+
+from lxml import etree
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.utils.timezone import now
+from eoxserver.processing.preprocessing.exceptions import PreprocessingException
+
+from ngeo_browse_server.decoding import XMLDecodeError
+from ngeo_browse_server.config import models
+from ngeo_browse_server.config.browsereport.decoding import (
+    decode_browse_report, DecodingException
+)
+from ngeo_browse_server.control.models import IngestJob
+from ngeo_browse_server.control.ingest import ingest_browse_report
+from ngeo_browse_server.control.ingest.exceptions import IngestionException
+from ngeo_browse_server.lock import get_owner, is_owner_alive
+
+
+logger = logging.getLogger(__name__)
+
+
+def decode_report(document):
+    """ Decodes and validates the browse report of the given XML document.
+    Raises an `IngestionException` if the report cannot be ingested.
+    """
+
+    try:
+        parsed_browse_report = decode_browse_report(document.getroot())
+    except (XMLDecodeError, DecodingException), e:
+        raise IngestionException(str(e), "InvalidRequest")
+
+    if not models.BrowseLayer.objects.filter(
+            browse_type=parsed_browse_report.browse_type).exists():
+        raise IngestionException("Browse layer with browse type '%s' does "
+                                 "not exist." % parsed_browse_report.browse_type)
+
+    return parsed_browse_report
+
+
+def enqueue_ingest_job(document):
+    """ Validates the browse report of the given XML document and queues it
+    for ingestion. Returns the created `IngestJob`.
+    """
+
+    parsed_browse_report = decode_report(document)
+
+    job = IngestJob(report=etree.tostring(document),
+                    total=len(parsed_browse_report))
+    job.full_clean()
+    job.save()
+
+    logger.info("Queued ingest job %d for browse report with %d browse%s."
+                % (job.id, job.total, "s" if job.total != 1 else ""))
+    return job
+
+
+def claim_ingest_job():
+    """ Returns the oldest pending ingest job and marks it as running by the
+    current process, or `None` if there is none.
+    """
+
+    for job in IngestJob.objects.filter(status="pending").order_by("id"):
+        # make sure that no other worker claimed the job in the meantime
+        if IngestJob.objects.filter(id=job.id, status="pending").update(
+                status="running", started=now(), owner=get_owner()):
+            return IngestJob.objects.get(id=job.id)
+
+    return None
+
+
+def run_ingest_job(job, config=None):
+    """ Ingests the browse report of a claimed job and stores the ingestion
+    response. Returns `True` if the report was ingested.
+    """
+
+    def progress(processed, total):
+        IngestJob.objects.filter(id=job.id).update(processed=processed)
+
+    try:
+        parsed_browse_report = decode_report(
+            etree.fromstring(job.report.encode("utf-8")).getroottree()
+        )
+        try:
+            results = ingest_browse_report(parsed_browse_report, config=config,
+                                           progress=progress)
+        except PreprocessingException, e:
+            raise IngestionException(str(e))
+
+        job.response = render_to_string("control/ingest_response.xml",
+                                        {"results": results})
+        job.status = "finished"
+
+    except Exception, e:
+        logger.error("Ingest job %d failed: %s" % (job.id, e))
+        logger.debug(traceback.format_exc())
+        job.response = render_to_string("control/ingest_exception.xml", {
+            "code": getattr(e, "code", None) or type(e).__name__,
+            "message": str(e)
+        })
+        job.status = "failed"
+
+    job.processed = IngestJob.objects.get(id=job.id).processed
+    job.finished = now()
+    job.save()
+
+    return job.status == "finished"
+
+
+def reset_ingest_jobs(force=False):
+    """ Re-queues the running ingest jobs of workers whose process is gone,
+    e.g. because it was killed. With `force` all running jobs are re-queued,
+    which is only safe when no worker is running. Returns the number of
+    re-queued jobs.
+    """
+
+    jobs = IngestJob.objects.filter(status="running")
+    if not force:
+        owners = [
+            owner for owner in set(jobs.values_list("owner", flat=True))
+            if is_owner_alive(owner) is False
+        ]
+        jobs = jobs.filter(owner__in=owners)
+    return jobs.update(status="pending", processed=0, started=None, owner="")
+
+
+def get_ingest_queue_status():
+    """ Returns a dictionary with the number of pending and running ingest
+    jobs.
+    """
+
+    status = {"pending": 0, "running": 0}
+    for values in IngestJob.objects.filter(status__in=status.keys()) \
+            .values("status").annotate(count=Count("id")):
+        status[values["status"]] = values["count"]
+    return status
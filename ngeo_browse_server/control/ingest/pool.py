@@ -0,0 +1,110 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+import logging
+import traceback
+from multiprocessing import Pool
+
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+# per-process state of the pool workers, set up by `_init_worker`
+_worker_func = None
+_worker_items = None
+
+
+def _init_worker(func, items):
+    global _worker_func, _worker_items
+    _worker_func = func
+    _worker_items = items
+
+    # the database connections belong to the parent process, so they are
+    # dropped without closing them
+    for connection in connections.all():
+        connection.connection = None
+
+
+def _run_worker(index):
+    """ Runs the worker function for the item with the given index. Errors are
+    not propagated to the parent process, as the according item is processed
+    again sequentially.
+    """
+
+    try:
+        return _worker_func(_worker_items[index])
+    except Exception, e:
+        logger.warn("Parallel preprocessing of item %d failed: %s"
+                    % (index, str(e)))
+        logger.debug(traceback.format_exc() + "\n")
+        return None
+
+
+class PreprocessingPool(object):
+    """ Helper to run the preprocessing of several browses in a pool of
+    worker processes. Iterating over the pool yields the results in the same
+    order as the input items, while the workers are already processing the
+    following items. The worker processes are started with `start`, which
+    should be called before any database transaction is opened, and are
+    terminated with `close`.
+
+    The worker processes are forked, so neither the function nor the items
+    are required to be pickleable. The results are, so they should be plain
+    values. `None` is yielded for items that could not be processed. No
+    database access is possible in the worker processes.
+    """
+
+    def __init__(self, func, items, workers):
+        self._func = func
+        self._items = list(items)
+        self._workers = workers
+        self._pool = None
+
+    def start(self):
+        logger.info("Starting preprocessing pool with %d workers."
+                    % self._workers)
+        self._pool = Pool(self._workers, _init_worker,
+                          (self._func, self._items))
+
+    def __iter__(self):
+        if self._pool is None:
+            self.start()
+        return self._pool.imap(_run_worker, range(len(self._items)), 1)
+
+    def close(self):
+        """ Terminates the worker processes, as remaining results are not
+        needed anymore.
+        """
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
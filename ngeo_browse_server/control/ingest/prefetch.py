@@ -0,0 +1,150 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+import logging
+from os import remove
+from os.path import join, exists, getsize
+from threading import Thread, Condition, Event
+from uuid import uuid4
+
+from ngeo_browse_server.control.ingest.download import download
+
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher(object):
+    """ Downloads the given URLs in a background thread ahead of their
+    consumption. At most `lookahead` URLs are downloaded ahead and no new
+    download is started while the unconsumed files exceed `budget` bytes.
+    URLs have to be consumed via `get` in the given order. Files that were not
+    consumed are removed when the prefetcher is closed, which also cancels a
+    running download.
+    """
+
+    def __init__(self, urls, directory, lookahead=2, budget=1024 ** 3,
+                 download_config=None):
+        self.urls = list(urls)
+        self.directory = directory
+        self.lookahead = lookahead
+        self.budget = budget
+        self.download_config = download_config or {}
+
+        # index -> filename or None on failure
+        self._results = {}
+        self._sizes = {}
+        self._consumed = 0
+        self._closed = False
+        self._condition = Condition()
+        # cancels a running download
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get(self, url):
+        """ Waits for the prefetch of the next URL and returns the downloaded
+        file or `None` if the prefetch failed. The caller takes over the file.
+        """
+
+        if self._thread is None:
+            self.start()
+
+        with self._condition:
+            index = self._consumed
+            if index >= len(self.urls) or self.urls[index] != url:
+                logger.warn("Browse image '%s' was not expected to be "
+                            "prefetched next." % url)
+                return None
+
+            while index not in self._results:
+                if not self._thread.is_alive():
+                    return None
+                self._condition.wait(1.0)
+
+            filename = self._results.pop(index)
+            self._sizes.pop(index, None)
+            self._consumed += 1
+            self._condition.notify_all()
+            return filename
+
+    def close(self):
+        """ Stops prefetching and removes all unconsumed files. A running
+        download is cancelled and its partial file removed.
+        """
+
+        with self._condition:
+            self._closed = True
+            self._stop.set()
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        for filename in self._results.values():
+            if filename and exists(filename):
+                logger.info("Removing unused prefetched file '%s'." % filename)
+                remove(filename)
+        self._results.clear()
+        self._sizes.clear()
+
+    def _run(self):
+        for index, url in enumerate(self.urls):
+            with self._condition:
+                # wait until the download fits within the bounds
+                while not self._closed and (
+                        index - self._consumed >= self.lookahead or
+                        sum(self._sizes.values()) >= self.budget):
+                    self._condition.wait()
+
+                if self._closed:
+                    return
+
+            filename = join(self.directory, ".prefetch_%s" % uuid4().hex)
+            try:
+                logger.info("Prefetching browse image '%s'." % url)
+                download(url, filename, stop=self._stop,
+                         **self.download_config)
+                size = getsize(filename)
+            except Exception, e:
+                if self._stop.is_set():
+                    logger.info("Prefetching browse image '%s' cancelled."
+                                % url)
+                    return
+                logger.warn("Prefetching browse image '%s' failed: %s"
+                            % (url, e))
+                filename, size = None, 0
+
+            with self._condition:
+                self._results[index] = filename
+                self._sizes[index] = size
+                self._condition.notify_all()
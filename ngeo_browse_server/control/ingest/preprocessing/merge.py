@@ -346,7 +346,8 @@ class GDALDatasetMerger(object):
     def add_source(self, source):
         self.sources.append(source)
 
-    def merge(self, out_filename=None, out_driver=None, creation_options=None):
+    def merge(self, out_filename=None, out_driver=None, creation_options=None,
+              warp_options=None):
         if not self.sources:
             raise ValueError("No sources applied")
         target = self.target or GDALMergeTarget.from_sources(
@@ -355,7 +356,13 @@ class GDALDatasetMerger(object):
 
         for source in self.sources:
             with source:
-                gdal.ReprojectImage(source.dataset, target.dataset)
+                if warp_options:
+                    # e.g. NUM_THREADS to warp in multiple threads
+                    gdal.ReprojectImage(
+                        source.dataset, target.dataset, options=warp_options
+                    )
+                else:
+                    gdal.ReprojectImage(source.dataset, target.dataset)
 
         return target.dataset
 
@@ -366,24 +373,101 @@ class GDALDatasetMerger(object):
 ################################################################################
 
 
-def generate_footprint_wkt(ds, simplification_factor=2):
-    """ Generate a fooptrint from a raster, using black/no-data as exclusion
+# default maximum size in bytes of the arrays read at once for a data mask
+DEFAULT_MASK_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+def mask_size(ds, decimation=1):
+    """ Returns the size of the data mask of a dataset, when it is decimated by
+        the given factor.
+    """
+
+    return (int(math.ceil(ds.RasterXSize / float(decimation))),
+            int(math.ceil(ds.RasterYSize / float(decimation))))
+
+
+def mask_windows(ds, memory_budget=DEFAULT_MASK_MEMORY_BUDGET, decimation=1):
+    """ Splits the data mask of the dataset into windows of whole blocks, so
+        that the arrays of a single window required to compute the mask do not
+        exceed the memory budget in bytes. Yields the windows in mask pixel
+        coordinates as `Rect` objects.
+    """
+
+    size_x, size_y = mask_size(ds, decimation)
+    block_x, block_y = ds.GetRasterBand(1).GetBlockSize()
+    block_x = max(1, block_x // decimation)
+    block_y = max(1, block_y // decimation)
+
+    # the data of one band, the comparison result, and the mask
+    item_size = max(
+        np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(
+            ds.GetRasterBand(idx).DataType
+        )).itemsize
+        for idx in range(1, ds.RasterCount + 1)
+    )
+    pixels = max(1, memory_budget // (item_size + 2))
+
+    if pixels >= size_x:
+        # whole rows, aligned to the blocks if possible
+        window_x = size_x
+        window_y = min(size_y, max(1, pixels // size_x))
+        if window_y > block_y:
+            window_y -= window_y % block_y
+    else:
+        # parts of rows for very wide datasets
+        window_y = 1
+        window_x = pixels
+        if window_x > block_x:
+            window_x -= window_x % block_x
+
+    for offset_y in range(0, size_y, window_y):
+        for offset_x in range(0, size_x, window_x):
+            yield Rect(offset_x, offset_y,
+                       min(window_x, size_x - offset_x),
+                       min(window_y, size_y - offset_y))
+
+
+def write_data_mask(ds, mask_band, memory_budget=DEFAULT_MASK_MEMORY_BUDGET,
+                    decimation=1):
+    """ Writes the mask of all pixels with data, i.e. pixels not having the
+        no-data value (or 0) in at least one band, to the byte band. The
+        dataset is processed window by window within the memory budget.
+
+        With a decimation factor greater than 1, the mask is computed from the
+        dataset read at the reduced size returned by `mask_size`, i.e. with
+        nearest neighbour resampling or from a matching overview.
     """
 
-    # create an empty boolean array initialized as 'False' to store where
-    # values exist as a mask array.
-    nodata_map = np.zeros((ds.RasterYSize, ds.RasterXSize), dtype=np.bool)
+    bands = [ds.GetRasterBand(idx) for idx in range(1, ds.RasterCount + 1)]
+    nodata_values = [band.GetNoDataValue() for band in bands]
+
+    size_x, size_y = mask_size(ds, decimation)
+    scale_x = ds.RasterXSize / float(size_x)
+    scale_y = ds.RasterYSize / float(size_y)
+
+    for window in mask_windows(ds, memory_budget, decimation):
+        # the window of the dataset covered by the mask window
+        source = Rect(
+            int(round(window.offset_x * scale_x)),
+            int(round(window.offset_y * scale_y)),
+            upper_x=int(round(window.upper_x * scale_x)),
+            upper_y=int(round(window.upper_y * scale_y))
+        )
 
-    for idx in range(1, ds.RasterCount + 1):
-        band = ds.GetRasterBand(idx)
-        raster_data = band.ReadAsArray()
-        nodata = band.GetNoDataValue()
+        mask = np.zeros((window.size_y, window.size_x), dtype=np.uint8)
+        for band, nodata in zip(bands, nodata_values):
+            raster_data = band.ReadAsArray(
+                source.offset_x, source.offset_y, source.size_x,
+                source.size_y, window.size_x, window.size_y
+            )
+            mask |= (raster_data != (nodata if nodata is not None else 0))
+        mask_band.WriteArray(mask, *window.offset)
 
-        if nodata is None:
-            nodata = 0
 
-        # apply the output to the map
-        nodata_map |= (raster_data != nodata)
+def generate_footprint_wkt(ds, simplification_factor=2,
+                           memory_budget=DEFAULT_MASK_MEMORY_BUDGET):
+    """ Generate a fooptrint from a raster, using black/no-data as exclusion
+    """
 
     # create a temporary in-memory dataset and write the nodata mask
     # into its single band
@@ -391,7 +475,7 @@ def generate_footprint_wkt(ds, simplification_factor=2):
                            gdal.GDT_Byte) as tmp_ds:
         copy_projection(ds, tmp_ds)
         tmp_band = tmp_ds.GetRasterBand(1)
-        tmp_band.WriteArray(nodata_map.astype(np.uint8))
+        write_data_mask(ds, tmp_band, memory_budget)
 
         # create an OGR in memory layer to hold the created polygon
         sr = osr.SpatialReference()
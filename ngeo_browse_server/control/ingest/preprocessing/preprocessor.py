@@ -26,7 +26,11 @@
 # THE SOFTWARE.
 #-------------------------------------------------------------------------------
 
+import os
+import math
 import logging
+import tempfile
+from contextlib import contextmanager
 
 from django.contrib.gis.geos import (
     GEOSGeometry, MultiPolygon, Polygon, LinearRing,
@@ -40,11 +44,23 @@ from eoxserver.processing.preprocessing.util import (
     create_mem_copy, create_mem, copy_metadata, cleanup_temp
 )
 from eoxserver.processing.gdal import reftools
+from eoxserver.processing.preprocessing.georeference import GCPList
 from eoxserver.processing.preprocessing.exceptions import GCPTransformException
 from eoxserver.resources.coverages.geo import getExtentFromRectifiedDS
 
+from ngeo_browse_server.control.ingest.timing import NullTimer
+from ngeo_browse_server.control.ingest.gcporders import (
+    gcp_bucket, skip_order
+)
+from ngeo_browse_server.control.ingest.preprocessing.statistics import (
+    approximate_min_max
+)
+from ngeo_browse_server.mapcache.grids import (
+    nearest_level, level_resolution, snap_extent
+)
 from ngeo_browse_server.control.ingest.preprocessing.merge import (
-    GDALDatasetMerger, GDALGeometryMaskMergeSource
+    GDALDatasetMerger, GDALGeometryMaskMergeSource, write_data_mask,
+    mask_size, DEFAULT_MASK_MEMORY_BUDGET
 )
 
 
@@ -54,6 +70,17 @@ logger = logging.getLogger(__name__)
 # enum for bandmode
 RGB = range(3)
 
+# block sizes of cloud optimized GeoTIFFs matching the tile grids
+COG_BLOCK_SIZES = (256, 512)
+
+# creation options determined by the cloud optimized layout
+COG_CREATION_OPTIONS = (
+    "TILED", "BLOCKXSIZE", "BLOCKYSIZE", "COPY_SRC_OVERVIEWS"
+)
+
+# number of pixels sampled per band for approximate statistics
+DEFAULT_STATISTICS_SAMPLE_SIZE = 256 * 256
+
 
 class NGEOPreProcessor(WMSPreProcessor):
 
@@ -63,7 +90,14 @@ class NGEOPreProcessor(WMSPreProcessor):
                  overview_resampling=None, overview_levels=None,
                  overview_minsize=None, radiometric_interval_min=None,
                  radiometric_interval_max=None, sieve_max_threshold=None,
-                 simplification_factor=None, temporary_directory=None):
+                 simplification_factor=None, temporary_directory=None,
+                 footprint_memory_budget=None, footprint_decimation=False,
+                 gcp_footprint=False, lazy_pipeline=False, cog=False,
+                 cog_block_size=256, num_threads=None, cache_max=None,
+                 gcp_orders=None, warp_error_threshold=0, tile_grid=None,
+                 map_levels=(None, None), approximate_statistics=False,
+                 statistics_sample_size=DEFAULT_STATISTICS_SAMPLE_SIZE,
+                 statistics_percentile=0):
 
         self.format_selection = format_selection
         self.overviews = overviews
@@ -95,13 +129,166 @@ class NGEOPreProcessor(WMSPreProcessor):
 
         self.temporary_directory = temporary_directory
 
+        if footprint_memory_budget is not None:
+            self.footprint_memory_budget = footprint_memory_budget
+        else:
+            self.footprint_memory_budget = DEFAULT_MASK_MEMORY_BUDGET
+
+        self.footprint_decimation = footprint_decimation
+        self.gcp_footprint = gcp_footprint
+        self.lazy_pipeline = lazy_pipeline
+
+        if cog_block_size not in COG_BLOCK_SIZES:
+            raise ValueError(
+                "Invalid block size %d for cloud optimized GeoTIFFs. Must be "
+                "one of %s." % (
+                    cog_block_size, ", ".join(map(str, COG_BLOCK_SIZES))
+                )
+            )
+        self.cog = cog
+        self.cog_block_size = cog_block_size
+
+        # number of threads used by GDAL, either an integer or "ALL_CPUS"
+        self.num_threads = num_threads
+        # size of the GDAL block cache in bytes
+        self.cache_max = cache_max
+
+        # GCP count buckets to the transform order to try first
+        self.gcp_orders = gcp_orders
+
+        # maximum error in pixels when approximating the GCP transformer
+        self.warp_error_threshold = warp_error_threshold
+
+        # the `Grid` and the lowest and highest zoom level to snap the
+        # georeferenced image to
+        self.tile_grid = tile_grid
+        self.map_levels = map_levels
+
+        # compute "min" and "max" of the bands from a sample of the pixels,
+        # optionally clipped to a percentile
+        if not 0 <= statistics_percentile < 50:
+            raise ValueError(
+                "Invalid statistics percentile %s. Must be at least 0 and "
+                "less than 50." % statistics_percentile
+            )
+        self.approximate_statistics = approximate_statistics
+        self.statistics_sample_size = statistics_sample_size
+        self.statistics_percentile = statistics_percentile
+
+    def get_creation_options(self):
+        """ Returns the creation options of the optimized file. Cloud optimized
+        GeoTIFFs are tiled with the configured block size and the overviews are
+        copied from the source dataset, so they are written before the image.
+        """
+
+        options = list(self.format_selection.creation_options)
+        if self.cog:
+            options = [
+                option for option in options
+                if option.split("=", 1)[0].upper() not in COG_CREATION_OPTIONS
+            ]
+            options.extend([
+                "TILED=YES",
+                "BLOCKXSIZE=%d" % self.cog_block_size,
+                "BLOCKYSIZE=%d" % self.cog_block_size,
+                "COPY_SRC_OVERVIEWS=YES"
+            ])
+        if self.num_threads:
+            # compress the blocks in multiple threads
+            options = [
+                option for option in options
+                if option.split("=", 1)[0].upper() != "NUM_THREADS"
+            ]
+            options.append("NUM_THREADS=%s" % self.num_threads)
+        return options
+
+    def get_optimizations(self, ds):
+        """ Returns the optimizations for the dataset. With approximate
+        statistics the "min" and "max" of the band selection are replaced by
+        the values sampled from the dataset, so the band selection does not
+        compute them in a full pass over each band.
+        """
+
+        if not self.approximate_statistics or not self.bands:
+            return super(NGEOPreProcessor, self).get_optimizations(ds)
+
+        # the band selection is read from the instance, which is reused for
+        # all browses of a layer, so it is only replaced temporarily
+        bands = self.bands
+        self.bands = self._approximate_bands(ds)
+        try:
+            return list(super(NGEOPreProcessor, self).get_optimizations(ds))
+        finally:
+            self.bands = bands
+
+    def _approximate_bands(self, ds):
+        """ Returns the band selection with "min" and "max" replaced by their
+        approximate values.
+        """
+
+        bands = []
+        for index, band_min, band_max in self.bands:
+            if index > 0 and (band_min == "min" or band_max == "max"):
+                values = approximate_min_max(
+                    ds.GetRasterBand(index), self.statistics_sample_size,
+                    self.statistics_percentile
+                )
+                if values is not None:
+                    logger.debug("Approximate statistics of band %d: %s"
+                                 % (index, values))
+                    if band_min == "min":
+                        band_min = values[0]
+                    if band_max == "max":
+                        band_max = values[1]
+            bands.append((index, band_min, band_max))
+        return bands
+
+    def get_warp_options(self):
+        """ Returns the warp options used when merging and warping. """
+
+        if self.num_threads:
+            return ["NUM_THREADS=%s" % self.num_threads]
+        return []
+
     def process(self, input_filename, output_filename,
                 geo_reference=None, generate_metadata=True,
-                merge_with=None, original_footprint=None):
+                merge_with=None, original_footprint=None, timer=None,
+                gcp_attempts=None, reduction=1):
+        """ Processes the input file to the output file. The time spent in
+        the single stages is recorded with the optional `StageTimer`. The GCP
+        transform orders tried are appended to the optional `gcp_attempts`
+        list as tuples of the number of GCPs, the order, and whether it
+        succeeded. With a `reduction` factor greater than one the input is
+        decoded at a correspondingly reduced resolution, the pixel
+        coordinates of the `geo_reference` have to refer to the reduced size
+        as returned by `reduced_size`.
+        """
+
+        with gdal_settings(self.num_threads, self.cache_max):
+            return self._process(
+                input_filename, output_filename, geo_reference,
+                generate_metadata, merge_with, original_footprint, timer,
+                gcp_attempts, reduction
+            )
+
+    def _process(self, input_filename, output_filename, geo_reference,
+                 generate_metadata, merge_with, original_footprint, timer,
+                 gcp_attempts, reduction=1):
+        if timer is None:
+            timer = NullTimer()
 
         # open the dataset and create an In-Memory Dataset as copy
-        # to perform optimizations
-        ds = create_mem_copy(gdal.Open(input_filename))
+        # to perform optimizations. In the lazy pipeline a VRT referencing the
+        # input file is used instead, so the pixels are only read when written
+        with timer.stage("open"):
+            if reduction > 1:
+                logger.info("Decoding the input at 1/%d of its resolution."
+                            % reduction)
+                ds = create_reduced_copy(gdal.Open(input_filename), reduction)
+            elif self.lazy_pipeline:
+                ds = create_vrt_copy(gdal.Open(input_filename))
+            else:
+                ds = create_mem_copy(gdal.Open(input_filename))
 
         gt = ds.GetGeoTransform()
         footprint_wkt = None
@@ -109,198 +296,338 @@ class NGEOPreProcessor(WMSPreProcessor):
         if not geo_reference:
             if gt == (0.0, 1.0, 0.0, 0.0, 0.0, 1.0):
                 if ds.GetGCPCount() > 0:
-                    geo_reference = InternalGCPs()
+                    geo_reference = InternalGCPs(
+                        lazy=self.lazy_pipeline,
+                        warp_options=self.get_warp_options()
+                    )
                 else:
                     raise ValueError("No geospatial reference for "
                                      "unreferenced dataset given.")
 
+        if isinstance(geo_reference, InternalGCPs):
+            # e.g. the number of threads for GCP lists of the ingestion
+            if geo_reference.warp_options is None:
+                geo_reference.warp_options = self.get_warp_options()
+            geo_reference.order_statistics = self.gcp_orders or {}
+            geo_reference.error_threshold = self.warp_error_threshold
+            if gcp_attempts is not None:
+                geo_reference.attempts = gcp_attempts
+            # warp directly to the tile grid, so the image is only resampled
+            # once
+            if self.tile_grid is not None:
+                geo_reference.srid = self.tile_grid.srid
+                geo_reference.output_grid = self._get_snapped_grid
+
+        # whether the footprint is the hull of the GCPs transformed with the
+        # same exact transformer as the image, i.e. known to be filled by it
+        gcp_footprint = False
+
         if geo_reference:
             logger.debug("Applying geo reference '%s'."
                          % type(geo_reference).__name__)
+            src_ds = ds
             # footprint is always in EPSG:4326
-            ds, footprint_wkt = geo_reference.apply(ds)
+            with timer.stage("georef"):
+                ds, footprint_wkt = geo_reference.apply(ds)
+
+            if self.gcp_footprint and \
+                    isinstance(geo_reference, (GCPList, InternalGCPs)):
+                gcp_footprint = bool(
+                    footprint_wkt and
+                    isinstance(geo_reference, InternalGCPs) and
+                    not geo_reference.error_threshold
+                )
+                if not footprint_wkt:
+                    with timer.stage("footprint"):
+                        footprint_wkt = reftools.get_footprint_wkt(
+                            src_ds, **reftools.suggest_transformer(src_ds)
+                        )
+            src_ds = None
+
+        if (self.tile_grid is not None and
+                not isinstance(geo_reference, InternalGCPs)):
+            with timer.stage("georef"):
+                ds = self._snap_to_grid(ds)
 
         # apply optimizations
-        for optimization in self.get_optimizations(ds):
-            logger.debug("Applying optimization '%s'."
-                         % type(optimization).__name__)
+        with timer.stage("optimizations"):
+            for optimization in self.get_optimizations(ds):
+                logger.debug("Applying optimization '%s'."
+                             % type(optimization).__name__)
 
-            try:
-                new_ds = optimization(ds)
-
-                if new_ds is not ds:
-                    # cleanup afterwards
-                    cleanup_temp(ds)
-                    ds = new_ds
-            except:
-                cleanup_temp(ds)
-                raise
-
-
-        # generate the footprint from the dataset
-        if not footprint_wkt:
-            logger.debug("Generating footprint.")
-            footprint_wkt = self._generate_footprint_wkt(ds)
-        # check that footprint is inside of extent of generated image
-        # regenerate otherwise
-        else:
-            tmp_extent = getExtentFromRectifiedDS(ds)
-            tmp_bbox = Polygon.from_bbox((tmp_extent[0], tmp_extent[1],
-                                          tmp_extent[2], tmp_extent[3]))
-            # transform image bbox to EPSG:4326 if necessary
-            proj = ds.GetProjection()
-            srs = osr.SpatialReference()
-            try:
-                srs.ImportFromWkt(proj)
-                srs.AutoIdentifyEPSG()
-                ptype = "PROJCS" if srs.IsProjected() else "GEOGCS"
-                srid = int(srs.GetAuthorityCode(ptype))
-                if srid != '4326':
-                    out_srs = osr.SpatialReference()
-                    out_srs.ImportFromEPSG(4326)
-                    transform = osr.CoordinateTransformation(srs, out_srs)
-                    tmp_bbox2 = ogr.CreateGeometryFromWkt(tmp_bbox.wkt)
-                    tmp_bbox2.Transform(transform)
-                    tmp_bbox = GEOSGeometry(tmp_bbox2.ExportToWkt())
-            except (RuntimeError, TypeError), e:
-                logger.warn("Projection: %s" % proj)
-                logger.warn("Failed to identify projection's EPSG code."
-                    "%s: %s" % ( type(e).__name__ , str(e) ) )
-
-            tmp_footprint = GEOSGeometry(footprint_wkt)
-            if not tmp_bbox.contains(tmp_footprint):
-                logger.debug("Re-generating footprint because not inside of "
-                             "generated image.")
-                footprint_wkt = tmp_footprint.intersection(tmp_bbox).wkt
+                try:
+                    new_ds = optimization(ds)
+
+                    if new_ds is not ds:
+                        # cleanup afterwards
+                        cleanup_dataset(ds)
+                        ds = new_ds
+                except:
+                    cleanup_dataset(ds)
+                    raise
+
+        with timer.stage("footprint"):
+            # generate the footprint from the dataset
+            if not footprint_wkt:
+                logger.debug("Generating footprint.")
+                footprint_wkt = self._generate_footprint_wkt(ds)
+            # the image was warped with the transformer of the GCP hull, so
+            # the data is known to fill the footprint
+            elif gcp_footprint:
+                logger.debug("Using the footprint of the GCP hull.")
+            # check that footprint is inside of extent of generated image
+            # regenerate otherwise
+            else:
+                tmp_extent = getExtentFromRectifiedDS(ds)
+                tmp_bbox = Polygon.from_bbox((tmp_extent[0], tmp_extent[1],
+                                              tmp_extent[2], tmp_extent[3]))
+                # transform image bbox to EPSG:4326 if necessary
+                proj = ds.GetProjection()
+                srs = osr.SpatialReference()
+                try:
+                    srs.ImportFromWkt(proj)
+                    srs.AutoIdentifyEPSG()
+                    ptype = "PROJCS" if srs.IsProjected() else "GEOGCS"
+                    srid = int(srs.GetAuthorityCode(ptype))
+                    if srid != '4326':
+                        out_srs = osr.SpatialReference()
+                        out_srs.ImportFromEPSG(4326)
+                        transform = osr.CoordinateTransformation(srs, out_srs)
+                        tmp_bbox2 = ogr.CreateGeometryFromWkt(tmp_bbox.wkt)
+                        tmp_bbox2.Transform(transform)
+                        tmp_bbox = GEOSGeometry(tmp_bbox2.ExportToWkt())
+                except (RuntimeError, TypeError), e:
+                    logger.warn("Projection: %s" % proj)
+                    logger.warn("Failed to identify projection's EPSG code."
+                        "%s: %s" % ( type(e).__name__ , str(e) ) )
+
+                tmp_footprint = GEOSGeometry(footprint_wkt)
+                if not tmp_bbox.contains(tmp_footprint):
+                    logger.debug("Re-generating footprint because not inside of "
+                                 "generated image.")
+                    footprint_wkt = tmp_footprint.intersection(tmp_bbox).wkt
 
         if self.footprint_alpha:
             logger.debug("Applying optimization 'AlphaBandOptimization'.")
             opt = AlphaBandOptimization()
-            opt(ds, footprint_wkt)
+            with timer.stage("optimizations"):
+                # the alpha band is burned into the dataset, which requires
+                # the pixels to be materialized
+                if is_vrt(ds):
+                    ds = create_mem_copy(ds)
+                opt(ds, footprint_wkt)
 
         output_filename = self.generate_filename(output_filename)
+        creation_options = self.get_creation_options()
 
-        if merge_with is not None:
-            if original_footprint is None:
-                raise ValueError(
-                    "Original footprint with to be merged image required."
-                )
-
-            original_ds = gdal.Open(merge_with, gdal.GA_Update)
-            merger = GDALDatasetMerger([
-                GDALGeometryMaskMergeSource(
-                    original_ds, original_footprint,
-                    temporary_directory=self.temporary_directory
-                ),
-                GDALGeometryMaskMergeSource(
-                    ds, footprint_wkt,
-                    temporary_directory=self.temporary_directory
-                )
-            ])
+        with timer.stage("write"):
+            if merge_with is not None:
+                if original_footprint is None:
+                    raise ValueError(
+                        "Original footprint with to be merged image required."
+                    )
 
-            final_ds = merger.merge(
-                output_filename, self.format_selection.driver_name,
-                self.format_selection.creation_options
-            )
+                original_ds = gdal.Open(merge_with, gdal.GA_Update)
+                merger = GDALDatasetMerger([
+                    GDALGeometryMaskMergeSource(
+                        original_ds, original_footprint,
+                        temporary_directory=self.temporary_directory
+                    ),
+                    GDALGeometryMaskMergeSource(
+                        ds, footprint_wkt,
+                        temporary_directory=self.temporary_directory
+                    )
+                ])
 
-            # cleanup previous file
-            driver = original_ds.GetDriver()
-            original_ds = None
-            driver.Delete(merge_with)
+                if self.cog:
+                    # merge in memory, the file is written with its
+                    # overviews afterwards
+                    final_ds = merger.merge(
+                        "", "MEM", warp_options=self.get_warp_options()
+                    )
+                else:
+                    final_ds = merger.merge(
+                        output_filename, self.format_selection.driver_name,
+                        creation_options, self.get_warp_options()
+                    )
 
-            cleanup_temp(ds)
+                # cleanup previous file
+                driver = original_ds.GetDriver()
+                original_ds = None
+                driver.Delete(merge_with)
 
-        else:
-            logger.debug(
-                "Writing single file '%s' using options: %s."
-                % (
-                    output_filename,
-                    ", ".join(self.format_selection.creation_options)
-                )
-            )
-            logger.debug("Metadata tags to be written: %s"
-                         % ", ".join(ds.GetMetadata_List("") or []))
-
-            # save the file to the disc
-            driver = gdal.GetDriverByName(self.format_selection.driver_name)
-            final_ds = driver.CreateCopy(
-                output_filename, ds,
-                options=self.format_selection.creation_options
-            )
+                cleanup_dataset(ds)
 
-            # cleanup
-            cleanup_temp(ds)
+            elif self.cog:
+                # the overviews are built on a temporary file, not in memory,
+                # and copied in one pass together with the image
+                if is_vrt(ds):
+                    final_ds = create_temp_copy(ds, self.temporary_directory)
+                else:
+                    final_ds = ds
 
-        for optimization in self.get_post_optimizations(final_ds):
-            logger.debug("Applying post-optimization '%s'."
-                         % type(optimization).__name__)
-            optimization(final_ds)
+            else:
+                logger.debug(
+                    "Writing single file '%s' using options: %s."
+                    % (output_filename, ", ".join(creation_options))
+                )
+                logger.debug("Metadata tags to be written: %s"
+                             % ", ".join(ds.GetMetadata_List("") or []))
 
-        # generate metadata if requested
-        footprint = None
-        if generate_metadata:
-            normalized_space = Polygon.from_bbox((-180, -90, 180, 90))
-            non_normalized_space = Polygon.from_bbox((180, -90, 360, 90))
+                # save the file to the disc
+                driver = gdal.GetDriverByName(self.format_selection.driver_name)
+                final_ds = driver.CreateCopy(
+                    output_filename, ds, options=creation_options
+                )
 
-            footprint = GEOSGeometry(footprint_wkt)
+                # cleanup
+                cleanup_dataset(ds)
 
-            outer = non_normalized_space.intersection(footprint)
+        with timer.stage("optimizations"):
+            for optimization in self.get_post_optimizations(final_ds):
+                logger.debug("Applying post-optimization '%s'."
+                             % type(optimization).__name__)
+                optimization(final_ds)
 
-            if len(outer):
-                footprint = MultiPolygon(
-                    *map(lambda p:
-                        Polygon(*map(lambda ls:
-                            LinearRing(*map(lambda point:
-                                (point[0] - 360, point[1]), ls.coords
-                            )), tuple(p)
-                        )), (outer,)
-                    )
-                ).union(normalized_space.intersection(footprint))
-            else:
-                if isinstance(footprint, Polygon):
-                    footprint = MultiPolygon(footprint)
+        if self.cog:
+            with timer.stage("write"):
+                logger.debug(
+                    "Writing cloud optimized file '%s' using options: %s."
+                    % (output_filename, ", ".join(creation_options))
+                )
+                mem_ds = final_ds
+                driver = gdal.GetDriverByName(self.format_selection.driver_name)
+                final_ds = driver.CreateCopy(
+                    output_filename, mem_ds, options=creation_options
+                )
+                cleanup_dataset(mem_ds)
+                mem_ds = None
+
+        with timer.stage("footprint"):
+            # generate metadata if requested
+            footprint = None
+            if generate_metadata:
+                normalized_space = Polygon.from_bbox((-180, -90, 180, 90))
+                non_normalized_space = Polygon.from_bbox((180, -90, 360, 90))
+
+                footprint = GEOSGeometry(footprint_wkt)
+
+                outer = non_normalized_space.intersection(footprint)
+
+                if len(outer):
+                    footprint = MultiPolygon(
+                        *map(lambda p:
+                            Polygon(*map(lambda ls:
+                                LinearRing(*map(lambda point:
+                                    (point[0] - 360, point[1]), ls.coords
+                                )), tuple(p)
+                            )), (outer,)
+                        )
+                    ).union(normalized_space.intersection(footprint))
+                else:
+                    if isinstance(footprint, Polygon):
+                        footprint = MultiPolygon(footprint)
 
-            if original_footprint:
-                logger.debug("Merging footprint.")
-                footprint = footprint.union(GEOSGeometry(original_footprint))
+                if original_footprint:
+                    logger.debug("Merging footprint.")
+                    footprint = footprint.union(GEOSGeometry(original_footprint))
 
-            logger.debug("Calculated Footprint: '%s'" % footprint.wkt)
+                logger.debug("Calculated Footprint: '%s'" % footprint.wkt)
 
         num_bands = final_ds.RasterCount
 
         # finally close the dataset and write it to the disc
-        final_ds = None
+        with timer.stage("write"):
+            final_ds = None
 
         return PreProcessResult(output_filename, footprint, num_bands)
 
-    def _generate_footprint_wkt(self, ds):
-        """ Generate a footprint from a raster, using black/no-data as
-            exclusion
+    def _snap_to_grid(self, ds):
+        """ Warps the dataset to the CRS of the tile grid, with the pixel size
+        of the nearest zoom level and the pixels aligned to the tiles, so the
+        tiles are rendered without resampling.
         """
 
-        # create an empty boolean array initialized as 'False' to store where
-        # values exist as a mask array.
-        nodata_map = numpy.zeros((ds.RasterYSize, ds.RasterXSize),
-                                 dtype=numpy.bool)
+        # gdal.Warp() is available since GDAL 2.1
+        if not hasattr(gdal, "Warp"):
+            logger.warn("Snapping to the tile grid requires GDAL 2.1.")
+            return ds
 
-        for idx in range(1, ds.RasterCount + 1):
-            band = ds.GetRasterBand(idx)
-            raster_data = band.ReadAsArray()
-            nodata = band.GetNoDataValue()
+        dst_sr = osr.SpatialReference()
+        dst_sr.ImportFromEPSG(self.tile_grid.srid)
+
+        # the suggested output of the warp to the CRS of the grid
+        vrt_ds = gdal.AutoCreateWarpedVRT(ds, None, dst_sr.ExportToWkt())
+        size_x, size_y, gt = self._get_snapped_grid(
+            vrt_ds.RasterXSize, vrt_ds.RasterYSize, vrt_ds.GetGeoTransform()
+        )
+        vrt_ds = None
+
+        options = self.get_warp_options()
+        snapped_ds = gdal.Warp(
+            "", ds, format="VRT" if is_vrt(ds) else "MEM",
+            dstSRS=dst_sr.ExportToWkt(),
+            outputBounds=(
+                gt[0], gt[3] + size_y * gt[5], gt[0] + size_x * gt[1], gt[3]
+            ),
+            xRes=gt[1], yRes=gt[1],
+            multithread=bool(options), warpOptions=options
+        )
+        copy_metadata(ds, snapped_ds)
+        cleanup_dataset(ds)
+        return snapped_ds
+
+    def _get_snapped_grid(self, size_x, size_y, gt):
+        """ Returns the size and geotransform of the output grid snapped to
+        the tile grid, for the suggested output grid in the CRS of the tile
+        grid.
+        """
+
+        extent = (
+            gt[0], gt[3] + size_y * gt[5], gt[0] + size_x * gt[1], gt[3]
+        )
 
-            if nodata is None:
-                nodata = 0
+        level = nearest_level(self.tile_grid, abs(gt[1]), *self.map_levels)
+        resolution = level_resolution(self.tile_grid, level)
+        logger.debug("Snapping to zoom level %d with a pixel size of %f."
+                     % (level, resolution))
 
-            # apply the output to the map
-            nodata_map |= (raster_data != nodata)
+        minx, miny, maxx, maxy = snap_extent(self.tile_grid, extent, resolution)
+        return (
+            int(round((maxx - minx) / resolution)),
+            int(round((maxy - miny) / resolution)),
+            (minx, resolution, 0.0, maxy, 0.0, -resolution)
+        )
+
+    def _generate_footprint_wkt(self, ds):
+        """ Generate a footprint from a raster, using black/no-data as
+            exclusion
+        """
+
+        # the footprint is simplified with a tolerance of
+        # `simplification_factor` pixels anyway, so the mask may optionally be
+        # computed with pixels of up to that size
+        decimation = 1
+        if self.footprint_decimation:
+            decimation = max(1, int(self.simplification_factor))
+        size_x, size_y = mask_size(ds, decimation)
 
         # create a temporary in-memory dataset and write the nodata mask
-        # into its single band
-        tmp_ds = create_mem(ds.RasterXSize + 2, ds.RasterYSize + 2, 1,
-                            gdal.GDT_Byte)
+        # into its single band, window by window
+        tmp_ds = create_mem(size_x + 2, size_y + 2, 1, gdal.GDT_Byte)
         copy_projection(ds, tmp_ds)
+        if decimation > 1:
+            logger.debug("Generating footprint from mask decimated by %d."
+                         % decimation)
+            gt = ds.GetGeoTransform()
+            scale_x = ds.RasterXSize / float(size_x)
+            scale_y = ds.RasterYSize / float(size_y)
+            tmp_ds.SetGeoTransform((
+                gt[0], gt[1] * scale_x, gt[2] * scale_y,
+                gt[3], gt[4] * scale_x, gt[5] * scale_y
+            ))
         tmp_band = tmp_ds.GetRasterBand(1)
-        tmp_band.WriteArray(nodata_map.astype(numpy.uint8))
+        write_data_mask(ds, tmp_band, self.footprint_memory_budget, decimation)
 
         # Remove unwanted small areas of nodata
         # www.gdal.org/gdal__alg_8h.html#a33309c0a316b223bd33ae5753cc7f616
@@ -308,7 +635,10 @@ class NGEOPreProcessor(WMSPreProcessor):
         threshold = 4
         max_threshold = (no_pixels / 16)
         if self.sieve_max_threshold > 0:
-            max_threshold = self.sieve_max_threshold
+            # the threshold is given in pixels of the full resolution
+            max_threshold = max(
+                1, self.sieve_max_threshold / (decimation * decimation)
+            )
         while threshold <= max_threshold and threshold < 2147483647:
             gdal.SieveFilter(tmp_band, None, tmp_band, threshold, 4)
             threshold *= 4
@@ -393,9 +723,207 @@ class NGEOPreProcessor(WMSPreProcessor):
         return geometry.ExportToWkt()
 
 
+@contextmanager
+def gdal_settings(num_threads=None, cache_max=None):
+    """ Context manager to let GDAL use the given number of threads for
+    warping, building overviews, and compressing within the enclosed block.
+    The size in bytes of the block cache, which is shared by the whole
+    process, is set as well and restored afterwards if it was changed.
+    """
+
+    previous_cache_max = None
+    if cache_max and gdal.GetCacheMax() != cache_max:
+        previous_cache_max = gdal.GetCacheMax()
+        gdal.SetCacheMax(cache_max)
+
+    # the option is set per thread where possible, as browses may be
+    # ingested in parallel
+    set_option = getattr(
+        gdal, "SetThreadLocalConfigOption", gdal.SetConfigOption
+    )
+    previous = gdal.GetConfigOption("GDAL_NUM_THREADS")
+    if num_threads:
+        set_option("GDAL_NUM_THREADS", str(num_threads))
+    try:
+        yield
+    finally:
+        if num_threads:
+            set_option("GDAL_NUM_THREADS", previous)
+        if previous_cache_max is not None:
+            gdal.SetCacheMax(previous_cache_max)
+
+
+def reduced_size(size_x, size_y, reduction):
+    """ Returns the size of an image reduced by the given factor. """
+    return (int(math.ceil(size_x / float(reduction))),
+            int(math.ceil(size_y / float(reduction))))
+
+
+def create_reduced_copy(src_ds, reduction):
+    """ Returns an In-Memory copy of the dataset reduced by the given factor.
+    GDAL reads the pixels from the overviews or reduced resolution levels of
+    the format where available, e.g. the resolution levels of JPEG 2000 or
+    the DCT scaling of JPEG, so the input is never decoded at full
+    resolution in these cases. The geotransform and the GCPs are scaled
+    accordingly.
+    """
+
+    size_x, size_y = src_ds.RasterXSize, src_ds.RasterYSize
+    dst_size_x, dst_size_y = reduced_size(size_x, size_y, reduction)
+    scale_x = dst_size_x / float(size_x)
+    scale_y = dst_size_y / float(size_y)
+
+    dst_ds = create_mem(
+        dst_size_x, dst_size_y, src_ds.RasterCount,
+        src_ds.GetRasterBand(1).DataType
+    )
+
+    for index in range(1, src_ds.RasterCount + 1):
+        src_band = src_ds.GetRasterBand(index)
+        dst_band = dst_ds.GetRasterBand(index)
+        dst_band.WriteRaster(
+            0, 0, dst_size_x, dst_size_y,
+            src_band.ReadRaster(0, 0, size_x, size_y, dst_size_x, dst_size_y)
+        )
+
+        nodata = src_band.GetNoDataValue()
+        if nodata is not None:
+            dst_band.SetNoDataValue(nodata)
+        color_table = src_band.GetColorTable()
+        if color_table is not None:
+            dst_band.SetColorTable(color_table)
+        dst_band.SetColorInterpretation(src_band.GetColorInterpretation())
+
+    copy_metadata(src_ds, dst_ds)
+
+    gt = src_ds.GetGeoTransform()
+    if gt != (0.0, 1.0, 0.0, 0.0, 0.0, 1.0):
+        dst_ds.SetGeoTransform((
+            gt[0], gt[1] / scale_x, gt[2] / scale_y,
+            gt[3], gt[4] / scale_x, gt[5] / scale_y
+        ))
+        dst_ds.SetProjection(src_ds.GetProjection())
+
+    if src_ds.GetGCPCount() > 0:
+        gcps = []
+        for gcp in src_ds.GetGCPs():
+            gcps.append(gdal.GCP(
+                gcp.GCPX, gcp.GCPY, gcp.GCPZ,
+                gcp.GCPPixel * scale_x, gcp.GCPLine * scale_y
+            ))
+        dst_ds.SetGCPs(gcps, src_ds.GetGCPProjection())
+
+    return dst_ds
+
+
+def create_vrt_copy(src_ds):
+    """ Returns an in-memory VRT referencing the pixels of the given dataset
+    instead of copying them.
+    """
+    return gdal.GetDriverByName("VRT").CreateCopy("", src_ds)
+
+
+def create_temp_copy(src_ds, temp_root=None):
+    """ Returns a copy of the dataset in a temporary tiled GeoTIFF, e.g. to
+    materialize a VRT on the disk instead of in memory. The file is removed
+    with `cleanup_dataset`.
+    """
+    handle, path = tempfile.mkstemp(suffix=".tif", dir=temp_root)
+    os.close(handle)
+    return gdal.GetDriverByName("GTiff").CreateCopy(
+        path, src_ds, options=["TILED=YES", "BIGTIFF=IF_SAFER"]
+    )
+
+
+def is_vrt(ds):
+    return ds.GetDriver().ShortName == "VRT"
+
+
+def cleanup_dataset(ds):
+    """ Cleans up a temporary dataset. VRTs only reference other datasets
+    and are not deleted, as this would delete the referenced files.
+    """
+    if not is_vrt(ds):
+        cleanup_temp(ds)
+
+
+def _transformer_options(method, order):
+    """ Returns the gdal.Warp() options for the transform method and order of
+    the reftools, or None if they cannot be expressed.
+    """
+
+    # gdal.Warp() is available since GDAL 2.1
+    if not hasattr(gdal, "Warp"):
+        return None
+
+    if method == reftools.METHOD_TPS:
+        return {"tps": True}
+    elif method == reftools.METHOD_GCP:
+        return {"polynomialOrder": order} if order > 0 else {}
+    return None
+
+
+def warp_lazily(src_ds, dst_wkt, size_x, size_y, gt, method, order,
+                warp_options=None, error_threshold=0):
+    """ Returns a warped VRT of the dataset with the given output grid and
+    transformer, or None if that transformer cannot be expressed in a warped
+    VRT.
+    """
+
+    options = _transformer_options(method, order)
+    if options is None:
+        return None
+
+    return gdal.Warp(
+        "", src_ds, format="VRT", dstSRS=dst_wkt,
+        width=size_x, height=size_y,
+        outputBounds=(
+            gt[0], gt[3] + size_y * gt[5], gt[0] + size_x * gt[1], gt[3]
+        ),
+        errorThreshold=error_threshold, multithread=bool(warp_options),
+        warpOptions=warp_options or [], **options
+    )
+
+
+def warp_approximately(src_ds, dst_ds, method, order, warp_options=None,
+                       error_threshold=0):
+    """ Warps the dataset into the georeferenced destination dataset,
+    approximating the transformer with the given maximum error in pixels.
+    Returns False if the transformer cannot be expressed.
+    """
+
+    options = _transformer_options(method, order)
+    if options is None:
+        return False
+
+    if not gdal.Warp(dst_ds, src_ds, errorThreshold=error_threshold,
+                     multithread=bool(warp_options),
+                     warpOptions=warp_options or [], **options):
+        raise RuntimeError("Failed to warp the image.")
+    return True
+
+
 class InternalGCPs(object):
-    def __init__(self, srid=4326):
+    def __init__(self, srid=4326, lazy=False, warp_options=None,
+                 order_statistics=None, attempts=None, error_threshold=0,
+                 output_grid=None):
+        # EPSG code of the output
         self.srid = srid
+        # whether to warp to a VRT instead of an In-Memory Dataset
+        self.lazy = lazy
+        self.warp_options = warp_options
+        # maximum error in pixels of the approximate transformer, 0 for the
+        # exact transformer
+        self.error_threshold = error_threshold
+        # GCP count buckets to the statistics of the orders, see
+        # `get_gcp_orders`
+        self.order_statistics = order_statistics or {}
+        # tuples of the number of GCPs, the order, and the success or `None`
+        # if skipped
+        self.attempts = attempts if attempts is not None else []
+        # optional function returning the size and geotransform of the output
+        # for the suggested ones, e.g. to snap it to a tile grid
+        self.output_grid = output_grid
 
     def apply(self, src_ds):
         # setup
@@ -408,36 +936,61 @@ class InternalGCPs(object):
         # Try to find and use the best transform method/order.
         # Orders are: -1 (TPS), 3, 2, and 1 (all GCP)
         # Loop over the min and max GCP number to order map.
-        for min_gcpnum, max_gcpnum, order in [(3, None, -1), (10, None, 3), (6, None, 2), (3, None, 1)]:
+        candidates = [(3, None, -1), (10, None, 3), (6, None, 2), (3, None, 1)]
+        orders = [
+            order for min_gcpnum, max_gcpnum, order in candidates
             # if the number of GCP matches
-            if num_gcps >= min_gcpnum and (max_gcpnum is None or num_gcps <= max_gcpnum):
-                try:
+            if num_gcps >= min_gcpnum and (max_gcpnum is None or num_gcps <= max_gcpnum)
+        ]
+
+        # skip the orders which failed repeatedly for similar browses, but
+        # always try the last one
+        statistics = self.order_statistics.get(gcp_bucket(num_gcps), {})
+
+        for index, order in enumerate(orders):
+            if index < len(orders) - 1 and skip_order(statistics, order):
+                logger.debug("Skipping order '%i'." % order)
+                self.attempts.append((num_gcps, order, None))
+                continue
 
-                    if (order < 0):
-                        # let the reftools suggest the right interpolator
-                        rt_prm = reftools.suggest_transformer(src_ds)
-                    else:
-                        # use the polynomial GCP interpolation as requested
-                        rt_prm = {
-                            "method": reftools.METHOD_GCP, "order": order
-                        }
-
-                    logger.debug("Trying order '%i' {method:%s,order:%s}" % (
-                        order, reftools.METHOD2STR[rt_prm["method"]],
-                        rt_prm["order"]
-                    ))
-
-                    # get the suggested pixel size/geotransform
-                    size_x, size_y, gt = reftools.suggested_warp_output(
-                        src_ds,
-                        None,
-                        dst_sr.ExportToWkt(),
-                        **rt_prm
+            try:
+
+                if (order < 0):
+                    # let the reftools suggest the right interpolator
+                    rt_prm = reftools.suggest_transformer(src_ds)
+                else:
+                    # use the polynomial GCP interpolation as requested
+                    rt_prm = {
+                        "method": reftools.METHOD_GCP, "order": order
+                    }
+
+                logger.debug("Trying order '%i' {method:%s,order:%s}" % (
+                    order, reftools.METHOD2STR[rt_prm["method"]],
+                    rt_prm["order"]
+                ))
+
+                # get the suggested pixel size/geotransform
+                size_x, size_y, gt = reftools.suggested_warp_output(
+                    src_ds,
+                    None,
+                    dst_sr.ExportToWkt(),
+                    **rt_prm
+                )
+                if self.output_grid is not None:
+                    size_x, size_y, gt = self.output_grid(size_x, size_y, gt)
+                if size_x > 100000 or size_y > 100000:
+                    raise RuntimeError("Calculated size exceeds limit.")
+                logger.debug("New size is '%i x %i'" % (size_x, size_y))
+
+                dst_ds = None
+                if self.lazy:
+                    dst_ds = warp_lazily(
+                        src_ds, dst_sr.ExportToWkt(), size_x, size_y, gt,
+                        rt_prm["method"], rt_prm["order"],
+                        self.warp_options, self.error_threshold
                     )
-                    if size_x > 100000 or size_y > 100000:
-                        raise RuntimeError("Calculated size exceeds limit.")
-                    logger.debug("New size is '%i x %i'" % (size_x, size_y))
 
+                if dst_ds is None:
                     # create the output dataset
                     dst_ds = create_mem(size_x, size_y,
                                         src_ds.RasterCount,
@@ -447,23 +1000,32 @@ class InternalGCPs(object):
                     dst_ds.SetProjection(dst_sr.ExportToWkt())
                     dst_ds.SetGeoTransform(gt)
 
-                    reftools.reproject_image(src_ds, "", dst_ds, "", **rt_prm)
+                    # the reftools always use the exact transformer
+                    if not (self.error_threshold and warp_approximately(
+                            src_ds, dst_ds, rt_prm["method"],
+                            rt_prm["order"], self.warp_options,
+                            self.error_threshold)):
+                        reftools.reproject_image(
+                            src_ds, "", dst_ds, "", **rt_prm
+                        )
 
-                    copy_metadata(src_ds, dst_ds)
+                copy_metadata(src_ds, dst_ds)
 
-                    # retrieve the footprint from the given GCPs
-                    footprint_wkt = reftools.get_footprint_wkt(src_ds, **rt_prm)
+                # retrieve the footprint from the given GCPs
+                footprint_wkt = reftools.get_footprint_wkt(src_ds, **rt_prm)
 
-                except RuntimeError, e:
-                    logger.debug("Failed using order '%i'. Error was '%s'."
-                                 % (order, str(e)))
-                    # the given method was not applicable, use the next one
-                    continue
+            except RuntimeError, e:
+                logger.debug("Failed using order '%i'. Error was '%s'."
+                             % (order, str(e)))
+                self.attempts.append((num_gcps, order, False))
+                # the given method was not applicable, use the next one
+                continue
 
-                else:
-                    logger.debug("Successfully used order '%i'" % order)
-                    # the transform method was successful, exit the loop
-                    break
+            else:
+                logger.debug("Successfully used order '%i'" % order)
+                self.attempts.append((num_gcps, order, True))
+                # the transform method was successful, exit the loop
+                break
         else:
             # no method worked, so raise an error
             raise GCPTransformException(
@@ -472,6 +1034,8 @@ class InternalGCPs(object):
 
         # reproject the footprint to a lon/lat projection if necessary
         if not dst_sr.IsGeographic():
+            gcp_sr = osr.SpatialReference()
+            gcp_sr.ImportFromWkt(src_ds.GetGCPProjection())
             out_sr = osr.SpatialReference()
             out_sr.ImportFromEPSG(4326)
             geom = ogr.CreateGeometryFromWkt(footprint_wkt, gcp_sr)
@@ -481,3 +1045,26 @@ class InternalGCPs(object):
         logger.debug("Calculated footprint: '%s'." % footprint_wkt)
 
         return dst_ds, footprint_wkt
+
+
+class LazyGCPList(InternalGCPs):
+    """ Georeference from a list of GCPs (x, y, pixel, line) in the given
+    projection, like `GCPList`, but warping lazily to a VRT unless `lazy` is
+    false, and supporting the approximate transformer.
+    """
+
+    def __init__(self, gcps, srid=4326, lazy=True):
+        super(LazyGCPList, self).__init__(srid, lazy=lazy)
+        self.gcps = gcps
+        # the output may be warped to another CRS than the one of the GCPs
+        self.gcp_srid = srid
+
+    def apply(self, src_ds):
+        gcp_sr = osr.SpatialReference()
+        gcp_sr.ImportFromEPSG(self.gcp_srid)
+
+        src_ds.SetGCPs([
+            gdal.GCP(x, y, 0, pixel, line) for x, y, pixel, line in self.gcps
+        ], gcp_sr.ExportToWkt())
+
+        return super(LazyGCPList, self).apply(src_ds)
@@ -0,0 +1,73 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Approximate statistics of raster bands, computed from a sample of the
+pixels instead of a full pass over the band.
+"""
+
+import math
+
+import numpy as np
+
+
+def approximate_min_max(band, sample_size, percentile=0):
+    """ Returns the approximate minimum and maximum of the band from a sample
+        of at most about `sample_size` pixels, excluding the no data value.
+        The sample is read with a reduced buffer size, so GDAL reads it from
+        the overviews where available and from every n-th pixel otherwise.
+        With a `percentile` greater than zero the values are clipped to that
+        percentile and its complement. Returns `None` if the sample contains
+        no valid pixels.
+    """
+
+    size_x, size_y = band.XSize, band.YSize
+    factor = math.sqrt(float(size_x * size_y) / max(1, sample_size))
+    if factor > 1:
+        buf_x = max(1, int(size_x / factor))
+        buf_y = max(1, int(size_y / factor))
+    else:
+        buf_x, buf_y = size_x, size_y
+
+    values = band.ReadAsArray(
+        0, 0, size_x, size_y, buf_xsize=buf_x, buf_ysize=buf_y
+    ).ravel()
+
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        values = values[values != nodata]
+    if np.issubdtype(values.dtype, np.floating):
+        values = values[np.isfinite(values)]
+    if not values.size:
+        return None
+
+    if percentile > 0:
+        low, high = np.percentile(values, [percentile, 100 - percentile])
+    else:
+        low, high = values.min(), values.max()
+    return float(low), float(high)
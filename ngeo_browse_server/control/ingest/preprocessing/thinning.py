@@ -0,0 +1,140 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Thinning of dense GCP sets, e.g. of regular grid browses, to speed up the
+warping. The accuracy of a thinned set is measured by the residuals of the
+transform of the thinned set at all GCPs, in pixels.
+"""
+
+import math
+
+import numpy as np
+from eoxserver.contrib import gdal
+
+
+def thin_grid(gcps, num_x, num_y, max_count):
+    """ Returns a uniform subgrid of the GCPs of a regular grid with `num_x`
+        times `num_y` nodes, ordered by x first, with at most `max_count` GCPs.
+        The outer rows and columns are always kept.
+    """
+
+    if max_count <= 0 or len(gcps) <= max_count:
+        return list(gcps)
+
+    # keep the aspect ratio of the grid, unless an axis has too few nodes
+    ratio = math.sqrt(float(max_count) / (num_x * num_y))
+    count_x = _clamp(int(num_x * ratio), num_x)
+    count_y = _clamp(max_count // count_x, num_y)
+    count_x = _clamp(max_count // count_y, num_x)
+
+    return [
+        gcps[i * num_y + j]
+        for i in _subgrid_indices(num_x, count_x)
+        for j in _subgrid_indices(num_y, count_y)
+    ]
+
+
+def thin_by_error(gcps, max_count, tolerance):
+    """ Selects the GCPs greedily: starting with the GCPs closest to the
+        corners of the image, the GCP with the largest residual is added until
+        all residuals are within the tolerance in pixels or `max_count` GCPs
+        are selected.
+    """
+
+    selected = _corner_indices(gcps)
+    if max_count <= 0 or len(gcps) <= max_count or len(selected) < 3:
+        return list(gcps)
+
+    while len(selected) < max_count:
+        residuals = gcp_residuals([gcps[i] for i in sorted(selected)], gcps)
+        worst = int(np.argmax(residuals))
+        if residuals[worst] <= tolerance or worst in selected:
+            break
+        selected.add(worst)
+
+    return [gcps[i] for i in sorted(selected)]
+
+
+def gcp_residuals(subset, gcps):
+    """ Returns the residuals in pixels of all GCPs when transformed with the
+        thin plate spline transform of the subset of GCPs. GCPs which cannot be
+        transformed have an infinite residual.
+    """
+
+    # the transformer requires a dataset holding the GCPs
+    ds = gdal.GetDriverByName("MEM").Create("", 1, 1, 1, gdal.GDT_Byte)
+    ds.SetGCPs([
+        gdal.GCP(x, y, 0, pixel, line) for x, y, pixel, line in subset
+    ], "")
+    transformer = gdal.Transformer(ds, None, ["METHOD=GCP_TPS"])
+
+    # transform from the GCP coordinates to pixel coordinates
+    points, successes = transformer.TransformPoints(
+        1, [(x, y, 0.0) for x, y, _, _ in gcps]
+    )
+
+    points = np.array([point[:2] for point in points], dtype=float)
+    expected = np.array([(pixel, line) for _, _, pixel, line in gcps],
+                        dtype=float)
+    residuals = np.hypot(*(points - expected).T)
+    residuals[np.logical_not(np.array(successes, dtype=bool))] = np.inf
+    return residuals
+
+
+def max_residual(subset, gcps):
+    """ Returns the largest residual in pixels of all GCPs when transformed
+        with the thin plate spline transform of the subset of GCPs.
+    """
+
+    return float(np.max(gcp_residuals(subset, gcps)))
+
+
+def _clamp(count, num):
+    return max(2, min(num, count))
+
+
+def _subgrid_indices(num, count):
+    """ Returns `count` evenly spaced indices from 0 to `num` - 1. """
+
+    return sorted(set(
+        int(round(k * (num - 1) / (count - 1.0))) for k in range(count)
+    ))
+
+
+def _corner_indices(gcps):
+    """ Returns the indices of the GCPs closest to the corners of the image.
+    """
+
+    indices = xrange(len(gcps))
+    return set([
+        min(indices, key=lambda i: gcps[i][2] + gcps[i][3]),
+        max(indices, key=lambda i: gcps[i][2] + gcps[i][3]),
+        min(indices, key=lambda i: gcps[i][2] - gcps[i][3]),
+        max(indices, key=lambda i: gcps[i][2] - gcps[i][3]),
+    ])
@@ -0,0 +1,333 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Queue backends for the `ngeo_ingest_worker` command. A backend hands out
+queued browse reports one at a time and is notified once a report was
+handled. Available backends are:
+
+  * "jobs": the `IngestJob` table filled by the asynchronous HTTP ingestion
+  * "spool": browse report XML files placed in a spool directory
+  * "redis": browse report XML documents pushed to a Redis list
+"""
+
+import logging
+import traceback
+from os import listdir, rename, remove, rmdir
+from os.path import join, isfile
+
+from lxml import etree
+from django.core.exceptions import ImproperlyConfigured
+from eoxserver.processing.preprocessing.exceptions import PreprocessingException
+
+from ngeo_browse_server.control.ingest import (
+    ingest_browse_report, safe_makedirs
+)
+from ngeo_browse_server.control.ingest.exceptions import IngestionException
+from ngeo_browse_server.control.ingest.jobs import (
+    decode_report, claim_ingest_job, run_ingest_job, reset_ingest_jobs,
+    get_ingest_queue_status
+)
+from ngeo_browse_server.lock import get_owner, is_owner_alive
+
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_report(report, config=None):
+    """ Decodes and ingests the browse report given as XML string. Returns the
+    `IngestBrowseReportResult`.
+    """
+
+    parsed_browse_report = decode_report(etree.fromstring(report).getroottree())
+    logger.info("Ingesting browse report with %d browse%s."
+                % (len(parsed_browse_report),
+                   "s" if len(parsed_browse_report) != 1 else ""))
+    try:
+        return ingest_browse_report(parsed_browse_report, config=config)
+    except PreprocessingException, e:
+        raise IngestionException(str(e))
+
+
+class IngestQueue(object):
+    """ Base class for ingest queue backends. `get` returns an item
+    identifying a queued browse report, `ingest` ingests it and removes it
+    from the queue.
+    """
+
+    name = None
+
+    # whether `get` itself waits for new reports
+    blocking = False
+
+    def reset(self, force=False):
+        """ Puts back the reports that were claimed but not finished by
+        workers whose process is gone, e.g. because it was killed. With
+        `force` the reports claimed by all workers are put back, which is only
+        safe when no worker is running. Returns the number of re-queued
+        reports.
+        """
+        return 0
+
+    def get(self, timeout):
+        """ Claims the next queued browse report. Blocking backends wait at
+        most `timeout` seconds for one. Returns `None` if the queue is empty.
+        """
+        raise NotImplementedError
+
+    def describe(self, item):
+        return str(item)
+
+    def depth(self):
+        """ Returns the number of queued browse reports or `None` if unknown.
+        """
+        return None
+
+    def ingest(self, item, config=None):
+        """ Ingests the browse report of a claimed item and removes it from
+        the queue. Returns `True` if the report was ingested.
+        """
+
+        try:
+            results = ingest_report(self.read(item), config)
+        except Exception, e:
+            logger.error("Ingestion of %s failed: %s"
+                         % (self.describe(item), e))
+            logger.debug(traceback.format_exc())
+            self.done(item, False)
+            return False
+
+        logger.info("Ingested %s: %d browse%s inserted, %d replaced and %d "
+                    "failed." % (self.describe(item), results.actually_inserted,
+                                 "s" if results.actually_inserted != 1 else "",
+                                 results.actually_replaced,
+                                 len(results.failed)))
+        self.done(item, True)
+        return True
+
+    def read(self, item):
+        """ Returns the browse report XML string of a claimed item. """
+        raise NotImplementedError
+
+    def done(self, item, success):
+        """ Removes a claimed item from the queue. """
+        raise NotImplementedError
+
+
+class JobQueue(IngestQueue):
+    """ Queue backend processing the `IngestJob` instances created by the
+    asynchronous ingestion via HTTP.
+    """
+
+    name = "jobs"
+
+    def reset(self, force=False):
+        return reset_ingest_jobs(force)
+
+    def get(self, timeout):
+        return claim_ingest_job()
+
+    def describe(self, item):
+        return "ingest job %d" % item.id
+
+    def depth(self):
+        return get_ingest_queue_status()["pending"]
+
+    def ingest(self, item, config=None):
+        return run_ingest_job(item, config)
+
+
+class SpoolQueue(IngestQueue):
+    """ Queue backend processing the browse report XML files placed in a
+    spool directory in the order of their file names. A file is claimed by
+    moving it to a directory of the claiming process below the "processing"
+    sub-directory, which is atomic, so several workers can share the same
+    spool directory. Successfully ingested files are removed, failed ones are
+    moved to the "failed" sub-directory.
+
+    Reports are expected to be moved to the spool directory once they are
+    completely written.
+    """
+
+    name = "spool"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.processing_dir = join(directory, "processing")
+        self.failed_dir = join(directory, "failed")
+        safe_makedirs(self.processing_dir)
+        safe_makedirs(self.failed_dir)
+
+    @property
+    def claim_dir(self):
+        """ The directory of the files claimed by the current process. """
+        return join(self.processing_dir, get_owner())
+
+    def reset(self, force=False):
+        count = 0
+        for owner in sorted(listdir(self.processing_dir)):
+            if not force and is_owner_alive(owner) is not False:
+                continue
+            claim_dir = join(self.processing_dir, owner)
+            for filename in sorted(listdir(claim_dir)):
+                rename(join(claim_dir, filename),
+                       join(self.directory, filename))
+                count += 1
+            self._remove_claim_dir(claim_dir)
+        return count
+
+    def get(self, timeout):
+        claim_dir = self.claim_dir
+        for filename in sorted(listdir(self.directory)):
+            path = join(self.directory, filename)
+            if filename.startswith(".") or not isfile(path):
+                continue
+            try:
+                safe_makedirs(claim_dir)
+                rename(path, join(claim_dir, filename))
+            except OSError:
+                # claimed by another worker in the meantime
+                continue
+            return filename
+        return None
+
+    def describe(self, item):
+        return "spooled browse report '%s'" % item
+
+    def depth(self):
+        return len([
+            filename for filename in listdir(self.directory)
+            if not filename.startswith(".")
+            and isfile(join(self.directory, filename))
+        ])
+
+    def read(self, item):
+        with open(join(self.claim_dir, item)) as f:
+            return f.read()
+
+    def done(self, item, success):
+        path = join(self.claim_dir, item)
+        if success:
+            remove(path)
+        else:
+            rename(path, join(self.failed_dir, item))
+        self._remove_claim_dir(self.claim_dir)
+
+    def _remove_claim_dir(self, claim_dir):
+        try:
+            rmdir(claim_dir)
+        except OSError:
+            # still holds claimed files
+            pass
+
+
+class RedisQueue(IngestQueue):
+    """ Queue backend processing the browse report XML documents pushed to a
+    Redis list with LPUSH. Claimed reports are atomically moved to the
+    "<key>:processing:<worker>" list of the claiming process until they are
+    handled, so no report is lost when a worker is killed. The workers are
+    kept in the "<key>:workers" set. Failed reports are pushed to
+    "<key>:failed".
+    """
+
+    name = "redis"
+    blocking = True
+
+    def __init__(self, host="localhost", port=6379, key="ingest_queue"):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                "The 'redis' ingest queue backend requires the Python redis "
+                "client to be installed."
+            )
+        self.client = redis.StrictRedis(host=host, port=port)
+        self.key = key
+        self.processing_key = key + ":processing"
+        self.workers_key = key + ":workers"
+        self.failed_key = key + ":failed"
+
+    def _claim_key(self, owner=None):
+        return "%s:%s" % (self.processing_key, owner or get_owner())
+
+    def reset(self, force=False):
+        count = 0
+        for owner in self.client.smembers(self.workers_key):
+            if not force and is_owner_alive(owner) is not False:
+                continue
+            claim_key = self._claim_key(owner)
+            while self.client.rpoplpush(claim_key, self.key) is not None:
+                count += 1
+            self.client.srem(self.workers_key, owner)
+        return count
+
+    def get(self, timeout):
+        owner = get_owner()
+        self.client.sadd(self.workers_key, owner)
+        # a timeout of 0 would block forever
+        return self.client.brpoplpush(
+            self.key, self._claim_key(owner), max(1, int(timeout))
+        )
+
+    def describe(self, item):
+        return "browse report from Redis list '%s'" % self.key
+
+    def depth(self):
+        return self.client.llen(self.key)
+
+    def read(self, item):
+        return item
+
+    def done(self, item, success):
+        pipe = self.client.pipeline()
+        pipe.lrem(self._claim_key(), 1, item)
+        if not success:
+            pipe.lpush(self.failed_key, item)
+        pipe.execute()
+
+
+def get_ingest_queue(backend, worker_config):
+    """ Returns the ingest queue for the given backend name, configured with
+    the settings of `get_worker_config`.
+    """
+
+    if backend == "jobs":
+        return JobQueue()
+    elif backend == "spool":
+        if not worker_config["spool_dir"]:
+            raise ImproperlyConfigured(
+                "The 'spool' ingest queue backend requires the 'spool_dir' "
+                "option to be set."
+            )
+        return SpoolQueue(worker_config["spool_dir"])
+    elif backend == "redis":
+        return RedisQueue(worker_config["redis_host"],
+                          worker_config["redis_port"],
+                          worker_config["redis_queue"])
+
+    raise ImproperlyConfigured("Unknown ingest queue backend '%s'." % backend)
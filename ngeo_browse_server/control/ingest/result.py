@@ -31,6 +31,11 @@
 class IngestBrowseReportResult(object):
     """ Result object for ingestion operations. """
 
+    # whether the stage timings shall be reported and the timings of the
+    # stages concerning the whole report, e.g. seeding
+    report_timings = False
+    timings = ()
+
     def __init__(self):
         self._results = []
 
@@ -75,6 +80,16 @@ class IngestBrowseReportResult(object):
 
 
 class IngestBrowseResult(object):
+    # optional code and message reported for the browse
+    code = None
+    message = None
+
+    # (stage, wall time, CPU time) tuples of the ingestion stages
+    timings = ()
+
+    # size of the written browse image in bytes
+    bytes_written = 0
+
     def __init__(self, identifier, extent, time_interval):
         self.success = True
         self.replaced = False
@@ -103,6 +118,19 @@ class IngestBrowseSkipResult(IngestBrowseResult):
         self.skipped = True
 
 
+class IngestBrowseDuplicateResult(IngestBrowseSkipResult):
+    """ Result of a browse that was skipped as it is identical to the already
+    ingested one.
+    """
+
+    code = "DuplicateBrowse"
+
+    def __init__(self, identifier, coverage_id):
+        super(IngestBrowseDuplicateResult, self).__init__(identifier)
+        self.message = ("Browse is identical to the already ingested browse "
+                        "'%s' and was skipped." % coverage_id)
+
+
 class IngestBrowseFailureResult(IngestBrowseResult):
     def __init__(self, identifier, code, message):
         super(IngestBrowseFailureResult, self).__init__(identifier, None, None)
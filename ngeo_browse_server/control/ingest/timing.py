@@ -0,0 +1,98 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+from os import times
+from time import time
+from contextlib import contextmanager
+
+
+# the stages of the preprocessing of a browse image
+PREPROCESSING_STAGES = ("open", "georef", "optimizations", "footprint", "write")
+
+
+def cpu_time():
+    """ Returns the user and system CPU time of the process in seconds. """
+    user, system = times()[:2]
+    return user + system
+
+
+class StageTimer(object):
+    """ Records the wall clock and CPU time spent in the stages of an
+    ingestion. Time spent in the same stage several times is summed up.
+    Iterating over the timer yields tuples of stage name, wall time, and CPU
+    time in seconds, in the order the stages were first entered.
+    """
+
+    def __init__(self, timings=None):
+        self._stages = []
+        self._timings = {}
+        for name, wall, cpu in timings or ():
+            self.add(name, wall, cpu)
+
+    @contextmanager
+    def stage(self, name):
+        """ Context manager to time the enclosed block as the given stage. """
+
+        wall, cpu = time(), cpu_time()
+        try:
+            yield
+        finally:
+            self.add(name, time() - wall, cpu_time() - cpu)
+
+    def add(self, name, wall, cpu):
+        if name not in self._timings:
+            self._stages.append(name)
+            self._timings[name] = (0.0, 0.0)
+        prev_wall, prev_cpu = self._timings[name]
+        self._timings[name] = (prev_wall + wall, prev_cpu + cpu)
+
+    def extend(self, timings):
+        for name, wall, cpu in timings:
+            self.add(name, wall, cpu)
+
+    def __iter__(self):
+        for name in self._stages:
+            wall, cpu = self._timings[name]
+            yield name, wall, cpu
+
+    def __len__(self):
+        return len(self._stages)
+
+    def __str__(self):
+        return ",".join(
+            "%s=%.3f/%.3f" % timing for timing in self
+        )
+
+
+class NullTimer(object):
+    """ Timer that does not record anything. """
+
+    @contextmanager
+    def stage(self, name):
+        yield
@@ -36,8 +36,8 @@ from optparse import make_option
 from django.core.management.base import BaseCommand, CommandError
 from django.template.loader import render_to_string
 from django.db import transaction
-from eoxserver.core.system import System
 
+from ngeo_browse_server.initialization import initialize
 from ngeo_browse_server.config.browselayer.decoding import decode_browse_layers
 from ngeo_browse_server.config import (
     get_ngeo_config, safe_get, write_ngeo_config, models
@@ -71,7 +71,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
 
 
     def handle(self, *filenames, **kwargs):
-        System.init()
+        initialize()
 
         # parse command arguments
         self.verbosity = int(kwargs.get("verbosity", 1))
@@ -35,13 +35,12 @@ from optparse import make_option
 
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from eoxserver.core.system import System
 from eoxserver.core.util.timetools import getDateTime
 
+from ngeo_browse_server.initialization import initialize
 from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
 from ngeo_browse_server.config.models import BrowseLayer, Browse
-from ngeo_browse_server.mapcache.tasks import seed_mapcache
-from ngeo_browse_server.mapcache.config import get_mapcache_seed_config
+from ngeo_browse_server.mapcache.tasks import schedule_seed_areas
 
 
 logger = logging.getLogger(__name__)
@@ -80,7 +79,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
             "are actually deleted.")
 
     def handle(self, *args, **kwargs):
-        System.init()
+        initialize()
 
         # parse command arguments
         self.verbosity = int(kwargs.get("verbosity", 1))
@@ -201,25 +200,8 @@ class Command(LogToConsoleMixIn, BaseCommand):
                     area for area in seed_areas if not (area[5] <= end)
                 ]
 
-            for minx, miny, maxx, maxy, start_time, end_time in seed_areas:
-                try:
-
-                    # seed MapCache synchronously
-                    # TODO: maybe replace this with an async solution
-                    seed_mapcache(tileset=browse_layer_model.id,
-                                  grid=browse_layer_model.grid,
-                                  minx=minx, miny=miny,
-                                  maxx=maxx, maxy=maxy,
-                                  minzoom=browse_layer_model.lowest_map_level,
-                                  maxzoom=browse_layer_model.highest_map_level,
-                                  start_time=start_time,
-                                  end_time=end_time,
-                                  delete=False,
-                                  **get_mapcache_seed_config())
-                    logger.info("Successfully finished seeding.")
-
-                except Exception, e:
-                    logger.warn("Seeding failed: %s" % str(e))
+            # seed MapCache or queue the seed jobs for the coalesced areas
+            schedule_seed_areas(browse_layer_model, seed_areas)
 
         # TODO:
         #   - think about what to do with brows report
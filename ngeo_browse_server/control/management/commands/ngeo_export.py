@@ -37,6 +37,7 @@ from django.db.models.aggregates import Count
 from eoxserver.core.system import System
 from eoxserver.core.util.timetools import getDateTime, isotime
 
+from ngeo_browse_server.initialization import initialize
 from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
 from ngeo_browse_server.config.models import ( 
     BrowseReport, BrowseLayer, Browse
@@ -107,7 +108,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
 
 
     def handle(self, *args, **kwargs):
-        System.init()
+        initialize()
         
         # parse command arguments
         self.verbosity = int(kwargs.get("verbosity", 1))
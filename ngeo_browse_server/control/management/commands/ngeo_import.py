@@ -32,8 +32,8 @@ import logging
 from optparse import make_option
 
 from django.core.management.base import BaseCommand, CommandError
-from eoxserver.core.system import System
 
+from ngeo_browse_server.initialization import initialize
 from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
 from ngeo_browse_server.config import get_ngeo_config
 from ngeo_browse_server.control.migration.imp import import_package
@@ -62,7 +62,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
 
 
     def handle(self, *args, **kwargs):
-        System.init()
+        initialize()
         
         # parse command arguments
         self.verbosity = int(kwargs.get("verbosity", 1))
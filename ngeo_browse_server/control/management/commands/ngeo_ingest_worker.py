@@ -0,0 +1,201 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+import logging
+import signal
+from optparse import make_option
+from multiprocessing import Process
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ngeo_browse_server.initialization import initialize
+from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
+from ngeo_browse_server.control.ingest.config import get_worker_config
+from ngeo_browse_server.control.ingest.queues import get_ingest_queue
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(LogToConsoleMixIn, BaseCommand):
+
+    option_list = BaseCommand.option_list + (
+        make_option('--backend',
+            dest='backend', choices=["jobs", "spool", "redis"],
+            help=("Optional queue backend to consume browse reports from. "
+                  "Possible values are 'jobs' (reports posted via HTTP for "
+                  "asynchronous ingestion), 'spool' (report files in the "
+                  "configured 'spool_dir') and 'redis' (reports pushed to the "
+                  "configured Redis list). Defaults to the 'worker_backend' "
+                  "option of the ngeo.conf or 'jobs'.")
+        ),
+        make_option('--processes',
+            dest='processes',
+            help=("Optional number of worker processes consuming the queue in "
+                  "parallel. Defaults to the 'worker_processes' option of the "
+                  "ngeo.conf or 1.")
+        ),
+        make_option('--redis-host',
+            dest='redis_host',
+            help=("Optional host of the Redis server of the 'redis' backend. "
+                  "Defaults to the 'redis_host' option of the ngeo.conf or "
+                  "'localhost'.")
+        ),
+        make_option('--redis-port',
+            dest='redis_port',
+            help=("Optional port of the Redis server of the 'redis' backend. "
+                  "Defaults to the 'redis_port' option of the ngeo.conf or "
+                  "6379.")
+        ),
+        make_option('--once', action="store_true",
+            dest='once', default=False,
+            help=("Optional switch to exit once no browse report is queued "
+                  "instead of waiting for new ones.")
+        ),
+        make_option('--poll-interval',
+            dest='poll_interval', default=5,
+            help=("Optional number of seconds to wait before polling for "
+                  "browse reports again when none is queued. Defaults to 5.")
+        ),
+        make_option('--reset', action="store_true",
+            dest='reset', default=False,
+            help=("Optional switch to re-queue the browse reports claimed by "
+                  "all workers, also by running ones and by ones on other "
+                  "hosts. Only use it when no other worker is running. By "
+                  "default only the reports of stopped workers on this host "
+                  "are re-queued.")
+        ),
+    )
+
+    args = ("[--backend=<backend>] [--processes <number>] "
+            "[--redis-host <host>] [--redis-port <port>] [--once] "
+            "[--poll-interval <seconds>] [--reset]")
+    help = ("Ingests queued browse reports in long running worker processes. "
+            "The processes are initialized once, so the setup costs are not "
+            "paid for every browse report.")
+
+    def handle(self, *args, **kwargs):
+        # parse command arguments
+        self.verbosity = int(kwargs.get("verbosity", 1))
+        traceback = kwargs.get("traceback", False)
+        self.set_up_logging(["ngeo_browse_server"], self.verbosity, traceback)
+
+        worker_config = get_worker_config()
+        backend = kwargs.get("backend") or worker_config["backend"]
+        processes = max(1, int(
+            kwargs.get("processes") or worker_config["processes"]
+        ))
+        if kwargs.get("redis_host"):
+            worker_config["redis_host"] = kwargs["redis_host"]
+        if kwargs.get("redis_port"):
+            worker_config["redis_port"] = int(kwargs["redis_port"])
+        once = kwargs.get("once")
+        poll_interval = float(kwargs.get("poll_interval"))
+
+        queue = get_ingest_queue(backend, worker_config)
+
+        # reports still claimed by stopped workers were interrupted
+        count = queue.reset(kwargs.get("reset"))
+        if count:
+            logger.info("Re-queued %d interrupted browse report(s)." % count)
+
+        # initialize once, the worker processes inherit the initialized state
+        initialize()
+
+        if processes == 1:
+            self._work(queue, once, poll_interval)
+            return
+
+        # database connections must not be shared with the forked workers
+        for connection in connections.all():
+            connection.close()
+
+        logger.info("Starting %d ingest worker processes." % processes)
+        workers = [
+            Process(target=self._work, args=(queue, once, poll_interval))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+
+        def _terminate(signum, frame):
+            # forward the termination to the workers, which are joined below
+            logger.info("Terminating ingest worker processes.")
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        signal.signal(signal.SIGTERM, _terminate)
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # the workers are interrupted as well
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+
+        logger.info("Stopped ingest worker processes.")
+
+    def _work(self, queue, once, poll_interval):
+        logger.info("Starting ingest worker consuming the '%s' queue."
+                    % queue.name)
+
+        # stop on termination like on an interrupt, so the changes of the
+        # current browse report are rolled back
+        signal.signal(signal.SIGTERM, _interrupt)
+
+        try:
+            while True:
+                item = queue.get(poll_interval)
+                if item is None:
+                    if once:
+                        break
+                    if not queue.blocking:
+                        sleep(poll_interval)
+                    continue
+
+                logger.info("Processing %s." % queue.describe(item))
+                queue.ingest(item)
+
+        except KeyboardInterrupt:
+            logger.info("Ingest worker interrupted.")
+
+        logger.info("Stopped ingest worker.")
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
@@ -33,8 +33,8 @@ from optparse import make_option
 
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from eoxserver.core.system import System
 
+from ngeo_browse_server.initialization import initialize
 from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
 from ngeo_browse_server.control.queries import delete_browse_layer
 from ngeo_browse_server.config.models import BrowseLayer, Browse
@@ -63,7 +63,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
             "the cache.")
 
     def handle(self, *args, **kwargs):
-        System.init()
+        initialize()
 
         # parse command arguments
         self.verbosity = int(kwargs.get("verbosity", 1))
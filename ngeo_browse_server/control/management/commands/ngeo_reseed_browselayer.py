@@ -34,9 +34,8 @@ from eoxserver.core.util.timetools import getDateTime, isotime
 
 from ngeo_browse_server.config import models
 from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
-from ngeo_browse_server.mapcache.tasks import seed_mapcache
+from ngeo_browse_server.mapcache.tasks import schedule_seed
 from ngeo_browse_server.mapcache import models as mapcache_models
-from ngeo_browse_server.mapcache.config import get_mapcache_seed_config
 
 
 logger = logging.getLogger(__name__)
@@ -132,7 +131,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
                     logger.info("(Re)seeding time span %s/%s."
                                 % (isotime(time_model.start_time),
                                    isotime(time_model.end_time)))
-                    seed_mapcache(tileset=browse_layer.id,
+                    schedule_seed(tileset=browse_layer.id,
                                   grid=browse_layer.grid,
                                   minx=time_model.minx, miny=time_model.miny,
                                   maxx=time_model.maxx, maxy=time_model.maxy,
@@ -140,8 +139,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
                                   maxzoom=browse_layer.highest_map_level,
                                   start_time=time_model.start_time,
                                   end_time=time_model.end_time,
-                                  delete=False, force=force,
-                                  **get_mapcache_seed_config())
+                                  delete=False, force=force)
                     logger.info("Successfully finished (re)seeding time span.")
                 except Exception, e:
                     logger.warn("(Re)seeding failed: %s" % str(e))
@@ -0,0 +1,105 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+import logging
+from optparse import make_option
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
+from ngeo_browse_server.mapcache.tasks import (
+    claim_seed_job, run_seed_job, reset_seed_jobs
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(LogToConsoleMixIn, BaseCommand):
+
+    option_list = BaseCommand.option_list + (
+        make_option('--once', action="store_true",
+            dest='once', default=False,
+            help=("Optional switch to exit once the seed queue holds no due "
+                  "jobs instead of waiting for new ones.")
+        ),
+        make_option('--poll-interval',
+            dest='poll_interval', default=5,
+            help=("Optional number of seconds to wait before polling the "
+                  "seed queue again when no job is due. Defaults to 5.")
+        ),
+        make_option('--reset', action="store_true",
+            dest='reset', default=False,
+            help=("Optional switch to re-queue all running seed jobs, also "
+                  "the ones of running workers and of workers on other "
+                  "hosts. Only use it when no other worker is running. By "
+                  "default only the jobs of stopped workers on this host are "
+                  "re-queued.")
+        ),
+    )
+
+    args = ("[--once] [--poll-interval <seconds>] [--reset]")
+    help = ("Processes the jobs of the seed queue. Requires the 'queue' "
+            "option of the 'mapcache.seed' section to be enabled.")
+
+    def handle(self, *args, **kwargs):
+        # parse command arguments
+        self.verbosity = int(kwargs.get("verbosity", 1))
+        traceback = kwargs.get("traceback", False)
+        self.set_up_logging(["ngeo_browse_server"], self.verbosity, traceback)
+
+        once = kwargs.get("once")
+        poll_interval = float(kwargs.get("poll_interval"))
+
+        # jobs still marked as running by stopped workers were interrupted
+        count = reset_seed_jobs(kwargs.get("reset"))
+        if count:
+            logger.info("Re-queued %d interrupted seed job(s)." % count)
+
+        logger.info("Starting seed worker.")
+
+        try:
+            while True:
+                job = claim_seed_job()
+                if job is None:
+                    if once:
+                        break
+                    sleep(poll_interval)
+                    continue
+
+                job_id = job.id
+                logger.info("Processing seed job %d." % job_id)
+                if run_seed_job(job):
+                    logger.info("Successfully finished seed job %d." % job_id)
+
+        except KeyboardInterrupt:
+            logger.info("Seed worker interrupted.")
+
+        logger.info("Stopped seed worker.")
@@ -29,3 +29,112 @@
 
 from django.db import models
 
+from ngeo_browse_server.config.models import BrowseLayer
+
+
+class IngestJob(models.Model):
+    """ A browse report queued for asynchronous ingestion. """
+
+    STATUS_CHOICES = (
+        ("pending", "pending"),
+        ("running", "running"),
+        ("finished", "finished"),
+        ("failed", "failed"),
+    )
+
+    report = models.TextField()
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES,
+                              default="pending")
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    response = models.TextField(blank=True)
+
+    # the worker process running the job
+    owner = models.CharField(max_length=256, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __unicode__(self):
+        return "Ingest job %s (%s)" % (self.id, self.status)
+
+    class Meta:
+        verbose_name = "Ingest job"
+        verbose_name_plural = "Ingest jobs"
+
+
+class IngestCheckpoint(models.Model):
+    """ Progress of the ingestion of a browse report, identified by the digest
+    of the report, to resume the ingestion after it was interrupted.
+    """
+
+    digest = models.CharField(max_length=64, unique=True)
+    success_dir = models.CharField(max_length=1024)
+    failure_dir = models.CharField(max_length=1024)
+
+    # the run holding the checkpoint and the last time it made progress
+    owner = models.CharField(max_length=256, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return "Ingest checkpoint %s" % self.digest
+
+    class Meta:
+        verbose_name = "Ingest checkpoint"
+        verbose_name_plural = "Ingest checkpoints"
+
+
+class IngestCheckpointBrowse(models.Model):
+    """ The result of a handled browse of a checkpointed browse report. """
+
+    STATUS_CHOICES = (
+        ("inserted", "inserted"),
+        ("replaced", "replaced"),
+        ("skipped", "skipped"),
+        ("failed", "failed"),
+    )
+
+    checkpoint = models.ForeignKey(IngestCheckpoint, related_name="browses")
+    index = models.PositiveIntegerField()
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES)
+    code = models.CharField(max_length=256, blank=True)
+    message = models.TextField(blank=True)
+
+    # JSON list of the areas to be (un-)seeded for the browse
+    seed_areas = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = (("checkpoint", "index"),)
+
+
+class GCPTransformOrder(models.Model):
+    """ The statistics of the attempts of a GCP transform order for the
+    browses of a browse layer with a similar number of GCPs.
+    """
+
+    browse_layer = models.ForeignKey(BrowseLayer,
+                                     related_name="gcp_transform_orders")
+    # the lower bound of the number of GCPs, a power of two
+    bucket = models.PositiveIntegerField()
+    # -1 for the suggested transformer, the polynomial order otherwise
+    order = models.IntegerField()
+
+    successes = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    # failures since the last success
+    failure_streak = models.PositiveIntegerField(default=0)
+    # browses the order was skipped for since it was last tried
+    skipped = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return "GCP transform order %s of '%s' for %d+ GCPs" % (
+            self.order, self.browse_layer_id, self.bucket
+        )
+
+    class Meta:
+        verbose_name = "GCP transform order"
+        verbose_name_plural = "GCP transform orders"
+        unique_together = (("browse_layer", "bucket", "order"),)
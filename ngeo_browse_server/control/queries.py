@@ -36,7 +36,6 @@ from datetime import datetime
 from django.core.exceptions import ValidationError
 from django.contrib.gis.geos import Polygon, MultiPolygon
 from django.db.models import F, Q
-from django.db import transaction
 
 from eoxserver.core.system import System
 from eoxserver.resources.coverages.crss import fromShortCode
@@ -48,11 +47,10 @@ from ngeo_browse_server.config import (
 )
 from ngeo_browse_server.mapcache import models as mapcache_models
 from ngeo_browse_server.mapcache.tasks import (
-    seed_mapcache, add_mapcache_layer_xml, remove_mapcache_layer_xml
-)
-from ngeo_browse_server.mapcache.config import (
-    get_mapcache_seed_config, get_tileset_path
+    schedule_seed, add_mapcache_layer_xml, remove_mapcache_layer_xml
 )
+from ngeo_browse_server.mapcache.config import get_tileset_path
+from ngeo_browse_server.mapcache.planning import UnseedArea
 from ngeo_browse_server.mapcache.exceptions import LayerException
 from ngeo_browse_server.sxcat.tasks import (
     add_collection, disable_collection, remove_collection
@@ -107,9 +105,12 @@ def create_browse_report(browse_report, browse_layer_model):
 
 def create_browse(browse, browse_report_model, browse_layer_model, coverage_id,
                   crs, replaced, footprint, num_bands, filename,
-                  seed_areas, config=None):
+                  seed_areas, config=None, defer_unseed=False, digest=None):
     """ Creates all required database models for the browse and returns the
-        calculated extent of the registered coverage.
+        calculated extent of the registered coverage. With `defer_unseed` the
+        areas of merged time entries are added to `seed_areas` as
+        `UnseedArea` instead of un-seeding them immediately. The optional
+        `digest` of the ingested image is stored with the browse.
     """
 
     srid = fromShortCode(browse.reference_system_identifier)
@@ -169,6 +170,11 @@ def create_browse(browse, browse_report_model, browse_layer_model, coverage_id,
         browse_identifier_model.full_clean()
         browse_identifier_model.save()
 
+    if digest is not None:
+        digest_model = models.BrowseDigest(value=digest, browse=browse_model)
+        digest_model.full_clean()
+        digest_model.save()
+
     # initialize the Coverage Manager for Rectified Datasets to register the
     # datasets in the database
     rect_mgr = System.getRegistry().findAndBind(
@@ -235,16 +241,22 @@ def create_browse(browse, browse_report_model, browse_layer_model, coverage_id,
             start_time = min(start_time, time_model.start_time)
             end_time = max(end_time, time_model.end_time)
 
-            seed_mapcache(tileset=browse_layer_model.id,
-                          grid=browse_layer_model.grid,
-                          minx=time_model.minx, miny=time_model.miny,
-                          maxx=time_model.maxx, maxy=time_model.maxy,
-                          minzoom=browse_layer_model.lowest_map_level,
-                          maxzoom=browse_layer_model.highest_map_level,
-                          start_time=time_model.start_time,
-                          end_time=time_model.end_time,
-                          delete=True,
-                          **get_mapcache_seed_config(config))
+            if defer_unseed:
+                seed_areas.append(UnseedArea(
+                    time_model.minx, time_model.miny,
+                    time_model.maxx, time_model.maxy,
+                    time_model.start_time, time_model.end_time
+                ))
+            else:
+                schedule_seed(tileset=browse_layer_model.id,
+                              grid=browse_layer_model.grid,
+                              minx=time_model.minx, miny=time_model.miny,
+                              maxx=time_model.maxx, maxy=time_model.maxy,
+                              minzoom=browse_layer_model.lowest_map_level,
+                              maxzoom=browse_layer_model.highest_map_level,
+                              start_time=time_model.start_time,
+                              end_time=time_model.end_time,
+                              delete=True, config=config)
 
         logger.info("Result time span is %s/%s." % (isotime(start_time),
                                                     isotime(end_time)))
@@ -264,9 +276,10 @@ def create_browse(browse, browse_report_model, browse_layer_model, coverage_id,
 
 
 def remove_browse(browse_model, browse_layer_model, coverage_id,
-                  seed_areas, unseed=True, config=None):
+                  seed_areas, unseed=True, config=None, defer_unseed=False):
     """ Delete all models and caches associated with browse model. Image itself
-    is not deleted.
+    is not deleted. With `defer_unseed` the area to be un-seeded is added to
+    `seed_areas` as `UnseedArea` instead of un-seeding it immediately.
     Returns the extent and filename of the replaced image.
     """
 
@@ -320,24 +333,30 @@ def remove_browse(browse_model, browse_layer_model, coverage_id,
                        "%s. Trying to delete redundant ones." % (
                            browse_model.start_time, browse_model.end_time
                        ))
+        # the deletions are part of the transaction of the caller
         first = True
-        with transaction.commit_manually(using="mapcache"):
-            for time_model_tmp in times_qs:
-                if first:
-                    first = False
-                    time_model = time_model_tmp
-                elif (time_model_tmp.start_time <= time_model.start_time and
-                      time_model_tmp.end_time >= time_model.end_time):
-                    time_model.delete()
-                    time_model = time_model_tmp
-                else:
-                    time_model_tmp.delete()
-            transaction.commit(using="mapcache")
-
-    if unseed:
+        for time_model_tmp in times_qs:
+            if first:
+                first = False
+                time_model = time_model_tmp
+            elif (time_model_tmp.start_time <= time_model.start_time and
+                  time_model_tmp.end_time >= time_model.end_time):
+                time_model.delete()
+                time_model = time_model_tmp
+            else:
+                time_model_tmp.delete()
+
+    if unseed and defer_unseed:
+        seed_areas.append(UnseedArea(
+            time_model.minx, time_model.miny,
+            time_model.maxx, time_model.maxy,
+            time_model.start_time, time_model.end_time
+        ))
+
+    elif unseed:
         # unseed here
         try:
-            seed_mapcache(tileset=browse_layer_model.id,
+            schedule_seed(tileset=browse_layer_model.id,
                           grid=browse_layer_model.grid,
                           minx=time_model.minx, miny=time_model.miny,
                           maxx=time_model.maxx, maxy=time_model.maxy,
@@ -345,8 +364,7 @@ def remove_browse(browse_model, browse_layer_model, coverage_id,
                           maxzoom=browse_layer_model.highest_map_level,
                           start_time=time_model.start_time,
                           end_time=time_model.end_time,
-                          delete=True,
-                          **get_mapcache_seed_config(config))
+                          delete=True, config=config)
 
         except Exception, e:
             logger.warning("Un-seeding failed: %s" % str(e))
@@ -48,6 +48,7 @@ from textwrap import dedent
 from SocketServer import TCPServer, ThreadingMixIn
 from BaseHTTPServer import BaseHTTPRequestHandler
 import threading
+import socket
 
 from osgeo import gdal, osr
 from django.conf import settings
@@ -61,6 +62,7 @@ from eoxserver.resources.coverages.geo import getExtentFromRectifiedDS
 from eoxserver.processing.preprocessing.util import create_mem_copy
 from eoxserver.core.util.timetools import isotime
 
+from ngeo_browse_server.initialization import initialize
 from ngeo_browse_server.config import get_ngeo_config, reset_ngeo_config
 from ngeo_browse_server.config import models
 from ngeo_browse_server.control.ingest import safe_makedirs
@@ -73,6 +75,7 @@ from ngeo_browse_server.control.migration.package import (
     SEC_CACHE, BROWSE_LAYER_NAME, SEC_OPTIMIZED
 )
 from ngeo_browse_server.control.control.config import CTRL_SECTION
+from ngeo_browse_server.metrics import METRICS_SECTION, get_metrics_store
 
 
 logger = logging.getLogger(__name__)
@@ -181,6 +184,10 @@ class BaseTestCaseMixIn(object):
     def setUp(self):
         logger.info("Starting Test Case: %s" % self.__class__.__name__)
         super(BaseTestCaseMixIn, self).setUp()
+
+        # the database is reset for every test, so initialize the EOxServer
+        # system again instead of relying on an earlier initialization
+        initialize(force=True)
         self.setUp_files()
         self.setUp_config()
 
@@ -891,6 +898,23 @@ class OverviewMixIn(RasterMixIn):
         self.assertEqual(self.expected_overview_count, ovr_count)
 
 
+class BlockSizeMixIn(RasterMixIn):
+    expected_block_size = None # tuple (sizex, sizey)
+
+    def test_block_size(self):
+        if self.expected_block_size is None:
+            self.skipTest("No expected block size given.")
+
+        ds = self.open_raster()
+        for i in range(1, ds.RasterCount + 1):
+            band = ds.GetRasterBand(i)
+            self.assertEqual(self.expected_block_size,
+                             tuple(band.GetBlockSize()))
+            for j in range(band.GetOverviewCount()):
+                self.assertEqual(self.expected_block_size,
+                                 tuple(band.GetOverview(j).GetBlockSize()))
+
+
 class CompressionMixIn(RasterMixIn):
     expected_compression = None
 
@@ -1278,6 +1302,27 @@ class StatusTestCaseMixIn(ControlTestCaseMixIn):
         return response
 
 
+class MetricsMixIn(object):
+    """ Enables the metrics, stored in a temporary file. """
+
+    def setUp_config(self):
+        super(MetricsMixIn, self).setUp_config()
+        self.temp_metrics_file = tempfile.mktemp()
+        config = get_ngeo_config()
+        if not config.has_section(METRICS_SECTION):
+            config.add_section(METRICS_SECTION)
+        config.set(METRICS_SECTION, "enabled", "true")
+        config.set(METRICS_SECTION, "path", self.temp_metrics_file)
+
+    def tearDown_files(self):
+        super(MetricsMixIn, self).tearDown_files()
+        if exists(self.temp_metrics_file):
+            remove(self.temp_metrics_file)
+
+    def get_metrics(self):
+        return get_metrics_store().read()
+
+
 class ComponentControlTestCaseMixIn(ControlTestCaseMixIn):
     method = "put"
     url = "/status"
@@ -1512,3 +1557,108 @@ class NotifyMixIn(BaseTestCaseMixIn):
             remove(self.temp_controller_server_config)
 
 
+class DownloadMixIn(object):
+    """ Mixin serving `download_data` via a local HTTP server supporting keep
+    alive and range requests. The first response is interrupted after
+    `interrupt_after` bytes, if set. Ranges start at `range_start` instead of
+    the requested offset, if set. After the first request `changed_data` is
+    served instead, if set, with another ETag. Range requests with an
+    outdated `If-Range` get the whole file. With `chunk_delay` the data is
+    sent slowly in chunks of 10000 bytes.
+    """
+
+    server_port = 9002
+
+    download_data = "0123456789" * 100000
+    interrupt_after = None
+    range_start = None
+    changed_data = None
+    chunk_delay = None
+
+    def setUp(self):
+        super(DownloadMixIn, self).setUp()
+
+        self.requests = requests = []
+        self.if_ranges = if_ranges = []
+        self.clients = clients = set()
+        download_data = self.download_data
+        changed_data = self.changed_data
+        interrupt_after = self.interrupt_after
+        range_start = self.range_start
+        chunk_delay = self.chunk_delay
+
+        class GETHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                requests.append((self.path, self.headers.getheader("range")))
+                if_ranges.append(self.headers.getheader("if-range"))
+                clients.add(self.client_address)
+
+                data, etag = download_data, '"browse"'
+                if changed_data is not None and len(requests) > 1:
+                    data, etag = changed_data, '"changed"'
+
+                if self.path != "/browse.tif":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                start = 0
+                range_header = self.headers.getheader("range")
+                if_range = self.headers.getheader("if-range")
+                if range_header and if_range not in (None, etag):
+                    range_header = None
+                if range_header:
+                    start = int(range_header[len("bytes="):].rstrip("-"))
+                    if range_start is not None:
+                        start = range_start
+                    self.send_response(206)
+                    self.send_header("Content-Range", "bytes %d-%d/%d"
+                                     % (start, len(data) - 1, len(data)))
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(data) - start))
+                self.send_header("ETag", etag)
+                self.end_headers()
+
+                if interrupt_after and len(requests) == 1:
+                    self.wfile.write(data[:interrupt_after])
+                    self.close_connection = 1
+                elif chunk_delay:
+                    try:
+                        for offset in range(start, len(data), 10000):
+                            self.wfile.write(data[offset:offset + 10000])
+                            self.wfile.flush()
+                            time.sleep(chunk_delay)
+                    except socket.error:
+                        # the client cancelled the download
+                        self.close_connection = 1
+                else:
+                    self.wfile.write(data[start:])
+
+            def log_message(self, *args, **kwargs):
+                pass
+
+        class ThreadedTCPServer(ThreadingMixIn, TCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = ThreadedTCPServer(
+            ("localhost", self.server_port), GETHandler
+        )
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+        self.download_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(DownloadMixIn, self).tearDown()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.download_dir)
+
+    def get_url(self, path="/browse.tif"):
+        return "http://localhost:%d%s" % (self.server_port, path)
@@ -27,38 +27,97 @@
 # THE SOFTWARE.
 #------------------------------------------------------------------------------
 
-from os.path import join
+from os import listdir, walk, rename, getpid
+from os.path import join, exists
 from textwrap import dedent
+import tempfile
+import shutil
+import socket
 import logging
 from datetime import date
-from time import sleep
+from time import sleep, time
 
+import numpy
 from lxml import etree
+from osgeo import gdal, osr
 from django.conf import settings
 from django.test import TestCase, TransactionTestCase, LiveServerTestCase
+from django.test.client import Client
+from django.db import transaction
+from django.utils import simplejson as json
 from django.utils.dateparse import parse_datetime
+from django.contrib.gis.geos import GEOSGeometry
 
+from eoxserver.core.system import System
+from eoxserver.processing.gdal import reftools
 from eoxserver.resources.coverages import models as eoxs_models
 
 from ngeo_browse_server import get_version
+from ngeo_browse_server.initialization import initialize, warm_up
+from ngeo_browse_server.control.ingest.timing import StageTimer
 from ngeo_browse_server.config import models
 from ngeo_browse_server.control.testbase import (
     BaseTestCaseMixIn, HttpTestCaseMixin, HttpMixIn, CliMixIn, CliFailureMixIn,
     IngestTestCaseMixIn, SeedTestCaseMixIn, IngestReplaceTestCaseMixIn,
-    IngestMergeTestCaseMixIn, OverviewMixIn, CompressionMixIn, BandCountMixIn,
-    HasColorTableMixIn, ExtentMixIn, SizeMixIn, ProjectionMixIn,
-    StatisticsMixIn, WMSRasterMixIn, IngestFailureTestCaseMixIn,
+    IngestMergeTestCaseMixIn, OverviewMixIn, BlockSizeMixIn, CompressionMixIn,
+    BandCountMixIn, HasColorTableMixIn, ExtentMixIn, SizeMixIn, ProjectionMixIn,
+    StatisticsMixIn, RasterMixIn, WMSRasterMixIn, IngestFailureTestCaseMixIn,
     DeleteTestCaseMixIn, ExportTestCaseMixIn, ImportTestCaseMixIn,
     ImportReplaceTestCaseMixin, SeedMergeTestCaseMixIn, HttpMultipleMixIn,
     LoggingTestCaseMixIn, RegisterTestCaseMixIn, UnregisterTestCaseMixIn,
     StatusTestCaseMixIn, LogListMixIn, LogFileMixIn, ConfigMixIn,
     ComponentControlTestCaseMixIn, ConfigurationManagementMixIn,
-    GenerateReportMixIn, NotifyMixIn
+    GenerateReportMixIn, NotifyMixIn, DownloadMixIn, MetricsMixIn
 )
 from ngeo_browse_server.control.ingest.config import (
     INGEST_SECTION
 )
+from ngeo_browse_server.mapcache.config import SEED_SECTION
 from ngeo_browse_server.control.control.notification import notify
+from ngeo_browse_server.control.ingest.download import download, pool
+from ngeo_browse_server.control.ingest.prefetch import Prefetcher
+from ngeo_browse_server.mapcache.grids import (
+    get_grid, level_resolution, nearest_level
+)
+from ngeo_browse_server.control.ingest.gcporders import (
+    gcp_bucket, get_gcp_orders, skip_order, record_gcp_attempts,
+    MAX_FAILURE_STREAK, PROBE_INTERVAL
+)
+from ngeo_browse_server.control.ingest.jobs import (
+    claim_ingest_job, run_ingest_job
+)
+from ngeo_browse_server.control.ingest.queues import SpoolQueue
+from ngeo_browse_server.control.models import IngestJob, IngestCheckpoint
+from ngeo_browse_server.control.ingest.checkpoint import (
+    open_checkpoint, release_checkpoint, close_checkpoint,
+    save_browse as save_checkpoint_browse
+)
+from ngeo_browse_server.control.ingest.result import IngestBrowseFailureResult
+from ngeo_browse_server.config.browsereport.decoding import (
+    decode_browse_report, decode_coord_list
+)
+from ngeo_browse_server.control.ingest.exceptions import IngestionException
+from ngeo_browse_server.metrics import get_counter_totals
+from ngeo_browse_server.lock import get_owner
+from ngeo_browse_server.control.ingest.preprocessing.statistics import (
+    approximate_min_max
+)
+from ngeo_browse_server.control.ingest.preprocessing.thinning import (
+    thin_grid, thin_by_error, max_residual
+)
+from ngeo_browse_server.control.ingest.preprocessing.merge import (
+    mask_windows, write_data_mask
+)
+from ngeo_browse_server.control import ingest as ingest_module
+from ngeo_browse_server.control.ingest import batch as batch_module
+from ngeo_browse_server.control.ingest.batch import CommitBatch
+from ngeo_browse_server.filetransaction import FileTransaction
+from ngeo_browse_server.control.ingest.preprocessing import (
+    preprocessor as preprocessor_module
+)
+from ngeo_browse_server.control.ingest.preprocessing.preprocessor import (
+    NGEOPreProcessor, InternalGCPs, gdal_settings, reduced_size
+)
 
 
 #==============================================================================
@@ -1208,6 +1267,59 @@ xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www
 </bsi:ingestBrowseResponse>
 """
 
+class IngestBrowseInternalGCPsOrderCache(IngestBrowseInternalGCPs):
+    configuration = {
+        (INGEST_SECTION, "gcp_order_cache"): "true"
+    }
+
+    def test_gcp_transform_order(self):
+        """ Check that the statistics of the succeeded GCP transform order
+        were stored for the layer.
+        """
+        from ngeo_browse_server.control.models import GCPTransformOrder
+        transform_order = GCPTransformOrder.objects.get(successes__gt=0)
+        self.assertEqual(self.expected_inserted_into_series,
+                         transform_order.browse_layer_id)
+        self.assertEqual(1, transform_order.successes)
+        self.assertEqual(
+            (0, 0), get_gcp_orders(transform_order.browse_layer)[
+                transform_order.bucket
+            ][transform_order.order]
+        )
+
+class IngestBrowseInternalGCPsOrderCacheFailure(BaseTestCaseMixIn, HttpMixIn, TransactionTestCase):
+    """ Ingests a browse with internal GCPs which fails after it was warped.
+    """
+
+    request_file = "gcps/1396863968337_BrowseServerIngest_1396863968062_input.xml"
+    storage_dir = "data/gcps"
+
+    configuration = {
+        (INGEST_SECTION, "gcp_order_cache"): "true"
+    }
+
+    def execute(self):
+        create_browse = ingest_module.create_browse
+
+        def _create_browse(*args, **kwargs):
+            create_browse(*args, **kwargs)
+            raise IngestionException("Failed after creating the models.")
+
+        ingest_module.create_browse = _create_browse
+        try:
+            return super(IngestBrowseInternalGCPsOrderCacheFailure, self).execute()
+        finally:
+            ingest_module.create_browse = create_browse
+
+    def test_gcp_transform_order(self):
+        """ Check that the GCP transform attempts are recorded although the
+        changes of the browse were rolled back.
+        """
+        from ngeo_browse_server.control.models import GCPTransformOrder
+        self.assertEqual(0, models.Browse.objects.count())
+        transform_order = GCPTransformOrder.objects.get(successes__gt=0)
+        self.assertEqual(1, transform_order.successes)
+
 #===============================================================================
 # Ingest a browse report with multiple browses inside
 #===============================================================================
@@ -1257,6 +1369,260 @@ class SeedFootprintBrowseGroup(SeedTestCaseMixIn, HttpMixIn, LiveServerTestCase)
     expected_browse_type = "SAR"
     expected_tiles = {0: 6, 1: 6, 2: 6, 3: 6, 4: 6}
 
+class IngestFootprintBrowseGroupParallel(IngestFootprintBrowseGroup):
+    configuration = {
+        (INGEST_SECTION, "workers"): "2"
+    }
+
+    def execute(self):
+        preprocess_browse = ingest_module._preprocess_browse
+        ingest_browse = ingest_module.ingest_browse
+        pid_dir = tempfile.mkdtemp()
+        self.preprocessed = []
+
+        def _preprocess_browse(parsed_browse, *args, **kwargs):
+            # the workers are separate processes, so record their PIDs in files
+            with open(join(pid_dir, parsed_browse.browse_identifier), "w") as f:
+                f.write(str(getpid()))
+            return preprocess_browse(parsed_browse, *args, **kwargs)
+
+        def _ingest_browse(parsed_browse, *args, **kwargs):
+            self.preprocessed.append(kwargs.get("preprocessed") is not None)
+            return ingest_browse(parsed_browse, *args, **kwargs)
+
+        ingest_module._preprocess_browse = _preprocess_browse
+        ingest_module.ingest_browse = _ingest_browse
+        try:
+            return super(IngestFootprintBrowseGroupParallel, self).execute()
+        finally:
+            ingest_module._preprocess_browse = preprocess_browse
+            ingest_module.ingest_browse = ingest_browse
+            self.worker_pids = {}
+            for filename in listdir(pid_dir):
+                with open(join(pid_dir, filename)) as f:
+                    self.worker_pids[filename] = int(f.read())
+            shutil.rmtree(pid_dir)
+
+    def test_workers(self):
+        """ Check that the browses were preprocessed by the worker processes
+        and that their results were used.
+        """
+        self.assertEqual(
+            sorted(self.expected_ingested_browse_ids),
+            sorted(self.worker_pids)
+        )
+        self.assertNotIn(getpid(), self.worker_pids.values())
+        self.assertEqual([True, True, True], self.preprocessed)
+
+class SeedFootprintBrowseGroupParallel(SeedFootprintBrowseGroup):
+    configuration = {
+        (SEED_SECTION, "seed_command"): SeedTestCaseMixIn.seed_command,
+        (INGEST_SECTION, "workers"): "2"
+    }
+
+class IngestFootprintBrowseGroupSeedQueue(IngestFootprintBrowseGroup):
+    configuration = {
+        (SEED_SECTION, "queue"): "true"
+    }
+
+    def test_seed_jobs(self):
+        """ Check that a pending seed job was queued for each browse. """
+        from ngeo_browse_server.mapcache.models import SeedJob
+        self.assertEqual(
+            3, SeedJob.objects.filter(status="pending", mode="seed").count()
+        )
+
+class IngestFootprintBrowseGroupGCPFootprint(IngestFootprintBrowseGroup):
+    configuration = {
+        (INGEST_SECTION, "gcp_footprint"): "true",
+        (INGEST_SECTION, "lazy_pipeline"): "true"
+    }
+
+    # the hulls are transformed with the transformers of the warps, so they
+    # are not checked against the extents of the images
+    expected_footprint_calls = []
+
+    def setUp(self):
+        # record whether the footprint was generated from the image or
+        # clipped to its bounding box
+        self.footprint_calls = []
+        generate_footprint_wkt = NGEOPreProcessor._generate_footprint_wkt
+        get_extent = preprocessor_module.getExtentFromRectifiedDS
+
+        def _generate_footprint_wkt(preprocessor, ds):
+            self.footprint_calls.append("generate")
+            return generate_footprint_wkt(preprocessor, ds)
+
+        def _get_extent(ds):
+            self.footprint_calls.append("clip")
+            return get_extent(ds)
+
+        NGEOPreProcessor._generate_footprint_wkt = _generate_footprint_wkt
+        preprocessor_module.getExtentFromRectifiedDS = _get_extent
+        try:
+            super(IngestFootprintBrowseGroupGCPFootprint, self).setUp()
+        finally:
+            NGEOPreProcessor._generate_footprint_wkt = generate_footprint_wkt
+            preprocessor_module.getExtentFromRectifiedDS = get_extent
+
+    def test_gcp_footprint(self):
+        """ Check that the stored footprints are the hulls of the GCPs and
+        that they were not generated from the image.
+        """
+        self.assertEqual(self.expected_footprint_calls, self.footprint_calls)
+
+        parsed_browse_report = decode_browse_report(
+            etree.fromstring(self.request)
+        )
+        for parsed_browse in parsed_browse_report:
+            ds = gdal.Open(join(
+                settings.PROJECT_DIR, "data", "reference_test_data",
+                parsed_browse.file_name
+            ))
+            ds = gdal.GetDriverByName("VRT").CreateCopy("", ds)
+            sr = osr.SpatialReference()
+            sr.ImportFromEPSG(4326)
+            pixels = decode_coord_list(parsed_browse.col_row_list)
+            coords = decode_coord_list(parsed_browse.coord_list, True)
+            ds.SetGCPs([
+                gdal.GCP(
+                    x, y, 0,
+                    ds.RasterXSize if pixel == "ncol" else pixel,
+                    ds.RasterYSize if line == "nrow" else line
+                ) for (x, y), (pixel, line) in zip(coords, pixels)[:-1]
+            ], sr.ExportToWkt())
+            expected = GEOSGeometry(reftools.get_footprint_wkt(
+                ds, **reftools.suggest_transformer(ds)
+            ))
+
+            browse = models.Browse.objects.get(
+                browse_identifier__value=parsed_browse.browse_identifier
+            )
+            footprint = System.getRegistry().getFromFactory(
+                "resources.coverages.wrappers.EOCoverageFactory",
+                {"obj_id": browse.coverage_id}
+            ).getFootprint()
+            self.assertTrue(
+                footprint.sym_difference(expected).area < expected.area * 0.01
+            )
+
+class IngestFootprintBrowseGroupGCPFootprintChecked(IngestFootprintBrowseGroupGCPFootprint):
+    configuration = {
+        (INGEST_SECTION, "gcp_footprint"): "true"
+    }
+
+    # the hulls of the GCP georeference are not known to be filled by the
+    # images, so they are still checked against their extents
+    expected_footprint_calls = ["clip", "clip", "clip"]
+
+class IngestFootprintBrowseGroupLazyPipeline(IngestFootprintBrowseGroup):
+    configuration = {
+        (INGEST_SECTION, "lazy_pipeline"): "true"
+    }
+
+    def test_optimized_files_readable(self):
+        """ Check that the optimized files were written from the VRTs. """
+        paths = [
+            join(path, filename) for path, _, filenames
+            in walk(self.temp_optimized_files_dir) for filename in filenames
+        ]
+        self.assertEqual(len(self.expected_optimized_files), len(paths))
+        for path in paths:
+            ds = gdal.Open(path)
+            self.assertTrue(ds.GetProjection())
+            self.assertNotEqual(
+                (0.0, 1.0, 0.0, 0.0, 0.0, 1.0), ds.GetGeoTransform()
+            )
+
+class IngestAsyncFootprintBrowseGroup(BaseTestCaseMixIn, HttpMixIn, TestCase):
+    request_file = "reference_test_data/browseReport_ASA_WS__0P_20100719_101023_group.xml"
+    url = "/ingest?async=true"
+
+    def test_response(self):
+        """ Check that the report was queued and not yet ingested. """
+        self.assertEqual(202, self.response.status_code)
+        job = IngestJob.objects.get()
+        self.assertEqual({
+            "job": job.id, "status": "pending", "url": "/ingest/%d" % job.id
+        }, json.loads(self.response.content))
+        self.assertEqual(0, models.Browse.objects.count())
+
+    def test_job(self):
+        """ Check the progress and the response of the ingest job. """
+        job = IngestJob.objects.get()
+        client = Client()
+
+        response = client.get("/ingest/%d" % job.id)
+        self.assertEqual({
+            "job": job.id, "status": "pending", "processed": 0, "total": 3
+        }, json.loads(response.content))
+
+        self.assertTrue(run_ingest_job(claim_ingest_job()))
+
+        response = client.get("/ingest/%d" % job.id)
+        self.assertEqual(IngestFootprintBrowseGroup.expected_response,
+                         response.content)
+        self.assertEqual(3, models.Browse.objects.count())
+
+class IngestSpoolFootprintBrowseGroup(BaseTestCaseMixIn, TestCase):
+    request_file = "reference_test_data/browseReport_ASA_WS__0P_20100719_101023_group.xml"
+
+    def execute(self):
+        self.spool_dir = tempfile.mkdtemp()
+        shutil.copy(join(settings.PROJECT_DIR, "data", self.request_file),
+                    join(self.spool_dir, "1_report.xml"))
+        with open(join(self.spool_dir, "2_invalid.xml"), "w") as f:
+            f.write("<invalid/>")
+
+        queue = SpoolQueue(self.spool_dir)
+        self.ingested = []
+        while True:
+            item = queue.get(0)
+            if item is None:
+                break
+            self.ingested.append((item, queue.ingest(item)))
+
+    def tearDown(self):
+        super(IngestSpoolFootprintBrowseGroup, self).tearDown()
+        shutil.rmtree(self.spool_dir)
+
+    def test_spool(self):
+        """ Check that the spooled reports were processed in order and removed
+        from the spool.
+        """
+        self.assertEqual(
+            [("1_report.xml", True), ("2_invalid.xml", False)], self.ingested
+        )
+        self.assertEqual(3, models.Browse.objects.count())
+        self.assertEqual([], listdir(join(self.spool_dir, "processing")))
+        self.assertEqual(["2_invalid.xml"],
+                         listdir(join(self.spool_dir, "failed")))
+
+    def test_reset(self):
+        """ Check that claimed but unfinished reports are only re-queued when
+        their worker is gone or when forced.
+        """
+        shutil.copy(join(settings.PROJECT_DIR, "data", self.request_file),
+                    join(self.spool_dir, "3_report.xml"))
+        queue = SpoolQueue(self.spool_dir)
+        self.assertEqual("3_report.xml", queue.get(0))
+        self.assertEqual(None, queue.get(0))
+
+        # the claiming worker is still running
+        self.assertEqual(0, queue.reset())
+        self.assertEqual(None, queue.get(0))
+
+        # the claiming worker is gone
+        rename(queue.claim_dir, join(
+            self.spool_dir, "processing",
+            "%s:%d" % (socket.gethostname(), 2 ** 22 + 1)
+        ))
+        self.assertEqual(1, queue.reset())
+        self.assertEqual("3_report.xml", queue.get(0))
+
+        self.assertEqual(1, queue.reset(force=True))
+        self.assertEqual("3_report.xml", queue.get(0))
+
 #==============================================================================
 # Ingest a browse report which includes a replacement of a previous browse
 #==============================================================================
@@ -1292,6 +1658,87 @@ xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www
 </bsi:ingestBrowseResponse>
 """
 
+class IngestFootprintBrowseDuplicate(IngestReplaceTestCaseMixIn, HttpTestCaseMixin, TestCase):
+    request_before_test_file = "reference_test_data/browseReport_ASA_IM__0P_20100807_101327.xml"
+    request_file = "reference_test_data/browseReport_ASA_IM__0P_20100807_101327.xml"
+
+    expected_num_replaced = 0
+
+    expected_ingested_browse_ids = ("b_id_3",)
+    expected_inserted_into_series = "TEST_SAR"
+    expected_optimized_files = ['ASA_IM__0P_20100807_101327_proc.tif']
+    expected_deleted_optimized_files = []
+
+    expected_deleted_files = ['NOT_TESTED_BECAUSE_WE_ARE_REUSING_THE_FILE']
+    configuration = {
+        (INGEST_SECTION, "leave_original"): "true",
+        (INGEST_SECTION, "deduplicate"): "true",
+    }
+
+    expected_response = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<bsi:ingestBrowseResponse xsi:schemaLocation="http://ngeo.eo.esa.int/schema/browse/ingestion ../ngEOBrowseIngestionService.xsd"
+xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+    <bsi:status>success</bsi:status>
+    <bsi:ingestionSummary>
+        <bsi:toBeReplaced>1</bsi:toBeReplaced>
+        <bsi:actuallyInserted>0</bsi:actuallyInserted>
+        <bsi:actuallyReplaced>0</bsi:actuallyReplaced>
+    </bsi:ingestionSummary>
+    <bsi:ingestionResult>
+        <bsi:briefRecord>
+            <bsi:identifier>b_id_3</bsi:identifier>
+            <bsi:status>success</bsi:status>
+            <bsi:error>
+                <bsi:exceptionCode>DuplicateBrowse</bsi:exceptionCode>
+                <bsi:exceptionMessage>Browse is identical to the already ingested browse &#39;TEST_SAR_b_id_3&#39; and was skipped.</bsi:exceptionMessage>
+            </bsi:error>
+        </bsi:briefRecord>
+    </bsi:ingestionResult>
+</bsi:ingestBrowseResponse>
+"""
+
+    def test_digest(self):
+        """ Check that the digest of the ingested browse is stored. """
+        browse = models.Browse.objects.get(browse_identifier__value="b_id_3")
+        self.assertEqual(64, len(browse.digest.value))
+
+    def test_digest_processing(self):
+        """ Check that the digest changes with the processing configuration
+        of the browse layer.
+        """
+        browse = models.Browse.objects.get(browse_identifier__value="b_id_3")
+        parsed_browse = list(decode_browse_report(
+            etree.fromstring(self.request)
+        ))[0]
+        input_filename = join(
+            settings.PROJECT_DIR, "data", "reference_test_data",
+            parsed_browse.file_name
+        )
+        browse_layer = browse.browse_layer
+        self.assertEqual(browse.digest.value, ingest_module._browse_digest(
+            parsed_browse, input_filename, browse_layer
+        ))
+
+        browse_layer.radiometric_interval_min = 10
+        self.assertNotEqual(browse.digest.value, ingest_module._browse_digest(
+            parsed_browse, input_filename, browse_layer
+        ))
+
+class IngestFootprintBrowseDuplicateMetrics(MetricsMixIn, IngestFootprintBrowseDuplicate):
+    def test_metrics(self):
+        """ Check that the ingested and the skipped browse are counted. """
+        metrics = self.get_metrics()
+        self.assertEqual({'layer="TEST_SAR"': 1},
+                         metrics["counters"]["ngeo_browses_ingested_total"])
+        self.assertEqual({'layer="TEST_SAR"': 1},
+                         metrics["counters"]["ngeo_browses_skipped_total"])
+        self.assertTrue(
+            get_counter_totals(metrics, "ngeo_bytes_written_total") > 0
+        )
+        self.assertEqual(1, metrics["histograms"]["ngeo_preprocessing_seconds"]
+                                   ['layer="TEST_SAR"']["count"])
+
 class IngestFootprintBrowseMerge(IngestMergeTestCaseMixIn, HttpTestCaseMixin, TestCase):
     request_before_test_file = "reference_test_data/browseReport_ASA_IM__0P_20100807_101327.xml"
     request_file = "reference_test_data/browseReport_ASA_IM__0P_20100807_101327_new_merge.xml"
@@ -1510,6 +1957,100 @@ xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www
 </bsi:ingestBrowseResponse>
 """
 
+class IngestFootprintBrowseGroupPartialBatch(IngestFootprintBrowseGroupPartial):
+    configuration = {
+        (INGEST_SECTION, "commit_batch_size"): "10",
+        (INGEST_SECTION, "commit_interval"): "60"
+    }
+
+class CommitCounter(object):
+    """ Stand-in for `django.db.transaction` recording the databases of the
+    commits.
+    """
+
+    def __init__(self):
+        self.commits = []
+
+    def commit(self, using=None):
+        self.commits.append(using)
+        transaction.commit(using=using)
+
+    def __getattr__(self, name):
+        return getattr(transaction, name)
+
+class IngestFootprintBrowseGroupRollback(BaseTestCaseMixIn, HttpMixIn, TransactionTestCase):
+    """ Ingests a group of browses where the second one fails after its models
+    were created.
+    """
+
+    request_file = "reference_test_data/browseReport_ASA_WS__0P_20100719_101023_group.xml"
+
+    # commits of both databases for each successful browse and at the end
+    expected_commits = 6
+    # the browses when seed areas are scheduled, for each commit
+    expected_seed_schedules = [["b_id_6"], ["b_id_6", "b_id_8"]]
+
+    def execute(self):
+        counter = CommitCounter()
+        create_browse = ingest_module.create_browse
+        schedule_seed_areas = ingest_module.schedule_seed_areas
+        self.seed_schedules = []
+
+        def _schedule_seed_areas(browse_layer, seed_areas, **kwargs):
+            if seed_areas:
+                self.seed_schedules.append(sorted(
+                    models.Browse.objects.values_list(
+                        "browse_identifier__value", flat=True
+                    )
+                ))
+
+        def _create_browse(parsed_browse, *args, **kwargs):
+            result = create_browse(parsed_browse, *args, **kwargs)
+            if parsed_browse.browse_identifier == "b_id_7":
+                raise IngestionException("Failed after creating the models.")
+            return result
+
+        batch_module.transaction = counter
+        ingest_module.create_browse = _create_browse
+        ingest_module.schedule_seed_areas = _schedule_seed_areas
+        try:
+            return super(IngestFootprintBrowseGroupRollback, self).execute()
+        finally:
+            batch_module.transaction = transaction
+            ingest_module.create_browse = create_browse
+            ingest_module.schedule_seed_areas = schedule_seed_areas
+            self.commits = counter.commits
+
+    def test_rolled_back(self):
+        """ Check that only the changes of the failed browse were undone. """
+        self.assertEqual(
+            ["b_id_6", "b_id_8"],
+            sorted(models.Browse.objects.values_list(
+                "browse_identifier__value", flat=True
+            ))
+        )
+        self.assertEqual(2, eoxs_models.RectifiedDatasetRecord.objects.count())
+
+    def test_commits(self):
+        """ Check the number of commits. """
+        self.assertEqual(self.expected_commits, len(self.commits))
+
+    def test_seed_schedules(self):
+        """ Check that the seed areas are scheduled with each commit rather
+        than once all browses are processed.
+        """
+        self.assertEqual(self.expected_seed_schedules, self.seed_schedules)
+
+class IngestFootprintBrowseGroupRollbackBatch(IngestFootprintBrowseGroupRollback):
+    configuration = {
+        (INGEST_SECTION, "commit_batch_size"): "10",
+        (INGEST_SECTION, "commit_interval"): "60"
+    }
+
+    # a single commit of both databases
+    expected_commits = 2
+    expected_seed_schedules = [["b_id_6", "b_id_8"]]
+
 class SeedFootprintBrowseGroupPartial(SeedTestCaseMixIn, HttpMixIn, LiveServerTestCase):
     request_file = "reference_test_data/browseReport_ASA_WS__0P_20100719_101023_group_partial.xml"
 
@@ -2192,6 +2733,187 @@ xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www
 """
 
 
+class IngestFailureFootprintNodeNumber(IngestFailureTestCaseMixIn, HttpTestCaseMixin, TestCase):
+    expected_failed_browse_ids = ("FAILURE",)
+    expected_failed_files = ["ATS_TOA_1P_20100722_101606.jpg"]
+    expected_generated_failure_browse_report = "OPTICAL_ESA_20121002093000000000_(.*).xml"
+
+    request = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<rep:browseReport xmlns:rep="http://ngeo.eo.esa.int/ngEO/browseReport/1.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://ngeo.eo.esa.int/ngEO/browseReport/1.0 IF-ngEO-BrowseReport.xsd" version="1.3">
+    <rep:responsibleOrgName>ESA</rep:responsibleOrgName>
+    <rep:dateTime>2012-10-02T09:30:00Z</rep:dateTime>
+    <rep:browseType>OPTICAL</rep:browseType>
+    <rep:browse>
+        <rep:browseIdentifier>FAILURE</rep:browseIdentifier>
+        <rep:fileName>ATS_TOA_1P_20100722_101606.jpg</rep:fileName>
+        <rep:imageType>Jpeg</rep:imageType>
+        <rep:referenceSystemIdentifier>EPSG:4326</rep:referenceSystemIdentifier>
+        <rep:footprint nodeNumber="4">
+            <rep:colRowList>0 0 128 0 128 129 0 129 0 0</rep:colRowList>
+            <rep:coordList>52.94 3.45 51.65 10.65 47.28 8.41 48.51 1.82 52.94 3.45</rep:coordList>
+        </rep:footprint>
+        <rep:startTime>2010-07-22T10:16:06Z</rep:startTime>
+        <rep:endTime>2010-07-22T10:17:22Z</rep:endTime>
+    </rep:browse>
+</rep:browseReport>"""
+
+    expected_response = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<bsi:ingestBrowseResponse xsi:schemaLocation="http://ngeo.eo.esa.int/schema/browse/ingestion ../ngEOBrowseIngestionService.xsd"
+xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+    <bsi:status>partial</bsi:status>
+    <bsi:ingestionSummary>
+        <bsi:toBeReplaced>1</bsi:toBeReplaced>
+        <bsi:actuallyInserted>0</bsi:actuallyInserted>
+        <bsi:actuallyReplaced>0</bsi:actuallyReplaced>
+    </bsi:ingestionSummary>
+    <bsi:ingestionResult>
+        <bsi:briefRecord>
+            <bsi:identifier>FAILURE</bsi:identifier>
+            <bsi:status>failure</bsi:status>
+            <bsi:error>
+                <bsi:exceptionCode>IngestionException</bsi:exceptionCode>
+                <bsi:exceptionMessage>Invalid footprint: number of coordinates does not fit the given node number.</bsi:exceptionMessage>
+            </bsi:error>
+        </bsi:briefRecord>
+    </bsi:ingestionResult>
+</bsi:ingestBrowseResponse>
+"""
+
+
+class IngestResumeCheckpoint(HttpTestCaseMixin, BaseTestCaseMixIn, TestCase):
+    """ Resumes an interrupted ingestion where the first browse was already
+    handled and failed.
+    """
+
+    configuration = {
+        (INGEST_SECTION, "checkpoint"): "true"
+    }
+
+    request = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<rep:browseReport xmlns:rep="http://ngeo.eo.esa.int/ngEO/browseReport/1.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://ngeo.eo.esa.int/ngEO/browseReport/1.0 IF-ngEO-BrowseReport.xsd" version="1.3">
+    <rep:responsibleOrgName>ESA</rep:responsibleOrgName>
+    <rep:dateTime>2012-10-02T09:30:00Z</rep:dateTime>
+    <rep:browseType>OPTICAL</rep:browseType>
+    <rep:browse>
+        <rep:browseIdentifier>RESUMED</rep:browseIdentifier>
+        <rep:fileName>ATS_TOA_1P_20100722_101606.jpg</rep:fileName>
+        <rep:imageType>Jpeg</rep:imageType>
+        <rep:referenceSystemIdentifier>EPSG:4326</rep:referenceSystemIdentifier>
+        <rep:footprint nodeNumber="5">
+            <rep:colRowList>0 0 128 0 128 129 0 129 0 0</rep:colRowList>
+            <rep:coordList>52.94 3.45 51.65 10.65 47.28 8.41 48.51 1.82 52.94 3.45</rep:coordList>
+        </rep:footprint>
+        <rep:startTime>2010-07-22T10:16:06Z</rep:startTime>
+        <rep:endTime>2010-07-22T10:17:22Z</rep:endTime>
+    </rep:browse>
+</rep:browseReport>"""
+
+    expected_response = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<bsi:ingestBrowseResponse xsi:schemaLocation="http://ngeo.eo.esa.int/schema/browse/ingestion ../ngEOBrowseIngestionService.xsd"
+xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+    <bsi:status>partial</bsi:status>
+    <bsi:ingestionSummary>
+        <bsi:toBeReplaced>1</bsi:toBeReplaced>
+        <bsi:actuallyInserted>0</bsi:actuallyInserted>
+        <bsi:actuallyReplaced>0</bsi:actuallyReplaced>
+    </bsi:ingestionSummary>
+    <bsi:ingestionResult>
+        <bsi:briefRecord>
+            <bsi:identifier>RESUMED</bsi:identifier>
+            <bsi:status>failure</bsi:status>
+            <bsi:error>
+                <bsi:exceptionCode>IngestionException</bsi:exceptionCode>
+                <bsi:exceptionMessage>Failed before the interruption.</bsi:exceptionMessage>
+            </bsi:error>
+        </bsi:briefRecord>
+    </bsi:ingestionResult>
+</bsi:ingestBrowseResponse>
+"""
+
+    def setUp_ingest(self):
+        super(IngestResumeCheckpoint, self).setUp_ingest()
+        parsed_browse_report = decode_browse_report(
+            etree.fromstring(self.request)
+        )
+        checkpoint = open_checkpoint(
+            parsed_browse_report, join(self.temp_success_dir, "resumed"),
+            join(self.temp_failure_dir, "resumed")
+        )
+        save_checkpoint_browse(checkpoint, 0, IngestBrowseFailureResult(
+            "RESUMED", "IngestionException", "Failed before the interruption."
+        ))
+        release_checkpoint(checkpoint)
+
+    def test_not_ingested(self):
+        """ Check that the browse was not ingested again. """
+        self.assertFalse(models.Browse.objects.filter(
+            browse_identifier__value="RESUMED"
+        ).exists())
+        # the input file is untouched
+        self.assertTrue(exists(join(self.temp_storage_dir,
+                                    "ATS_TOA_1P_20100722_101606.jpg")))
+
+    def test_checkpoint_closed(self):
+        """ Check that the checkpoint is removed and the failure browse report
+        is written to the directory of the first run.
+        """
+        self.assertEqual(0, IngestCheckpoint.objects.count())
+        self.assertEqual(1, len(listdir(join(self.temp_failure_dir,
+                                             "resumed"))))
+
+
+class CheckpointOwnershipTestCase(TestCase):
+    def setUp(self):
+        self.parsed_browse_report = decode_browse_report(etree.parse(join(
+            settings.PROJECT_DIR, "data", "reference_test_data",
+            "browseReport_ASA_IM__0P_20100807_101327.xml"
+        )).getroot())
+
+    def open(self):
+        return open_checkpoint(self.parsed_browse_report, "success", "failure")
+
+    def test_in_use(self):
+        """ Check that a checkpoint held by a running ingestion is rejected
+        and that it is not removed by another run.
+        """
+        checkpoint = self.open()
+        self.assertRaises(IngestionException, self.open)
+
+        other = IngestCheckpoint.objects.get(pk=checkpoint.pk)
+        other.owner = get_owner("other")
+        close_checkpoint(other)
+        self.assertEqual(1, IngestCheckpoint.objects.count())
+
+    def test_released(self):
+        """ Check that a released checkpoint is claimed by the next run. """
+        checkpoint = self.open()
+        release_checkpoint(checkpoint)
+        resumed = self.open()
+        self.assertEqual(checkpoint.pk, resumed.pk)
+        self.assertNotEqual(checkpoint.owner, resumed.owner)
+        self.assertRaises(IngestionException, self.open)
+
+    def test_dead_owner(self):
+        """ Check that the checkpoint of a run whose process is gone is taken
+        over, but not the one of a run on another host with a recent
+        heartbeat.
+        """
+        checkpoint = self.open()
+        IngestCheckpoint.objects.filter(pk=checkpoint.pk).update(
+            owner="%s:%d" % (socket.gethostname(), 2 ** 22 + 1)
+        )
+        self.assertEqual(checkpoint.pk, self.open().pk)
+
+        IngestCheckpoint.objects.filter(pk=checkpoint.pk).update(
+            owner="other-host:1"
+        )
+        self.assertRaises(IngestionException, self.open)
+
+
 class IngestFailureInvalidReferenceSystem(IngestFailureTestCaseMixIn, HttpTestCaseMixin, TransactionTestCase):
     expected_failed_browse_ids = ("FAILURE",)
     expected_failed_files = ["ATS_TOA_1P_20100722_101606.jpg"]
@@ -2609,6 +3331,152 @@ class IngestRasterNoOverviews(BaseTestCaseMixIn, HttpMixIn, OverviewMixIn, TestC
     expected_overview_count = 0
 
 
+class IngestRasterCloudOptimized(BaseTestCaseMixIn, HttpMixIn, OverviewMixIn, BlockSizeMixIn, TestCase):
+    request_file = "reference_test_data/browseReport_ASA_IM__0P_20100722_213840.xml"
+    raster_file = property(lambda self: join(self.temp_optimized_files_dir, "TEST_SAR", "2010", "ASA_IM__0P_20100722_213840_proc.tif"))
+
+    configuration = {
+        (INGEST_SECTION, "cog"): "true",
+        (INGEST_SECTION, "cog_block_size"): "512",
+        (INGEST_SECTION, "overviews"): "true",
+        (INGEST_SECTION, "overview_minsize"): "100"
+    }
+
+    expected_overview_count = 4
+    expected_block_size = (512, 512)
+
+
+class IngestRasterCloudOptimizedLazyPipeline(IngestRasterCloudOptimized):
+    configuration = {
+        (INGEST_SECTION, "cog"): "true",
+        (INGEST_SECTION, "cog_block_size"): "512",
+        (INGEST_SECTION, "overviews"): "true",
+        (INGEST_SECTION, "overview_minsize"): "100",
+        (INGEST_SECTION, "lazy_pipeline"): "true"
+    }
+
+    def execute(self):
+        self.mem_copies = []
+        create_mem_copy = preprocessor_module.create_mem_copy
+
+        def _create_mem_copy(src_ds, *args, **kwargs):
+            self.mem_copies.append(src_ds)
+            return create_mem_copy(src_ds, *args, **kwargs)
+
+        preprocessor_module.create_mem_copy = _create_mem_copy
+        try:
+            return super(IngestRasterCloudOptimizedLazyPipeline, self).execute()
+        finally:
+            preprocessor_module.create_mem_copy = create_mem_copy
+
+    def test_no_mem_copy(self):
+        """ Check that the image was not copied into memory to build the
+        overviews.
+        """
+        self.assertEqual([], self.mem_copies)
+
+
+class IngestRasterSnapToGrid(BaseTestCaseMixIn, HttpMixIn, RasterMixIn, TestCase):
+    request_file = "reference_test_data/browseReport_ASA_IM__0P_20100722_213840.xml"
+    raster_file = property(lambda self: join(self.temp_optimized_files_dir, "TEST_SAR", "2010", "ASA_IM__0P_20100722_213840_proc.tif"))
+
+    configuration = {
+        (INGEST_SECTION, "snap_to_grid"): "true"
+    }
+
+    def execute(self):
+        # record the georeferenced images warped again to the tile grid
+        self.snap_calls = []
+        snap_to_grid = NGEOPreProcessor._snap_to_grid
+
+        def _snap_to_grid(preprocessor, ds):
+            self.snap_calls.append(ds)
+            return snap_to_grid(preprocessor, ds)
+
+        NGEOPreProcessor._snap_to_grid = _snap_to_grid
+        try:
+            return super(IngestRasterSnapToGrid, self).execute()
+        finally:
+            NGEOPreProcessor._snap_to_grid = snap_to_grid
+
+    def test_resampled_once(self):
+        """ Check that the GCPs were warped directly to the tile grid. """
+        self.assertEqual([], self.snap_calls)
+
+    def test_snapped(self):
+        """ Check that the pixel size is the one of a zoom level and that the
+        pixels are aligned to the tiles.
+        """
+        ds = self.open_raster()
+        grid = get_grid(models.BrowseLayer.objects.get(id="TEST_SAR").grid)
+        gt = ds.GetGeoTransform()
+        level = nearest_level(grid, gt[1])
+        self.assertAlmostEqual(level_resolution(grid, level), gt[1])
+        self.assertAlmostEqual(-gt[1], gt[5])
+        for value, origin in ((gt[0], grid.extent[0]),
+                              (gt[3], grid.extent[3])):
+            pixels = (value - origin) / gt[1]
+            self.assertAlmostEqual(round(pixels), pixels, 4)
+
+
+class IngestRasterResolutionCap(BaseTestCaseMixIn, HttpMixIn, RasterMixIn, TestCase):
+    request_file = "reference_test_data/browseReport_ASA_IM__0P_20100722_213840.xml"
+    raster_file = property(lambda self: join(self.temp_optimized_files_dir, "TEST_SAR", "2010", "ASA_IM__0P_20100722_213840_proc.tif"))
+
+    configuration = {
+        (INGEST_SECTION, "resolution_cap"): "true"
+    }
+
+    def execute(self):
+        self.resolutions = []
+        self.reduced_copies = []
+        estimate_resolution = ingest_module._estimate_resolution
+        create_reduced_copy = preprocessor_module.create_reduced_copy
+
+        def _estimate_resolution(*args, **kwargs):
+            resolution = estimate_resolution(*args, **kwargs)
+            self.resolutions.append(resolution)
+            return resolution
+
+        def _create_reduced_copy(src_ds, reduction):
+            dst_ds = create_reduced_copy(src_ds, reduction)
+            self.reduced_copies.append((
+                (src_ds.RasterXSize, src_ds.RasterYSize), reduction,
+                (dst_ds.RasterXSize, dst_ds.RasterYSize)
+            ))
+            return dst_ds
+
+        ingest_module._estimate_resolution = _estimate_resolution
+        preprocessor_module.create_reduced_copy = _create_reduced_copy
+        try:
+            return super(IngestRasterResolutionCap, self).execute()
+        finally:
+            ingest_module._estimate_resolution = estimate_resolution
+            preprocessor_module.create_reduced_copy = create_reduced_copy
+
+    def test_reduced(self):
+        """ Check that the browse was decoded at 1/2^n of its resolution, the
+        coarsest one not coarser than the one of the highest map level of the
+        layer.
+        """
+        browse_layer = models.BrowseLayer.objects.get(id="TEST_SAR")
+        max_resolution = level_resolution(
+            get_grid(browse_layer.grid), browse_layer.highest_map_level
+        )
+        self.assertEqual(1, len(self.resolutions))
+        self.assertEqual(1, len(self.reduced_copies))
+
+        resolution = self.resolutions[0]
+        size, reduction, reduced = self.reduced_copies[0]
+        self.assertTrue(reduction > 1)
+        self.assertTrue(resolution * reduction <= max_resolution)
+        self.assertTrue(resolution * reduction * 2 > max_resolution)
+        self.assertEqual(reduced_size(size[0], size[1], reduction), reduced)
+
+        ds = self.open_raster()
+        self.assertTrue(ds.GetGeoTransform()[1] * 4 > max_resolution)
+
+
 class IngestRasterCompression(BaseTestCaseMixIn, HttpMixIn, CompressionMixIn, TestCase):
     request_file = "reference_test_data/browseReport_ASA_IM__0P_20100722_213840.xml"
     raster_file = property(lambda self: join(self.temp_optimized_files_dir, "TEST_SAR", "2010", "ASA_IM__0P_20100722_213840_proc.tif"))
@@ -2739,6 +3607,29 @@ class IngestRasterStatisticsMultipleBands(BaseTestCaseMixIn, HttpMixIn, Statisti
     ]
 
 
+class IngestRasterApproximateStatisticsMultipleBands(BaseTestCaseMixIn, HttpMixIn, RasterMixIn, TestCase):
+    storage_dir = "data/test_data"
+    request_file = "test_data/MER_FRS_1PNPDE20060816_090929_000001972050_00222_23322_0058_uint16_reduced_compressed.xml"
+
+    raster_file = property(lambda self: join(self.temp_optimized_files_dir, "TEST_MER_FRS_FULL", "2012", "MER_FRS_1PNPDE20060816_090929_000001972050_00222_23322_0058_uint16_reduced_compressed_proc.tif"))
+
+    configuration = {
+        (INGEST_SECTION, "approximate_statistics"): "true",
+        (INGEST_SECTION, "statistics_sample_size"): "1000",
+        (INGEST_SECTION, "statistics_percentile"): "1"
+    }
+
+    def test_stretched(self):
+        """ Check that the selected bands are stretched to the full range with
+        the sampled statistics.
+        """
+        ds = self.open_raster()
+        self.assertEqual(4, ds.RasterCount)
+        for index in range(1, 4):
+            band = ds.GetRasterBand(index)
+            self.assertEqual((0.0, 255.0), band.ComputeRasterMinMax(False))
+
+
 class IngestRasterStatisticsMultipleBandsNoDefinition(BaseTestCaseMixIn, HttpMixIn, StatisticsMixIn, TestCase):
     storage_dir = "data/test_data"
     request_file = "test_data/MER_FRS_1PNPDE20060816_090929_000001972050_00222_23322_0058_uint16_reduced_compressed_NO_BANDS.xml"
@@ -3792,6 +4683,43 @@ class StatusPaused(StatusTestCaseMixIn, TestCase):
     }
 
 
+class StatusSeedQueue(StatusTestCaseMixIn, TestCase):
+    configuration = {
+        (SEED_SECTION, "queue"): "true"
+    }
+
+    expected_response = {
+        'queues': [{
+            'name': 'seeding',
+            'counters': [
+                {'name': 'pending', 'value': 0},
+                {'name': 'running', 'value': 0},
+                {'name': 'failed', 'value': 0}
+            ]
+        }],
+        'softwareversion': get_version(),
+        'state': 'RUNNING'
+    }
+
+
+class StatusMetrics(MetricsMixIn, StatusTestCaseMixIn, TestCase):
+    expected_response = {
+        'queues': [{
+            'name': 'ingestion',
+            'counters': [
+                {'name': 'pending', 'value': 0},
+                {'name': 'running', 'value': 0},
+                {'name': 'ingested', 'value': 0},
+                {'name': 'failed', 'value': 0},
+                {'name': 'skipped', 'value': 0},
+                {'name': 'bytes_written', 'value': 0}
+            ]
+        }],
+        'softwareversion': get_version(),
+        'state': 'RUNNING'
+    }
+
+
 #class StatusLocked(StatusTestCaseMixIn, TestCase):
 #    def execute(self):
 #        from ngeo_browse_server.lock import FileLock
@@ -5003,3 +5931,492 @@ xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www
     </bsi:ingestionResult>
 </bsi:ingestBrowseResponse>
 """
+
+
+#===============================================================================
+# Download test cases
+#===============================================================================
+
+class DownloadTestCase(DownloadMixIn, TestCase):
+    def tearDown(self):
+        pool.clear()
+        super(DownloadTestCase, self).tearDown()
+
+    def test_download(self):
+        filename = join(self.download_dir, "browse.tif")
+        download(self.get_url(), filename)
+        download(self.get_url(), filename + ".2")
+
+        for name in (filename, filename + ".2"):
+            with open(name, "rb") as f:
+                self.assertEqual(self.download_data, f.read())
+        self.assertFalse(exists(filename + ".part"))
+
+        # the connection is reused for the second download
+        self.assertEqual(1, len(self.clients))
+
+    def test_not_found(self):
+        filename = join(self.download_dir, "browse.tif")
+        with self.assertRaises(IngestionException):
+            download(self.get_url("/missing.tif"), filename, retry_delay=0)
+
+        # client errors are not retried and nothing is left behind
+        self.assertEqual(1, len(self.requests))
+        self.assertFalse(exists(filename))
+        self.assertFalse(exists(filename + ".part"))
+
+
+class DownloadResumeTestCase(DownloadMixIn, TestCase):
+    interrupt_after = 250000
+
+    def tearDown(self):
+        pool.clear()
+        super(DownloadResumeTestCase, self).tearDown()
+
+    def test_download(self):
+        filename = join(self.download_dir, "browse.tif")
+        download(self.get_url(), filename, retry_delay=0)
+
+        with open(filename, "rb") as f:
+            self.assertEqual(self.download_data, f.read())
+
+        self.assertEqual([("/browse.tif", None),
+                          ("/browse.tif", "bytes=250000-")], self.requests)
+
+
+class DownloadResumeChangedTestCase(DownloadResumeTestCase):
+    """ The remote file changes after the first, interrupted response. """
+    changed_data = "9876543210" * 100000
+
+    def test_download(self):
+        filename = join(self.download_dir, "browse.tif")
+        download(self.get_url(), filename, retry_delay=0)
+
+        # the resumption is conditional and the new file is downloaded whole
+        with open(filename, "rb") as f:
+            self.assertEqual(self.changed_data, f.read())
+        self.assertEqual([None, '"browse"'], self.if_ranges)
+
+
+class DownloadResumeFullRangeTestCase(DownloadResumeTestCase):
+    """ The server answers the resumption with a range of the whole file. """
+    range_start = 0
+
+
+class DownloadResumeInvalidRangeTestCase(DownloadMixIn, TestCase):
+    """ The server answers the resumption with a range of another offset. """
+    interrupt_after = 250000
+    range_start = 100000
+
+    def tearDown(self):
+        pool.clear()
+        super(DownloadResumeInvalidRangeTestCase, self).tearDown()
+
+    def test_download(self):
+        filename = join(self.download_dir, "browse.tif")
+        download(self.get_url(), filename, retry_delay=0)
+
+        with open(filename, "rb") as f:
+            self.assertEqual(self.download_data, f.read())
+
+        # the partial file is discarded and downloaded anew
+        self.assertEqual([("/browse.tif", None),
+                          ("/browse.tif", "bytes=250000-"),
+                          ("/browse.tif", None)], self.requests)
+
+
+class PrefetchTestCase(DownloadMixIn, TestCase):
+    def tearDown(self):
+        pool.clear()
+        super(PrefetchTestCase, self).tearDown()
+
+    def test_prefetch(self):
+        urls = [self.get_url(), self.get_url("/missing.tif"), self.get_url()]
+        prefetcher = Prefetcher(urls, self.download_dir, lookahead=1,
+                                download_config={"retry_delay": 0})
+
+        filename = prefetcher.get(urls[0])
+        with open(filename, "rb") as f:
+            self.assertEqual(self.download_data, f.read())
+
+        # failed prefetches are reported as None
+        self.assertEqual(None, prefetcher.get(urls[1]))
+
+        # unconsumed files are removed
+        prefetcher.close()
+        self.assertEqual([filename], [
+            join(self.download_dir, name)
+            for name in listdir(self.download_dir)
+        ])
+
+    def test_budget(self):
+        urls = [self.get_url()] * 3
+        prefetcher = Prefetcher(urls, self.download_dir, lookahead=3,
+                                budget=1)
+        prefetcher.start()
+        sleep(1)
+
+        # only a single file is prefetched while the budget is exceeded
+        self.assertEqual(1, len(self.requests))
+        self.assertEqual(1, len(listdir(self.download_dir)))
+
+        prefetcher.close()
+        self.assertEqual([], listdir(self.download_dir))
+
+
+class PrefetchCancelTestCase(DownloadMixIn, TestCase):
+    # the download takes 10 seconds
+    chunk_delay = 0.1
+
+    def tearDown(self):
+        pool.clear()
+        super(PrefetchCancelTestCase, self).tearDown()
+
+    def test_cancel(self):
+        prefetcher = Prefetcher([self.get_url()], self.download_dir,
+                                download_config={"chunk_size": 1000})
+        prefetcher.start()
+        sleep(1)
+        self.assertEqual(1, len(listdir(self.download_dir)))
+
+        # the running download is cancelled and its partial file removed
+        started = time()
+        prefetcher.close()
+        self.assertTrue(time() - started < 5)
+        self.assertEqual([], listdir(self.download_dir))
+
+
+class InitializationTestCase(TestCase):
+    fixtures = ["ngeo_browse_layer.json"]
+
+    def test_initialize_once(self):
+        self.assertTrue(initialize(force=True))
+        self.assertFalse(initialize())
+
+    def test_warm_up(self):
+        self.assertTrue(warm_up() >= 0)
+        self.assertFalse(initialize())
+
+
+class CommitBatchFilesTestCase(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.replaced = join(self.directory, "replaced.tif")
+        self.output = join(self.directory, "output.tif")
+        with open(self.replaced, "w") as f:
+            f.write("replaced")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ingest(self, batch):
+        """ Replaces the file as done during the ingestion of a browse. """
+        batch.begin()
+        with FileTransaction((self.output, self.replaced),
+                             defer=True) as file_transaction:
+            with open(self.output, "w") as f:
+                f.write("output")
+        batch.on_commit(file_transaction.commit)
+        batch.on_rollback(file_transaction.rollback)
+
+    def test_commit(self):
+        """ Check that the replaced file is only removed on commit. """
+        batch = CommitBatch()
+        self.ingest(batch)
+        self.assertFalse(exists(self.replaced))
+        batch.success()
+        self.assertEqual(["output.tif"], listdir(self.directory))
+
+    def test_failure(self):
+        """ Check that the files of a failed browse are restored. """
+        batch = CommitBatch()
+        self.ingest(batch)
+        batch.failure()
+        batch.commit()
+        self.assertEqual(["replaced.tif"], listdir(self.directory))
+
+    def test_rollback(self):
+        """ Check that the files are restored when the batch is rolled
+        back.
+        """
+        batch = CommitBatch()
+        self.ingest(batch)
+        batch.rollback()
+        self.assertEqual(["replaced.tif"], listdir(self.directory))
+        with open(self.replaced) as f:
+            self.assertEqual("replaced", f.read())
+
+
+class StageTimerTestCase(TestCase):
+    def test_stages(self):
+        timer = StageTimer()
+        with timer.stage("download"):
+            pass
+        with timer.stage("write"):
+            pass
+        with timer.stage("download"):
+            pass
+        timer.add("seed", 1.5, 0.5)
+
+        self.assertEqual(["download", "write", "seed"],
+                         [name for name, wall, cpu in timer])
+        self.assertEqual("seed=1.500/0.500", str(timer).split(",")[-1])
+
+    def test_merge(self):
+        timer = StageTimer([("georef", 1.0, 0.5)])
+        timer.extend(StageTimer([("georef", 2.0, 1.0), ("write", 1.0, 1.0)]))
+        self.assertEqual([("georef", 3.0, 1.5), ("write", 1.0, 1.0)],
+                         list(timer))
+
+
+class DataMaskTestCase(TestCase):
+    def test_windowed_mask(self):
+        """ Check that the mask computed in small windows is identical to the
+        one computed from the whole bands.
+        """
+        numpy.random.seed(0)
+        ds = gdal.GetDriverByName("MEM").Create("", 301, 207, 3, gdal.GDT_UInt16)
+        expected = numpy.zeros((207, 301), dtype=numpy.bool)
+        for idx in range(1, 4):
+            data = numpy.random.randint(0, 4, (207, 301)).astype(numpy.uint16)
+            band = ds.GetRasterBand(idx)
+            band.WriteArray(data)
+            if idx == 2:
+                band.SetNoDataValue(3)
+                expected |= (data != 3)
+            else:
+                expected |= (data != 0)
+
+        for budget in (1000, 4 * 301 * 10, 4 * 301 * 207):
+            windows = list(mask_windows(ds, budget))
+            self.assertEqual(301 * 207,
+                             sum(window.area for window in windows))
+
+            mask_ds = gdal.GetDriverByName("MEM").Create("", 303, 209, 1,
+                                                          gdal.GDT_Byte)
+            write_data_mask(ds, mask_ds.GetRasterBand(1), budget)
+            mask = mask_ds.GetRasterBand(1).ReadAsArray()
+            self.assertTrue(
+                (mask[:207, :301] == expected.astype(numpy.uint8)).all()
+            )
+            self.assertFalse(mask[207:, :].any() or mask[:, 301:].any())
+
+
+class FootprintDecimationTestCase(TestCase):
+    def test_decimated_footprint(self):
+        """ Check that the footprint generated from a decimated mask does not
+        deviate more than the simplification tolerance from the footprint
+        generated at full resolution.
+        """
+        y, x = numpy.mgrid[0:300, 0:400]
+        data = (abs(x - 200) / 180.0 + abs(y - 150) / 130.0 <= 1)
+
+        sr = osr.SpatialReference()
+        sr.ImportFromEPSG(4326)
+        ds = gdal.GetDriverByName("MEM").Create("", 400, 300, 1, gdal.GDT_Byte)
+        ds.SetProjection(sr.ExportToWkt())
+        ds.SetGeoTransform((10, 0.01, 0, 50, 0, -0.01))
+        ds.GetRasterBand(1).WriteArray(data.astype(numpy.uint8) * 255)
+
+        full = GEOSGeometry(NGEOPreProcessor(
+            None, simplification_factor=4
+        )._generate_footprint_wkt(ds))
+        decimated = GEOSGeometry(NGEOPreProcessor(
+            None, simplification_factor=4, footprint_decimation=True
+        )._generate_footprint_wkt(ds))
+
+        # the decimated mask deviates by up to the decimation factor and the
+        # footprints by up to the simplification tolerance, both 4 pixels
+        bound = (4 + 4) * 0.01
+        self.assertTrue(decimated.within(full.buffer(bound)))
+        self.assertTrue(full.within(decimated.buffer(bound)))
+        self.assertTrue(
+            full.sym_difference(decimated).area < full.length * bound / 2
+        )
+
+
+class GDALSettingsTestCase(TestCase):
+    def test_num_threads(self):
+        """ Check that the number of threads and the block cache size are
+        only set within the block.
+        """
+        previous = gdal.GetConfigOption("GDAL_NUM_THREADS")
+        previous_cache_max = gdal.GetCacheMax()
+        cache_max = previous_cache_max + 64 * 1024 * 1024
+        with gdal_settings("2", cache_max):
+            self.assertEqual("2", gdal.GetConfigOption("GDAL_NUM_THREADS"))
+            self.assertEqual(cache_max, gdal.GetCacheMax())
+        self.assertEqual(previous, gdal.GetConfigOption("GDAL_NUM_THREADS"))
+        self.assertEqual(previous_cache_max, gdal.GetCacheMax())
+
+    def test_options(self):
+        """ Check that the number of threads is passed as creation and warp
+        option.
+        """
+        class FormatSelection(object):
+            driver_name = "GTiff"
+            creation_options = ["TILED=YES", "COMPRESS=DEFLATE"]
+
+        preprocessor = NGEOPreProcessor(FormatSelection(), num_threads="4")
+        self.assertEqual(
+            ["TILED=YES", "COMPRESS=DEFLATE", "NUM_THREADS=4"],
+            preprocessor.get_creation_options()
+        )
+        self.assertEqual(["NUM_THREADS=4"], preprocessor.get_warp_options())
+        self.assertEqual([], NGEOPreProcessor(None).get_warp_options())
+
+
+class GCPBucketTestCase(TestCase):
+    def test_gcp_bucket(self):
+        """ Check that similar numbers of GCPs share a bucket. """
+        self.assertEqual(
+            [1, 1, 2, 2, 4, 8, 8, 16, 1024],
+            map(gcp_bucket, [0, 1, 2, 3, 4, 8, 15, 16, 2000])
+        )
+
+    def test_skip_order(self):
+        """ Check that only orders which failed repeatedly are skipped and
+        that they are tried again after a while.
+        """
+        self.assertFalse(skip_order({}, -1))
+        self.assertFalse(skip_order({-1: (MAX_FAILURE_STREAK - 1, 0)}, -1))
+        self.assertTrue(skip_order({-1: (MAX_FAILURE_STREAK, 0)}, -1))
+        self.assertFalse(skip_order({-1: (MAX_FAILURE_STREAK, 0)}, 3))
+        self.assertFalse(
+            skip_order({-1: (MAX_FAILURE_STREAK, PROBE_INTERVAL)}, -1)
+        )
+
+
+class GCPOrderStatisticsTestCase(TestCase):
+    fixtures = ["ngeo_browse_layer.json"]
+
+    def setUp(self):
+        self.browse_layer = models.BrowseLayer.objects.get(id="TEST_SAR")
+        self.gcp_orders = {}
+
+    def ingest(self, *attempts):
+        record_gcp_attempts(self.browse_layer, [
+            (100, order, succeeded) for order, succeeded in attempts
+        ], self.gcp_orders)
+        self.assertEqual(self.gcp_orders, get_gcp_orders(self.browse_layer))
+        return self.gcp_orders[gcp_bucket(100)]
+
+    def test_outlier(self):
+        """ Check that a single browse falling back to a lower order does
+        not lead to skipping the more accurate orders.
+        """
+        self.ingest((-1, False), (3, False), (2, False), (1, True))
+        statistics = self.ingest((-1, True))
+        self.assertFalse(skip_order(statistics, -1))
+        self.assertEqual((0, 0), statistics[-1])
+
+    def test_repeated_failures(self):
+        """ Check that an order is skipped after failing repeatedly and is
+        tried again after a while.
+        """
+        for _ in range(MAX_FAILURE_STREAK):
+            statistics = self.ingest((-1, False), (3, True))
+        self.assertTrue(skip_order(statistics, -1))
+
+        for _ in range(PROBE_INTERVAL):
+            statistics = self.ingest((-1, None), (3, True))
+        self.assertFalse(skip_order(statistics, -1))
+
+        statistics = self.ingest((-1, True))
+        self.assertFalse(skip_order(statistics, -1))
+
+
+class ApproximateStatisticsTestCase(TestCase):
+    def setUp(self):
+        # a band with the values 0 to 9999 and a no data border
+        self.ds = gdal.GetDriverByName("MEM").Create(
+            "", 102, 102, 1, gdal.GDT_UInt16
+        )
+        values = numpy.zeros((102, 102), dtype=numpy.uint16)
+        values[1:-1, 1:-1] = numpy.arange(1, 10001).reshape((100, 100))
+        band = self.ds.GetRasterBand(1)
+        band.WriteArray(values)
+        band.SetNoDataValue(0)
+
+    def test_full_sample(self):
+        """ Check that a sample covering the band yields the exact values. """
+        self.assertEqual(
+            (1.0, 10000.0),
+            approximate_min_max(self.ds.GetRasterBand(1), 102 * 102)
+        )
+
+    def test_reduced_sample(self):
+        """ Check that a reduced sample stays within the value range. """
+        low, high = approximate_min_max(self.ds.GetRasterBand(1), 100)
+        self.assertTrue(1 <= low < 1000)
+        self.assertTrue(9000 < high <= 10000)
+
+    def test_percentile(self):
+        """ Check that the values are clipped to the percentile. """
+        low, high = approximate_min_max(self.ds.GetRasterBand(1), 102 * 102, 5)
+        self.assertAlmostEqual(500.95, low, 1)
+        self.assertAlmostEqual(9500.05, high, 1)
+
+
+class GCPThinningTestCase(TestCase):
+    def setUp(self):
+        # a regular grid of 40 x 30 nodes of a smoothly distorted image
+        self.gcps = [
+            (10 + pixel * 0.01 + (line * 0.001) ** 2,
+             50 - line * 0.01 + (pixel * 0.001) ** 2, pixel, line)
+            for pixel in range(0, 400, 10) for line in range(0, 300, 10)
+        ]
+
+    def test_thin_grid(self):
+        """ Check that a uniform subgrid including the outer rows and columns
+        is selected.
+        """
+        thinned = thin_grid(self.gcps, 40, 30, 100)
+        self.assertTrue(len(thinned) <= 100)
+        self.assertEqual(
+            (0, 390), (min(g[2] for g in thinned), max(g[2] for g in thinned))
+        )
+        self.assertEqual(
+            (0, 290), (min(g[3] for g in thinned), max(g[3] for g in thinned))
+        )
+        self.assertTrue(max_residual(thinned, self.gcps) < 0.5)
+
+    def test_thin_by_error(self):
+        """ Check that the GCPs are selected until the residuals are within
+        the tolerance.
+        """
+        thinned = thin_by_error(self.gcps, 100, 0.1)
+        self.assertTrue(len(thinned) < 100)
+        self.assertTrue(max_residual(thinned, self.gcps) <= 0.1)
+
+
+class GCPErrorThresholdTestCase(TestCase):
+    def setUp(self):
+        parsed_browse_report = decode_browse_report(etree.parse(join(
+            settings.PROJECT_DIR, "data", "test_data",
+            "ASA_WSM_1PNDPA20050331_075939_000000552036_00035_16121_0775.xml"
+        )).getroot())
+        self.parsed_browse = list(parsed_browse_report)[0]
+
+    def test_exact(self):
+        """ Check that regular grids use EOxServer's exact GCP list by
+        default.
+        """
+        geo_reference = ingest_module._georef_from_parsed(self.parsed_browse)
+        self.assertFalse(isinstance(geo_reference, InternalGCPs))
+
+    def test_approximate(self):
+        """ Check that a positive error threshold selects the internal GCPs
+        supporting the approximate transformer, outside the lazy pipeline.
+        """
+        geo_reference = ingest_module._georef_from_parsed(
+            self.parsed_browse, error_threshold=0.125
+        )
+        self.assertTrue(isinstance(geo_reference, InternalGCPs))
+        self.assertFalse(geo_reference.lazy)
+        self.assertEqual(
+            self.parsed_browse.row_node_number *
+            self.parsed_browse.col_node_number, len(geo_reference.gcps)
+        )
@@ -56,7 +56,17 @@ from ngeo_browse_server.config.browsereport.decoding import (
 )
 from ngeo_browse_server.config.browselayer.decoding import decode_browse_layers
 from ngeo_browse_server.control.ingest.exceptions import IngestionException
+from ngeo_browse_server.control.ingest.config import (
+    INGEST_SECTION, get_worker_config
+)
+from ngeo_browse_server.control.ingest.jobs import (
+    enqueue_ingest_job, get_ingest_queue_status
+)
+from ngeo_browse_server.control.ingest.queues import get_ingest_queue
+from ngeo_browse_server.control.models import IngestJob
 from ngeo_browse_server.control.response import JsonResponse
+from ngeo_browse_server.mapcache.config import get_seed_queue_config
+from ngeo_browse_server.mapcache.tasks import get_seed_queue_status
 from ngeo_browse_server.control.control.register import register, unregister
 from ngeo_browse_server.control.control.config import get_instance_id
 from ngeo_browse_server.control.control.status import get_status
@@ -71,6 +81,9 @@ from ngeo_browse_server.control.queries import (
 )
 from ngeo_browse_server.filetransaction import FileTransaction
 from ngeo_browse_server.mapcache.config import get_mapcache_seed_config
+from ngeo_browse_server.metrics import (
+    get_metrics_store, get_counter_totals, render_metrics
+)
 
 
 logger = logging.getLogger(__name__)
@@ -98,6 +111,15 @@ def ingest(request):
             raise IngestionException("Could not parse request XML. Error was: "
                                      "'%s'." % str(e),
                                      "InvalidRequest")
+        # queue the browse report for asynchronous ingestion
+        if _is_async(request):
+            job = enqueue_ingest_job(document)
+            return JsonResponse({
+                "job": job.id,
+                "status": job.status,
+                "url": "%s/%d" % (request.path.rstrip("/"), job.id)
+            }, status=202)
+
         try:
             parsed_browse_report = decode_browse_report(document.getroot())
             results = ingest_browse_report(parsed_browse_report)
@@ -122,6 +144,40 @@ def ingest(request):
                                   mimetype="text/xml")
 
 
+def ingest_job(request, job_id):
+    """ View to get the state of an asynchronous ingestion. Returns the
+        progress of pending and running jobs and the ingestion response of
+        finished or failed jobs.
+    """
+
+    try:
+        job = IngestJob.objects.get(id=job_id)
+    except IngestJob.DoesNotExist:
+        raise Http404
+
+    if job.status in ("finished", "failed"):
+        return HttpResponse(job.response, mimetype="text/xml")
+
+    return JsonResponse({
+        "job": job.id,
+        "status": job.status,
+        "processed": job.processed,
+        "total": job.total
+    })
+
+
+def _is_async(request):
+    """ Returns `True` if a browse report shall be ingested asynchronously,
+        either requested via the `async` parameter or configured by the
+        `async` setting of the `control.ingest` section.
+    """
+
+    value = request.GET.get("async")
+    if value is None:
+        value = safe_get(get_ngeo_config(), INGEST_SECTION, "async", "false")
+    return value.lower() in ("true", "1", "on", "yes")
+
+
 def controller_server(request):
     config = get_ngeo_config()
     try:
@@ -164,6 +220,88 @@ def controller_server(request):
     return JsonResponse({"result": "SUCCESS"})
 
 
+def get_status_queues():
+    """ Returns the status queues of enabled features, e.g. the seed queue. """
+
+    queues = []
+
+    if get_seed_queue_config()["enabled"]:
+        counts = get_seed_queue_status()
+        queues.append({
+            "name": "seeding",
+            "counters": [
+                {"name": name, "value": counts[name]}
+                for name in ("pending", "running", "failed")
+            ]
+        })
+
+    store = get_metrics_store()
+    if store:
+        values = store.read()
+        counts = get_ingest_queue_status()
+        queues.append({
+            "name": "ingestion",
+            "counters": [
+                {"name": name, "value": counts[name]}
+                for name in ("pending", "running")
+            ] + [
+                {"name": name, "value": get_counter_totals(
+                    values, "ngeo_%s_total" % metric
+                )}
+                for name, metric in (("ingested", "browses_ingested"),
+                                     ("failed", "browses_failed"),
+                                     ("skipped", "browses_skipped"),
+                                     ("bytes_written", "bytes_written"))
+            ]
+        })
+
+    return queues
+
+
+def get_queue_depths(config=None):
+    """ Returns the queue depths as gauges for `render_metrics`. """
+
+    config = config or get_ngeo_config()
+    gauges = []
+
+    if get_seed_queue_config(config)["enabled"]:
+        for status, count in sorted(get_seed_queue_status().items()):
+            gauges.append(("ngeo_queue_depth",
+                           {"queue": "seeding", "status": status}, count))
+
+    for status, count in sorted(get_ingest_queue_status().items()):
+        gauges.append(("ngeo_queue_depth",
+                       {"queue": "jobs", "status": status}, count))
+
+    # the queue of the configured ingest worker backend
+    worker_config = get_worker_config(config)
+    if worker_config["backend"] != "jobs":
+        try:
+            queue = get_ingest_queue(worker_config["backend"], worker_config)
+            depth = queue.depth()
+        except Exception, e:
+            logger.warning("Failed to get the depth of the '%s' ingest "
+                           "queue: %s" % (worker_config["backend"], e))
+        else:
+            if depth is not None:
+                gauges.append(("ngeo_queue_depth",
+                               {"queue": queue.name, "status": "pending"},
+                               depth))
+
+    return gauges
+
+
+def metrics(request):
+    """ View to scrape the metrics in the plain text exposition format. """
+
+    store = get_metrics_store()
+    if not store:
+        raise Http404
+
+    return HttpResponse(render_metrics(store.read(), get_queue_depths()),
+                        content_type="text/plain; version=0.0.4")
+
+
 def status(request):
     status = get_status()
 
@@ -174,17 +312,7 @@ def status(request):
                 "timestamp": dt.datetime.now().replace(microsecond=0).isoformat(),
                 "state": status.state(),
                 "softwareversion": get_version(),
-                "queues": [
-                    # TODO: find relevant status queues
-                    #{"name": "request1",
-                    #"counters": [{
-                    #    "name": "counter1",
-                    #    "value": 2
-                    #}, {
-                    #    "name": "counter2",
-                    #    "value": 2
-                    #}]}
-                ]
+                "queues": get_status_queues()
             })
 
         # PUT means "control"
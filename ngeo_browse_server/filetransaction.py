@@ -46,11 +46,16 @@ logger = logging.getLogger(__name__)
 class FileTransaction(object):
     """ File Transaction guard to save previous files for a critical section to
     be used with the "with"-statement.
+
+    With `defer` the transaction is not finished when the critical section
+    succeeds, so that the backups are kept until `commit` or `rollback` is
+    called, e.g. once the corresponding database changes are committed.
     """
 
-    def __init__(self, subject_filenames, copy=False):
+    def __init__(self, subject_filenames, copy=False, defer=False):
         self._subject_filenames = subject_filenames
         self._copy = copy
+        self._defer = defer
 
     def __enter__(self):
         " Start of critical block. Check if file exists and create backup. "
@@ -74,35 +79,49 @@ class FileTransaction(object):
             else:
                 shutil.move(filename, self._file_map[filename][1])
 
+        return self
+
     def __exit__(self, etype, value, traceback):
         " End of critical block. Either revert changes or delete backup. "
 
         # on success
         if (etype, value, traceback) == (None, None, None):
-            # delete all backups because no error occurred
-            logger.debug("Removing backups because no error occurred.")
-            for filename, (handle, backup_filename) in self._file_map.items():
-                logger.debug("Remove backup for '%s'." % filename)
-                close(handle)
-                remove(backup_filename)
+            if not self._defer:
+                self.commit()
 
         # on error
         else:
-            # try removing the new file because an error occurred.
-            # It may not exist.
-            logger.debug("Performing rollback because an error occurred.")
-            for filename in set(self._subject_filenames):
-                try:
-                    remove(filename)
-                    logger.debug("Deleting '%s'." % filename)
-                except (OSError, TypeError):
-                    pass
-
-            # restore all backups
-            for filename, (handle, backup_filename) in self._file_map.items():
-                logger.debug("Restoring backup for '%s'." % filename)
-                close(handle)
-                shutil.move(backup_filename, filename)
+            self.rollback()
+
+    def commit(self):
+        " Delete all backups because no error occurred. "
+
+        logger.debug("Removing backups because no error occurred.")
+        for filename, (handle, backup_filename) in self._file_map.items():
+            logger.debug("Remove backup for '%s'." % filename)
+            close(handle)
+            remove(backup_filename)
+        self._file_map = {}
+
+    def rollback(self):
+        " Remove the new files and restore all backups. "
+
+        # try removing the new file because an error occurred.
+        # It may not exist.
+        logger.debug("Performing rollback because an error occurred.")
+        for filename in set(self._subject_filenames):
+            try:
+                remove(filename)
+                logger.debug("Deleting '%s'." % filename)
+            except (OSError, TypeError):
+                pass
+
+        # restore all backups
+        for filename, (handle, backup_filename) in self._file_map.items():
+            logger.debug("Restoring backup for '%s'." % filename)
+            close(handle)
+            shutil.move(backup_filename, filename)
+        self._file_map = {}
 
 
 def filetransaction(subject_filenames, copy=False):
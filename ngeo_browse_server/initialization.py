@@ -0,0 +1,109 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Process wide initialization of the EOxServer system and GDAL. All entry
+points call `initialize`, which does the actual work only once per process.
+`warm_up` additionally preloads everything the first request would need and
+is called when the WSGI application is loaded.
+"""
+
+import logging
+from threading import Lock
+from time import time
+from importlib import import_module
+
+from django.db import connections
+from eoxserver.core.system import System
+from osgeo import gdal, ogr
+
+
+logger = logging.getLogger(__name__)
+
+
+# modules of the views, imported during warm up
+VIEW_MODULES = (
+    "eoxserver.services.views",
+    "ngeo_browse_server.control.views",
+)
+
+_initialized = False
+_lock = Lock()
+
+
+def initialize(force=False):
+    """ Initializes the EOxServer system/registry/configuration and registers
+    the GDAL/OGR drivers, unless this was already done in this process.
+    Returns `True` if the initialization was performed.
+    """
+
+    global _initialized
+
+    if _initialized and not force:
+        return False
+
+    with _lock:
+        if _initialized and not force:
+            return False
+
+        start = time()
+        System.init()
+        gdal.AllRegister()
+        ogr.RegisterAll()
+        _initialized = True
+
+    logger.debug("Initialized EOxServer system and GDAL in %.3f seconds."
+                 % (time() - start))
+    return True
+
+
+def warm_up():
+    """ Initializes the process and preloads the views and the browse layers,
+    so that the first request does not pay for it. Returns the time it took
+    in seconds.
+    """
+
+    # import here, as the models require the settings to be configured
+    from ngeo_browse_server.config import models
+
+    start = time()
+    initialize()
+
+    for module in VIEW_MODULES:
+        import_module(module)
+
+    browse_layers = len(models.BrowseLayer.objects.all())
+
+    # requests use connections of their own
+    for connection in connections.all():
+        connection.close()
+
+    duration = time() - start
+    logger.info("Warmed up process with %d browse layer%s in %.3f seconds."
+                % (browse_layers, "s" if browse_layers != 1 else "", duration))
+    return duration
@@ -28,6 +28,7 @@
 import os
 import errno
 import time
+import socket
 from functools import wraps
 
 
@@ -126,3 +127,35 @@ def file_locked(lockfile, timeout=None, delay=.05):
                 return func(*args, **kwargs)
         return wrapper
     return outer_wrapper
+
+
+def get_owner(token=None):
+    """ Returns an identifier of the current process and the optional token,
+        to claim shared resources like database records or queue items.
+    """
+    owner = "%s:%d" % (socket.gethostname(), os.getpid())
+    if token:
+        owner = "%s:%s" % (owner, token)
+    return owner
+
+
+def is_owner_alive(owner):
+    """ Returns whether the process of an identifier returned by `get_owner`
+        is still running, or `None` if this cannot be determined as it runs
+        on another host.
+    """
+    try:
+        host, pid = owner.split(":")[:2]
+        pid = int(pid)
+    except ValueError:
+        return False
+
+    if host != socket.gethostname():
+        return None
+
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        # EPERM: the process exists, but belongs to another user
+        return err.errno != errno.ESRCH
+    return True
@@ -29,8 +29,9 @@
 
 from django.contrib import admin
 from ngeo_browse_server.mapcache.models import (
-    Source, Time
+    Source, Time, SeedJob
 )
 
 admin.site.register(Source)
 admin.site.register(Time)
+admin.site.register(SeedJob)
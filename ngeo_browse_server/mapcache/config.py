@@ -49,6 +49,25 @@ def get_mapcache_seed_config(config=None):
     return values
 
 
+def get_seed_queue_config(config=None):
+    """ Returns a dictionary with all seed queue related config settings. """
+    
+    values = {}
+    config = config or get_ngeo_config()
+    
+    values["enabled"] = safe_get(
+        config, SEED_SECTION, "queue", "false"
+    ).lower() in ("true", "1", "on", "yes")
+    values["max_attempts"] = int(
+        safe_get(config, SEED_SECTION, "queue_max_attempts", 3)
+    )
+    values["retry_delay"] = float(
+        safe_get(config, SEED_SECTION, "queue_retry_delay", 60)
+    )
+    
+    return values
+
+
 def get_tileset_path(browse_type, config=None):
     """ Returns the path to a tileset SQLite file in the `tileset_root` dir. """
     
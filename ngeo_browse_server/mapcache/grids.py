@@ -0,0 +1,90 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" The tile grids of the browse layers as defined by MapCache. The resolution
+of each zoom level is half the resolution of the level above.
+"""
+
+import math
+from collections import namedtuple
+
+
+Grid = namedtuple("Grid", ("srid", "extent", "resolution", "tile_size"))
+
+
+GRIDS = {
+    "urn:ogc:def:wkss:OGC:1.0:GoogleMapsCompatible": Grid(
+        3857, (-20037508.3427892, -20037508.3427892,
+               20037508.3427892, 20037508.3427892),
+        156543.0339280410, 256
+    ),
+    "urn:ogc:def:wkss:OGC:1.0:GoogleCRS84Quad": Grid(
+        4326, (-180.0, -90.0, 180.0, 90.0), 0.703125, 256
+    )
+}
+
+
+def get_grid(urn):
+    """ Returns the `Grid` of the given grid URN. """
+
+    return GRIDS[urn]
+
+
+def level_resolution(grid, level):
+    """ Returns the pixel size of the given zoom level. """
+
+    return grid.resolution / (2 ** level)
+
+
+def nearest_level(grid, resolution, lowest=None, highest=None):
+    """ Returns the zoom level whose pixel size is nearest to the given one,
+    within the optional range of levels.
+    """
+
+    level = int(round(math.log(grid.resolution / resolution, 2)))
+    if lowest is not None:
+        level = max(lowest, level)
+    if highest is not None:
+        level = min(highest, level)
+    return max(0, level)
+
+
+def snap_extent(grid, extent, resolution):
+    """ Extends the extent to the pixel boundaries of the given pixel size,
+    aligned to the upper left corner of the grid.
+    """
+
+    origin_x, origin_y = grid.extent[0], grid.extent[3]
+    minx, miny, maxx, maxy = extent
+    return (
+        origin_x + math.floor((minx - origin_x) / resolution) * resolution,
+        origin_y - math.ceil((origin_y - miny) / resolution) * resolution,
+        origin_x + math.ceil((maxx - origin_x) / resolution) * resolution,
+        origin_y - math.floor((origin_y - maxy) / resolution) * resolution
+    )
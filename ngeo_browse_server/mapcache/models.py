@@ -77,3 +77,51 @@ class Time(models.Model):
     
     class Meta:
         db_table = "time"
+
+class SeedJob(models.Model):
+    """A queued seeding or un-seeding of an area of a tileset. Seed jobs are
+    processed in order by the `ngeo_seed_worker` command.
+
+    """
+    tileset = models.CharField(max_length=1024)
+    grid = models.CharField(max_length=45)
+
+    minx = models.FloatField()
+    miny = models.FloatField()
+    maxx = models.FloatField()
+    maxy = models.FloatField()
+
+    minzoom = models.IntegerField(null=True, blank=True)
+    maxzoom = models.IntegerField(null=True, blank=True)
+
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+
+    mode = models.CharField(max_length=6, default="seed",
+        choices=(
+            ("seed", "seed"),
+            ("delete", "delete")
+        )
+    )
+    force = models.BooleanField(default=True)
+
+    status = models.CharField(max_length=7, default="pending",
+        choices=(
+            ("pending", "pending"),
+            ("running", "running"),
+            ("failed", "failed")
+        )
+    )
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField()
+    message = models.TextField(blank=True)
+
+    # the worker process running the job
+    owner = models.CharField(max_length=256, blank=True)
+
+    def __unicode__(self):
+        return ("Seed job '%s' for '%s' (%s)"
+                % (self.mode, self.tileset, self.status))
+
+    class Meta:
+        db_table = "seed_job"
@@ -0,0 +1,146 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Planning of MapCache seed operations.
+
+Ingesting or deleting a group of browses results in a sequence of seed and
+un-seed operations, each of them a single invocation of the seed command. As
+these operations frequently overlap, the sequence is reduced to an equivalent,
+minimal one before seeding.
+"""
+
+from collections import namedtuple
+
+
+class SeedArea(namedtuple("SeedArea", "minx miny maxx maxy start_time end_time")):
+    """ An area of a time dimension to be seeded. """
+
+    __slots__ = ()
+
+    delete = False
+
+    @property
+    def time(self):
+        return (self.start_time, self.end_time)
+
+    @property
+    def size(self):
+        return (self.maxx - self.minx) * (self.maxy - self.miny)
+
+    def contains(self, other):
+        return (self.minx <= other.minx and self.miny <= other.miny and
+                self.maxx >= other.maxx and self.maxy >= other.maxy)
+
+    def intersects(self, other):
+        return (self.minx <= other.maxx and self.maxx >= other.minx and
+                self.miny <= other.maxy and self.maxy >= other.miny)
+
+    def union(self, other):
+        return type(self)(
+            min(self.minx, other.minx), min(self.miny, other.miny),
+            max(self.maxx, other.maxx), max(self.maxy, other.maxy),
+            self.start_time, self.end_time
+        )
+
+
+class UnseedArea(SeedArea):
+    """ An area of a time dimension to be deleted from the cache. """
+
+    __slots__ = ()
+
+    delete = True
+
+
+def plan_seed_areas(areas, force=True):
+    """ Reduces a sequence of seed areas to the minimal sequence of seed
+    operations resulting in the same cache. Areas are expected as
+    `SeedArea` or `UnseedArea` objects, plain `(minx, miny, maxx, maxy,
+    start_time, end_time)` tuples are treated as areas to be seeded.
+
+    Only areas of the same time dimension affect each other. The rules are:
+
+      * an operation is dropped when a later operation covers its area, e.g.
+        a seed followed by an un-seed or an un-seed followed by a forced seed
+      * an area is dropped when an earlier area of the same kind contains it
+        and no operation in between interferes
+      * two seed areas are merged to their union when it is not larger than
+        the two areas together, i.e. when they are adjacent or overlap enough
+
+    Returns a tuple of the planned areas in their order of execution and the
+    number of saved seed invocations.
+    """
+
+    planned = []
+    requested = 0
+
+    for area in areas:
+        requested += 1
+        if not isinstance(area, SeedArea):
+            area = SeedArea(*area)
+
+        changed = True
+        while changed and area is not None:
+            changed = False
+            same_time = [
+                (i, other) for i, other in enumerate(planned)
+                if other.time == area.time
+            ]
+
+            for i, other in same_time:
+                later = [o for j, o in same_time if j > i]
+
+                if area.contains(other) and (
+                        area.delete or force or not other.delete):
+                    # the earlier operation is overridden by the current one
+                    planned[i] = None
+                    changed = True
+
+                elif other.delete == area.delete and other.contains(area) and \
+                        not any(o.delete != area.delete and o.intersects(area)
+                                for o in later):
+                    # the current operation is already covered
+                    area = None
+                    break
+
+                elif not area.delete and not other.delete:
+                    union = other.union(area)
+                    if union.size <= other.size + area.size and \
+                            not any(o.delete and o.intersects(union)
+                                    for o in later):
+                        planned[i] = None
+                        area = union
+                        changed = True
+                        break
+
+            planned = [other for other in planned if other is not None]
+
+        if area is not None:
+            planned.append(area)
+
+    return planned, requested - len(planned)
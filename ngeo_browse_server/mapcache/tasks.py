@@ -27,25 +27,34 @@
 # THE SOFTWARE.
 #-------------------------------------------------------------------------------
 
+import time
 import logging
 import subprocess
+from datetime import timedelta
 from functools import wraps
 
 from lxml import etree
 from lxml.builder import E
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.db.models import Count
+from django.utils.timezone import now
 
 from ngeo_browse_server.config import (
     get_ngeo_config, get_project_relative_path, safe_get
 )
-from ngeo_browse_server.lock import (FileLock, LockException)
+from ngeo_browse_server.lock import (
+    FileLock, LockException, get_owner, is_owner_alive
+)
+from ngeo_browse_server.metrics import observe
 from ngeo_browse_server.mapcache.exceptions import (
     SeedException, LayerException
 )
 from ngeo_browse_server.mapcache.tileset import URN_TO_GRID
+from ngeo_browse_server.mapcache.models import SeedJob
+from ngeo_browse_server.mapcache.planning import plan_seed_areas
 from ngeo_browse_server.mapcache.config import (
-    get_mapcache_seed_config, get_tileset_path
+    get_mapcache_seed_config, get_seed_queue_config, get_tileset_path
 )
 
 
@@ -131,7 +140,12 @@ def seed_mapcache(seed_command, config_file, tileset, grid,
             get_project_relative_path("mapcache_seed.lck"), timeout=timeout
         )
 
+        # only the time holding the lock is seeding time, waiting for it is
+        # recorded separately
+        seconds = 0.0
+        _acquire_seed_lock(lock, tileset)
         with lock:
+            begin = time.time()
             logger.debug("mapcache seeding command: '%s'. raw: '%s'."
                          % (" ".join(seed_args), seed_args))
             process = subprocess.Popen(seed_args, stdout=subprocess.PIPE,
@@ -142,6 +156,7 @@ def seed_mapcache(seed_command, config_file, tileset, grid,
                 for line in string.split("\n"):
                     if line != '':
                         logger.info("MapCache output: %s" % line)
+            seconds += time.time() - begin
 
         if process.returncode != 0:
             raise SeedException("'%s' failed. Returncode '%d'."
@@ -149,7 +164,9 @@ def seed_mapcache(seed_command, config_file, tileset, grid,
 
         # seed second extent if dateline is crossed
         if dateline_crossed:
+            _acquire_seed_lock(lock, tileset)
             with lock:
+                begin = time.time()
                 index = seed_args.index("%f,%f,%f,%f" % (minx, miny, bounds[2], maxy))
                 seed_args[index] = "%f,%f,%f,%f" % (bounds[0], miny, maxx-full, maxy)
                 logger.debug("mapcache seeding command: '%s'. raw: '%s'."
@@ -162,6 +179,7 @@ def seed_mapcache(seed_command, config_file, tileset, grid,
                     for line in string.split("\n"):
                         if line != '':
                             logger.info("MapCache output: %s" % line)
+                seconds += time.time() - begin
 
             if process.returncode != 0:
                 raise SeedException("'%s' failed. Returncode '%d'."
@@ -170,11 +188,182 @@ def seed_mapcache(seed_command, config_file, tileset, grid,
     except LockException, e:
         raise SeedException("Seeding failed: %s" % str(e))
 
+    observe("ngeo_seeding_seconds", seconds, tileset=tileset)
     logger.info("Seeding finished with returncode '%d'." % process.returncode)
 
     return process.returncode
 
 
+def _acquire_seed_lock(lock, tileset):
+    """ Acquires the seed lock and records the time spent waiting for it. """
+
+    begin = time.time()
+    lock.acquire()
+    observe("ngeo_seed_lock_wait_seconds", time.time() - begin,
+            tileset=tileset)
+
+
+def schedule_seed(tileset, grid, minx, miny, maxx, maxy, minzoom, maxzoom,
+                  start_time, end_time, delete, force=True, config=None):
+    """ Seeds or un-seeds MapCache. When the seed queue is enabled, a seed job
+    is added to the queue, which is stored in the mapcache database and thus
+    part of its current transaction. Otherwise `seed_mapcache` is run
+    synchronously.
+    """
+
+    config = config or get_ngeo_config()
+
+    if not get_seed_queue_config(config)["enabled"]:
+        return seed_mapcache(tileset=tileset, grid=grid,
+                             minx=minx, miny=miny, maxx=maxx, maxy=maxy,
+                             minzoom=minzoom, maxzoom=maxzoom,
+                             start_time=start_time, end_time=end_time,
+                             delete=delete, force=force,
+                             **get_mapcache_seed_config(config))
+
+    if grid not in URN_TO_GRID:
+        raise SeedException("Invalid grid '%s'." % grid)
+
+    job = SeedJob(tileset=tileset, grid=grid,
+                  minx=minx, miny=miny, maxx=maxx, maxy=maxy,
+                  minzoom=minzoom, maxzoom=maxzoom,
+                  start_time=start_time, end_time=end_time,
+                  mode="seed" if not delete else "delete", force=force,
+                  next_attempt=now())
+    job.full_clean()
+    job.save()
+
+    logger.info("Queued seed job for tileset '%s' with extent "
+                "'%s,%s,%s,%s' and mode '%s'."
+                % (tileset, minx, miny, maxx, maxy, job.mode))
+    return job
+
+
+def schedule_seed_areas(browse_layer, seed_areas, force=True, config=None):
+    """ Seeds or un-seeds all given areas of the browse layer after reducing
+    them to the minimal number of seed operations. Failing operations are
+    logged and skipped. Returns the number of saved seed invocations.
+    """
+
+    planned, saved = plan_seed_areas(seed_areas, force)
+    if saved:
+        logger.info("Coalesced %d seed areas to %d, saving %d seed "
+                    "invocations." % (len(planned) + saved, len(planned),
+                                      saved))
+
+    for area in planned:
+        try:
+            schedule_seed(tileset=browse_layer.id,
+                          grid=browse_layer.grid,
+                          minx=area.minx, miny=area.miny,
+                          maxx=area.maxx, maxy=area.maxy,
+                          minzoom=browse_layer.lowest_map_level,
+                          maxzoom=browse_layer.highest_map_level,
+                          start_time=area.start_time,
+                          end_time=area.end_time,
+                          delete=area.delete, force=force, config=config)
+            logger.info("Successfully finished %s."
+                        % ("un-seeding" if area.delete else "seeding"))
+
+        except Exception, e:
+            logger.warn("%s failed: %s"
+                        % ("Un-seeding" if area.delete else "Seeding", str(e)))
+
+    return saved
+
+
+def claim_seed_job():
+    """ Returns the next pending seed job and marks it as running by the
+    current process, or `None` if there is none or it is not yet due. Seed
+    jobs are claimed strictly in order, as a later job may depend on the
+    result of a previous one.
+    """
+
+    try:
+        job = SeedJob.objects.filter(status="pending").order_by("id")[0]
+    except IndexError:
+        return None
+
+    if job.next_attempt > now():
+        return None
+
+    # make sure that no other worker claimed the job in the meantime
+    owner = get_owner()
+    if not SeedJob.objects.filter(id=job.id, status="pending").update(
+            status="running", owner=owner):
+        return None
+
+    job.status = "running"
+    job.owner = owner
+    return job
+
+
+def run_seed_job(job, config=None):
+    """ Performs a claimed seed job. Successful jobs are removed from the
+    queue, failed ones are retried with an increasing delay until the
+    configured maximum number of attempts is reached.
+    """
+
+    config = config or get_ngeo_config()
+    queue_config = get_seed_queue_config(config)
+
+    try:
+        seed_mapcache(tileset=job.tileset, grid=job.grid,
+                      minx=job.minx, miny=job.miny,
+                      maxx=job.maxx, maxy=job.maxy,
+                      minzoom=job.minzoom, maxzoom=job.maxzoom,
+                      start_time=job.start_time, end_time=job.end_time,
+                      delete=(job.mode == "delete"), force=job.force,
+                      **get_mapcache_seed_config(config))
+    except Exception, e:
+        job.attempts += 1
+        job.message = str(e)
+
+        if job.attempts >= queue_config["max_attempts"]:
+            logger.error("Seed job %d failed %d times, giving up. Error was: "
+                         "'%s'." % (job.id, job.attempts, job.message))
+            job.status = "failed"
+        else:
+            delay = queue_config["retry_delay"] * 2 ** (job.attempts - 1)
+            logger.warn("Seed job %d failed, retrying in %d seconds. Error "
+                        "was: '%s'." % (job.id, delay, job.message))
+            job.status = "pending"
+            job.owner = ""
+            job.next_attempt = now() + timedelta(seconds=delay)
+
+        job.save()
+        return False
+
+    job.delete()
+    return True
+
+
+def reset_seed_jobs(force=False):
+    """ Re-queues the running seed jobs of workers whose process is gone, e.g.
+    because it was killed. With `force` all running jobs are re-queued, which
+    is only safe when no worker is running. Returns the number of re-queued
+    jobs.
+    """
+
+    jobs = SeedJob.objects.filter(status="running")
+    if not force:
+        owners = [
+            owner for owner in set(jobs.values_list("owner", flat=True))
+            if is_owner_alive(owner) is False
+        ]
+        jobs = jobs.filter(owner__in=owners)
+    return jobs.update(status="pending", owner="")
+
+
+def get_seed_queue_status():
+    """ Returns a dictionary with the number of seed jobs per status. """
+
+    status = {"pending": 0, "running": 0, "failed": 0}
+    for values in SeedJob.objects.values("status").annotate(count=Count("id")):
+        status[values["status"]] = values["count"]
+    return status
+
+
 def lock_mapcache_config(func):
     """ Decorator for functions involving the mapcache configuration to lock
         the mapcache configuration.
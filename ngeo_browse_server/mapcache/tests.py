@@ -27,4 +27,128 @@
 # THE SOFTWARE.
 #-------------------------------------------------------------------------------
 
+import socket
 from django.test import TestCase
+from django.utils.timezone import now
+from datetime import datetime
+
+from ngeo_browse_server.mapcache.models import SeedJob
+from ngeo_browse_server.mapcache.tasks import claim_seed_job, reset_seed_jobs
+from ngeo_browse_server.mapcache.planning import (
+    SeedArea, UnseedArea, plan_seed_areas
+)
+from ngeo_browse_server.mapcache.grids import (
+    get_grid, level_resolution, nearest_level, snap_extent
+)
+
+
+T1 = (datetime(2010, 7, 19, 10, 10), datetime(2010, 7, 19, 10, 12))
+T2 = (datetime(2010, 7, 22, 10, 15), datetime(2010, 7, 22, 10, 17))
+
+
+class SeedPlanningTestCase(TestCase):
+    def assertPlan(self, areas, expected_areas, expected_saved, force=True):
+        planned, saved = plan_seed_areas(areas, force)
+        self.assertEqual(expected_areas, planned)
+        self.assertEqual([area.delete for area in expected_areas],
+                         [area.delete for area in planned])
+        self.assertEqual(expected_saved, saved)
+
+    def test_duplicates(self):
+        self.assertPlan(
+            [(0, 0, 10, 10) + T1, (0, 0, 10, 10) + T1, (2, 2, 5, 5) + T1],
+            [SeedArea(0, 0, 10, 10, *T1)], 2
+        )
+
+    def test_adjacent_areas(self):
+        self.assertPlan(
+            [(0, 0, 10, 10) + T1, (10, 0, 20, 10) + T1, (5, 0, 15, 10) + T1],
+            [SeedArea(0, 0, 20, 10, *T1)], 2
+        )
+
+    def test_distant_areas(self):
+        areas = [SeedArea(0, 0, 10, 10, *T1), SeedArea(20, 20, 30, 30, *T1)]
+        self.assertPlan(areas, areas, 0)
+
+    def test_different_times(self):
+        areas = [SeedArea(0, 0, 10, 10, *T1), SeedArea(0, 0, 10, 10, *T2)]
+        self.assertPlan(areas, areas, 0)
+
+    def test_unseed_seed(self):
+        self.assertPlan(
+            [UnseedArea(0, 0, 10, 10, *T1), SeedArea(0, 0, 20, 10, *T1)],
+            [SeedArea(0, 0, 20, 10, *T1)], 1
+        )
+
+    def test_unseed_seed_not_forced(self):
+        areas = [UnseedArea(0, 0, 10, 10, *T1), SeedArea(0, 0, 20, 10, *T1)]
+        self.assertPlan(areas, areas, 0, force=False)
+
+    def test_seed_unseed(self):
+        self.assertPlan(
+            [SeedArea(0, 0, 10, 10, *T1), UnseedArea(0, 0, 10, 10, *T1),
+             SeedArea(0, 0, 20, 10, *T2)],
+            [UnseedArea(0, 0, 10, 10, *T1), SeedArea(0, 0, 20, 10, *T2)], 1
+        )
+
+    def test_seed_unseed_seed(self):
+        self.assertPlan(
+            [SeedArea(0, 0, 10, 10, *T1), UnseedArea(5, 0, 10, 10, *T1),
+             SeedArea(0, 0, 10, 10, *T1)],
+            [SeedArea(0, 0, 10, 10, *T1)], 2
+        )
+
+    def test_merge_blocked_by_unseed(self):
+        areas = [SeedArea(0, 0, 10, 10, *T1), UnseedArea(8, 0, 12, 10, *T1),
+                 SeedArea(10, 0, 20, 10, *T1)]
+        self.assertPlan(areas, areas, 0)
+
+
+class GridTestCase(TestCase):
+    grid = get_grid("urn:ogc:def:wkss:OGC:1.0:GoogleCRS84Quad")
+
+    def test_nearest_level(self):
+        self.assertEqual(9, nearest_level(self.grid, 0.001))
+        self.assertEqual(8, nearest_level(self.grid, 0.001, 2, 8))
+        self.assertEqual(2, nearest_level(self.grid, 0.5, 2, 8))
+
+    def test_snap_extent(self):
+        resolution = level_resolution(self.grid, 10)
+        snapped = snap_extent(self.grid, (10.0005, 40.3, 11.2, 41.7),
+                              resolution)
+        self.assertTrue(snapped[0] <= 10.0005 and snapped[1] <= 40.3)
+        self.assertTrue(snapped[2] >= 11.2 and snapped[3] >= 41.7)
+        for value, origin in zip(snapped, (-180, 90, -180, 90)):
+            pixels = (value - origin) / resolution
+            self.assertAlmostEqual(round(pixels), pixels)
+
+
+class SeedJobResetTestCase(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        SeedJob.objects.create(
+            tileset="TEST", grid="GoogleCRS84Quad", minx=0, miny=0, maxx=10,
+            maxy=10, start_time=T1[0], end_time=T1[1], next_attempt=now()
+        )
+
+    def test_reset(self):
+        """ Check that running jobs are only re-queued when their worker is
+        gone or when forced.
+        """
+        job = claim_seed_job()
+        self.assertEqual("running", job.status)
+
+        # the claiming worker is still running
+        self.assertEqual(0, reset_seed_jobs())
+        self.assertEqual(None, claim_seed_job())
+
+        # the claiming worker is gone
+        SeedJob.objects.filter(id=job.id).update(
+            owner="%s:%d" % (socket.gethostname(), 2 ** 22 + 1)
+        )
+        self.assertEqual(1, reset_seed_jobs())
+        self.assertEqual(job.id, claim_seed_job().id)
+
+        self.assertEqual(1, reset_seed_jobs(force=True))
+        self.assertEqual(job.id, claim_seed_job().id)
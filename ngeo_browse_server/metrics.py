@@ -0,0 +1,241 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Counters and histograms of the ingestion and seeding. The metrics are kept
+in a JSON file of the instance, which is locked for every update, so the
+metrics of all processes of an instance, e.g. the WSGI processes and the
+ingest and seed workers, are aggregated. Recording metrics never fails the
+calling operation, errors are only logged.
+
+Metrics are disabled unless the `enabled` option of the `metrics` section is
+set.
+"""
+
+import os
+import json
+import logging
+from os.path import exists
+from contextlib import contextmanager
+
+from ngeo_browse_server.config import (
+    get_ngeo_config, get_project_relative_path, safe_get
+)
+from ngeo_browse_server.lock import FileLock
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_SECTION = "metrics"
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def get_metrics_config(config=None):
+    config = config or get_ngeo_config()
+
+    return {
+        "enabled": safe_get(
+            config, METRICS_SECTION, "enabled", "false"
+        ).lower() in ("true", "1", "on", "yes"),
+        "path": get_project_relative_path(
+            safe_get(config, METRICS_SECTION, "path", "metrics.json")
+        ),
+        "lock_timeout": float(
+            safe_get(config, METRICS_SECTION, "lock_timeout", 5)
+        )
+    }
+
+
+def _label_string(labels):
+    """ Returns the labels in the notation of the text exposition format,
+    e.g. 'layer="TEST_SAR"'.
+    """
+
+    return ",".join(
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in sorted(labels.items())
+    )
+
+
+class MetricsStore(object):
+    """ Stores counters and histograms in a JSON file. Each metric is a
+    mapping of label strings to the counter value, or to the bucket counts,
+    sum, and count of the histogram respectively.
+    """
+
+    def __init__(self, path, lock_timeout=5.0):
+        self.path = path
+        self.lock_timeout = lock_timeout
+
+    def read(self):
+        """ Returns the stored metrics as a dictionary with the "counters" and
+        "histograms" entries.
+        """
+
+        if not exists(self.path):
+            return {"counters": {}, "histograms": {}}
+
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            logger.warn("Discarding corrupt metrics file '%s'." % self.path)
+            return {"counters": {}, "histograms": {}}
+
+    def _write(self, metrics):
+        # write to a temporary file first, so that readers never see a
+        # partially written file
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(metrics, f)
+        os.rename(tmp_path, self.path)
+
+    @contextmanager
+    def _locked(self):
+        with FileLock(self.path + ".lck", self.lock_timeout):
+            metrics = self.read()
+            yield metrics
+            self._write(metrics)
+
+    def update(self, increments=(), observations=()):
+        """ Adds the values to the counters and the histograms in a single
+        update. Both are given as iterables of tuples of the metric name, the
+        labels dictionary, and the value.
+        """
+
+        with self._locked() as metrics:
+            counters = metrics["counters"]
+            for name, labels, value in increments:
+                series = counters.setdefault(name, {})
+                key = _label_string(labels)
+                series[key] = series.get(key, 0) + value
+
+            histograms = metrics["histograms"]
+            for name, labels, value in observations:
+                series = histograms.setdefault(name, {})
+                histogram = series.setdefault(_label_string(labels), {
+                    "buckets": list(BUCKETS),
+                    "counts": [0] * (len(BUCKETS) + 1),
+                    "sum": 0.0,
+                    "count": 0
+                })
+                index = len(histogram["buckets"])
+                for i, bound in enumerate(histogram["buckets"]):
+                    if value <= bound:
+                        index = i
+                        break
+                histogram["counts"][index] += 1
+                histogram["sum"] += value
+                histogram["count"] += 1
+
+    def reset(self):
+        with self._locked() as metrics:
+            metrics.clear()
+            metrics.update({"counters": {}, "histograms": {}})
+
+
+def get_metrics_store(config=None):
+    """ Returns the `MetricsStore` of the instance or `None` if metrics are
+    disabled.
+    """
+
+    metrics_config = get_metrics_config(config)
+    if not metrics_config["enabled"]:
+        return None
+    return MetricsStore(metrics_config["path"], metrics_config["lock_timeout"])
+
+
+def record(increments=(), observations=(), config=None):
+    """ Records counter increments and histogram observations, given as tuples
+    of metric name, labels dictionary, and value, if metrics are enabled.
+    """
+
+    try:
+        store = get_metrics_store(config)
+        if store and (increments or observations):
+            store.update(increments, observations)
+    except Exception, e:
+        logger.warn("Failed to record metrics: %s" % e)
+
+
+def increment(name, value=1, config=None, **labels):
+    """ Increments a counter if metrics are enabled. """
+
+    record(increments=[(name, labels, value)], config=config)
+
+
+def observe(name, value, config=None, **labels):
+    """ Adds an observation to a histogram if metrics are enabled. """
+
+    record(observations=[(name, labels, value)], config=config)
+
+
+def get_counter_totals(metrics, name):
+    """ Returns the sum of a counter over all of its labels. """
+
+    return sum(metrics["counters"].get(name, {}).values())
+
+
+def render_metrics(metrics, gauges=()):
+    """ Renders the metrics and the given gauges, tuples of name, labels
+    dictionary, and value, in the plain text exposition format of Prometheus.
+    """
+
+    def series(name, labels, value, extra=""):
+        labels = ",".join(filter(None, (labels, extra)))
+        return "%s%s %s" % (name, "{%s}" % labels if labels else "", value)
+
+    lines = []
+    for name, values in sorted(metrics["counters"].items()):
+        lines.append("# TYPE %s counter" % name)
+        for labels, value in sorted(values.items()):
+            lines.append(series(name, labels, value))
+
+    for name, values in sorted(metrics["histograms"].items()):
+        lines.append("# TYPE %s histogram" % name)
+        for labels, histogram in sorted(values.items()):
+            cumulative = 0
+            bounds = histogram["buckets"] + ["+Inf"]
+            for bound, count in zip(bounds, histogram["counts"]):
+                cumulative += count
+                lines.append(series(
+                    name + "_bucket", labels, cumulative, 'le="%s"' % bound
+                ))
+            lines.append(series(name + "_sum", labels, histogram["sum"]))
+            lines.append(series(name + "_count", labels, histogram["count"]))
+
+    names = []
+    for name, labels, value in gauges:
+        if name not in names:
+            names.append(name)
+            lines.append("# TYPE %s gauge" % name)
+        lines.append(series(name, _label_string(labels), value))
+
+    return "\n".join(lines) + "\n"
@@ -52,8 +52,10 @@ urlpatterns = patterns('',
     url(r'^admin/', include(admin.site.urls)),
 
     (r'^ingest[/]?$', 'ngeo_browse_server.control.views.ingest'),
+    (r'^ingest/(\d+)[/]?$', 'ngeo_browse_server.control.views.ingest_job'),
     (r'^controllerServer[/]?$', 'ngeo_browse_server.control.views.controller_server'),
     (r'^status[/]?$', 'ngeo_browse_server.control.views.status'),
+    (r'^metrics[/]?$', 'ngeo_browse_server.control.views.metrics'),
     (r'^log[/]?$', 'ngeo_browse_server.control.views.log_file_list'),
     (r'^log/(\d{4}-\d{2}-\d{2})/(.*)$', 'ngeo_browse_server.control.views.log'),
     (r'^instanceconfig[/]?$', 'ngeo_browse_server.control.views.instanceconfig'),
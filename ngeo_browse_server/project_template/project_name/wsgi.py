@@ -57,6 +57,18 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "{{ project_name }}.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Initialize EOxServer and GDAL and preload the views and browse layers when
+# the process starts instead of with its first request. The time it took is
+# logged.
+import logging
+from ngeo_browse_server.initialization import warm_up
+try:
+    warm_up()
+except Exception, e:
+    logging.getLogger("ngeo_browse_server").warning(
+        "Could not warm up the process: %s" % e
+    )
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)
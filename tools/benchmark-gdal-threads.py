@@ -0,0 +1,135 @@
+#!/usr/bin/python
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+""" Benchmarks the GDAL multithreading settings of the ingestion
+(control.ingest num_threads and gdal_cachemax) on a browse image. Warping,
+building overviews, and compressing are timed separately for each number of
+threads and the speed-up relative to a single thread is printed.
+"""
+
+import sys
+import argparse
+from time import time
+
+from osgeo import gdal
+
+gdal.UseExceptions()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(add_help=True,
+                                     description="Script to benchmark the \
+                                                  GDAL multithreading \
+                                                  settings on a browse \
+                                                  image.")
+    parser.add_argument("--threads", dest="threads", default="1,2,4,ALL_CPUS",
+                        help="Comma separated list of the numbers of threads \
+                              to benchmark. Default is '1,2,4,ALL_CPUS'.")
+    parser.add_argument("--cachemax", dest="cachemax", type=int, default=None,
+                        help="Size of the GDAL block cache in megabytes. \
+                              Default is the GDAL default.")
+    parser.add_argument("--compression", dest="compression",
+                        default="DEFLATE",
+                        help="Compression of the written GeoTIFF. Default is \
+                              'DEFLATE'.")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=3,
+                        help="Number of runs per setting, the fastest is \
+                              reported. Default is 3.")
+    parser.add_argument("input_filename", metavar="infile", nargs=1,
+                        help="Georeferenced browse image or browse image \
+                              with GCPs.")
+
+    args = parser.parse_args(args)
+
+    if args.cachemax:
+        gdal.SetCacheMax(args.cachemax * 1024 * 1024)
+
+    src_ds = gdal.Open(args.input_filename[0])
+    if not src_ds.GetProjection() and not src_ds.GetGCPCount():
+        exit("Input file is not georeferenced.")
+
+    benchmarks = (
+        ("warp", benchmark_warp),
+        ("overviews", benchmark_overviews),
+        ("compression", benchmark_compression),
+    )
+
+    print "%-12s %-10s %10s %8s" % ("stage", "threads", "seconds", "speed-up")
+    for name, benchmark in benchmarks:
+        baseline = None
+        for num_threads in args.threads.split(","):
+            seconds = min(
+                run(benchmark, src_ds, num_threads, args.compression)
+                for _ in range(max(1, args.repeat))
+            )
+            if baseline is None:
+                baseline = seconds
+            print "%-12s %-10s %10.3f %7.2fx" % (
+                name, num_threads, seconds, baseline / seconds
+            )
+
+
+def run(benchmark, src_ds, num_threads, compression):
+    """ Runs the benchmark with GDAL_NUM_THREADS set and returns the elapsed
+    wall clock time in seconds.
+    """
+
+    gdal.SetConfigOption("GDAL_NUM_THREADS", num_threads)
+    try:
+        start = time()
+        benchmark(src_ds, num_threads, compression)
+        return time() - start
+    finally:
+        gdal.SetConfigOption("GDAL_NUM_THREADS", None)
+
+
+def benchmark_warp(src_ds, num_threads, compression):
+    gdal.Warp(
+        "", src_ds, format="MEM", dstSRS="EPSG:4326",
+        multithread=True, warpOptions=["NUM_THREADS=%s" % num_threads]
+    )
+
+
+def benchmark_overviews(src_ds, num_threads, compression):
+    ds = gdal.GetDriverByName("MEM").CreateCopy("", src_ds)
+    ds.BuildOverviews("AVERAGE", [2, 4, 8, 16])
+
+
+def benchmark_compression(src_ds, num_threads, compression):
+    filename = "/vsimem/benchmark.tif"
+    gdal.GetDriverByName("GTiff").CreateCopy(filename, src_ds, options=[
+        "TILED=YES", "COMPRESS=%s" % compression,
+        "NUM_THREADS=%s" % num_threads
+    ])
+    gdal.Unlink(filename)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
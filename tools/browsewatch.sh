@@ -1,15 +1,23 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-
-REDIS_HOST=${HOST:-localhost}
-REDIS_PORT=${PORT:-6379}
+# Ingests the browse reports pushed to the Redis list "ingest_queue" using a
+# long running ngeo_ingest_worker. The Redis connection and the number of
+# worker processes are configured via the "redis_host", "redis_port",
+# "redis_queue", and "worker_processes" options in the "control.ingest"
+# section of the ngeo.conf. The HOST and PORT environment variables override
+# the Redis host and port.
 
 INSTANCE_DIR=${INSTANCE_DIR:-/var/www/ngeo/ngeo_browse_server_instance/}
 
-while :
-do
-    browse_report=$(redis-cli -h ${REDIS_HOST} -p ${REDIS_PORT} --raw brpop ingest_queue 0 | tail -n +2)
-    echo "Ingesting browse"
-    python ${INSTANCE_DIR}/manage.py ngeo_ingest -v0 <(echo ${browse_report})
-done
+REDIS_OPTIONS=()
+if [ -n "${HOST:-}" ]; then
+    REDIS_OPTIONS+=(--redis-host="${HOST}")
+fi
+if [ -n "${PORT:-}" ]; then
+    REDIS_OPTIONS+=(--redis-port="${PORT}")
+fi
+
+# the worker stops its processes on SIGTERM
+exec python ${INSTANCE_DIR}/manage.py ngeo_ingest_worker --backend=redis -v1 \
+    ${REDIS_OPTIONS[@]+"${REDIS_OPTIONS[@]}"}